@@ -0,0 +1,269 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+from atomicFile import writeJson
+from instrumentation import timed
+
+DAY_SECONDS = 86400
+WINDOW_DAYS = 27
+SLOT_MINUTES = 120
+# interquartile range of a normal distribution in standard deviations
+IQR_SIGMA = 1.349
+KP_SLOT_SECONDS = 3 * 3600
+EVENT_DTYPE = np.dtype([("epoch", "<i8"), ("lat", "<i2"), ("lon", "<i2"), ("score", "<f4"), ("deviation", "<f4")])
+
+
+def dayStartOf(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp())
+
+
+def sortedPercentile(ordered, valid, q):
+    # np.percentile's linear interpolation over the first valid values of each sorted row
+    last = np.maximum(valid - 1, 0)
+    position = last * q
+    low = np.floor(position).astype(np.int64)
+    high = np.minimum(low + 1, last)
+    fraction = (position - low).astype(np.float32)
+    lowValues = np.take_along_axis(ordered, low[..., None], axis=-1)[..., 0]
+    highValues = np.take_along_axis(ordered, high[..., None], axis=-1)[..., 0]
+    return lowValues + fraction * (highValues - lowValues)
+
+
+def robustBaseline(stack, minDays):
+    # (days, slots, lat, lon) -> median and IQR per slot and cell, NaN where fewer than minDays have a value
+    # one sort along a contiguous days axis, far cheaper than percentile and nanpercentile, NaN sorts last
+    ordered = np.sort(np.moveaxis(np.asarray(stack, dtype=np.float32), 0, -1), axis=-1)
+    valid = np.count_nonzero(~np.isnan(ordered), axis=-1)
+    q1, median, q3 = (sortedPercentile(ordered, valid, q) for q in (0.25, 0.5, 0.75))
+    median[valid < minDays] = np.nan
+    return median, q3 - q1
+
+
+class AnomalyDetector:
+    def __init__(
+        self,
+        storeDir,
+        product,
+        window=WINDOW_DAYS,
+        slotMinutes=SLOT_MINUTES,
+        threshold=3.0,
+        minDeviation=5.0,
+        minDays=7,
+    ):
+        self.storeDir = storeDir
+        self.product = product
+        self.window = window
+        self.slotMinutes = slotMinutes
+        self.slots = 24 * 60 // slotMinutes
+        self.threshold = threshold
+        self.minDeviation = minDeviation
+        self.minDays = minDays
+        self.lock = threading.Lock()
+        self.ringPath = os.path.join(storeDir, f"{product}.baseline")
+        self.eventsPath = os.path.join(storeDir, f"{product}.events")
+        self.metaPath = os.path.join(storeDir, f"{product}.anomaly.json")
+
+        os.makedirs(self.storeDir, exist_ok=True)
+        self.meta = self.loadMeta()
+        if self.meta["lats"] is not None and not os.path.exists(self.ringPath):
+            self.meta = self.emptyMeta()
+        self.truncateToCount()
+        self.ring, self.eventsView = None, None
+
+    def emptyMeta(self):
+        # days[k] is the day start stored in ring row k, day d always lands in row (d // 86400) % window
+        return {
+            "window": self.window,
+            "slotMinutes": self.slotMinutes,
+            "days": [None] * self.window,
+            "evaluated": [],
+            "count": 0,
+            "lats": None,
+            "lons": None,
+        }
+
+    def loadMeta(self):
+        try:
+            with open(self.metaPath, "r") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return self.emptyMeta()
+        if meta["window"] != self.window or meta["slotMinutes"] != self.slotMinutes:
+            # a different baseline shape, start over instead of mixing the two
+            for path in (self.ringPath, self.eventsPath):
+                if os.path.exists(path):
+                    os.remove(path)
+            return self.emptyMeta()
+        return meta
+
+    def saveMeta(self):
+        writeJson(self.metaPath, self.meta)
+
+    def truncateToCount(self):
+        # same commit point as the TEC archive, events past the count were never committed
+        size = self.meta["count"] * EVENT_DTYPE.itemsize
+        if os.path.exists(self.eventsPath) and os.path.getsize(self.eventsPath) > size:
+            with open(self.eventsPath, "r+b") as f:
+                f.truncate(size)
+
+    @property
+    def lats(self):
+        return np.array(self.meta["lats"], dtype=np.float32)
+
+    @property
+    def lons(self):
+        return np.array(self.meta["lons"], dtype=np.float32)
+
+    def ringRows(self):
+        if self.ring is None:
+            shape = (self.window, self.slots, len(self.meta["lats"]), len(self.meta["lons"]))
+            mode = "r+" if os.path.exists(self.ringPath) else "w+"
+            self.ring = np.memmap(self.ringPath, dtype=np.float32, mode=mode, shape=shape)
+        return self.ring
+
+    def rowOf(self, dayStart):
+        return dayStart // DAY_SECONDS % self.window
+
+    def slotMaps(self, dayStart, epochs, maps):
+        # the maps at the slot epochs of one day, NaN for slots the day does not have
+        slotEpochs = dayStart + np.arange(self.slots) * self.slotMinutes * 60
+        result = np.full((self.slots,) + maps.shape[1:], np.nan, dtype=np.float32)
+        if len(epochs):
+            index = np.minimum(np.searchsorted(epochs, slotEpochs), len(epochs) - 1)
+            found = epochs[index] == slotEpochs
+            result[found] = maps[index[found]]
+        return result
+
+    def baseline(self, dayStart):
+        # ring rows holding one of the window days before dayStart, never the day itself
+        days = self.meta["days"]
+        rows = [
+            k
+            for k, day in enumerate(days)
+            if day is not None and dayStart - self.window * DAY_SECONDS <= day < dayStart
+        ]
+        if len(rows) < self.minDays:
+            return None
+        return robustBaseline(np.asarray(self.ringRows()[sorted(rows)]), self.minDays)
+
+    @timed("compute.anomaly")
+    def update(self, dayStart, epochs, maps, lats, lons):
+        # scores one day against the window before it, then keeps it for the days after, number of flags or None
+        dayStart = int(dayStart)
+        maps = np.asarray(maps, dtype=np.float32)
+        with self.lock:
+            if self.meta["lats"] is None:
+                self.meta["lats"] = [float(v) for v in lats]
+                self.meta["lons"] = [float(v) for v in lons]
+            elif len(lats) != len(self.meta["lats"]) or len(lons) != len(self.meta["lons"]):
+                grid = (len(self.meta["lats"]), len(self.meta["lons"]))
+                raise ValueError(f"{self.product} baseline grid is {grid}, got {(len(lats), len(lons))}")
+
+            today = self.slotMaps(dayStart, np.asarray(epochs, dtype=np.int64), maps)
+            flagged = None
+            if dayStart not in self.meta["evaluated"]:
+                baseline = self.baseline(dayStart)
+                if baseline is not None:
+                    flagged = self.score(dayStart, today, *baseline)
+                    self.meta["evaluated"].append(dayStart)
+
+            # a row is only overwritten by a later day, late arrivals never push newer days out
+            row, stored = self.rowOf(dayStart), self.meta["days"][self.rowOf(dayStart)]
+            if stored is None or stored < dayStart:
+                ring = self.ringRows()
+                ring[row] = today
+                ring.flush()
+                self.meta["days"][row] = dayStart
+            self.saveMeta()
+            return flagged
+
+    def score(self, dayStart, today, median, iqr):
+        # robust z score against the window, and a minimum size so quiet cells with a tiny IQR stay quiet
+        deviation = today - median
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = deviation / (iqr / IQR_SIGMA)
+            flags = (np.abs(score) > self.threshold) & (np.abs(deviation) > self.minDeviation)
+        slot, i, j = np.nonzero(flags)
+        events = np.empty(len(slot), dtype=EVENT_DTYPE)
+        events["epoch"] = dayStart + slot * self.slotMinutes * 60
+        events["lat"], events["lon"] = i, j
+        events["score"] = np.clip(score[flags], -1e4, 1e4)
+        events["deviation"] = deviation[flags]
+        with open(self.eventsPath, "ab") as f:
+            f.write(events.tobytes())
+        self.meta["count"] += len(events)
+        self.eventsView = None
+        return len(events)
+
+    def seen(self, dayStart):
+        # in the ring, or already pushed out of it by a later day
+        stored = self.meta["days"][self.rowOf(dayStart)]
+        return stored is not None and stored >= dayStart
+
+    def catchUp(self, archive, firstDay, lastDay):
+        # feeds every archived day up to lastDay that has not been seen, starting a window before firstDay
+        firstStart, lastStart = dayStartOf(firstDay), dayStartOf(lastDay)
+        dayStarts = np.arange(firstStart - self.window * DAY_SECONDS, lastStart + 1, DAY_SECONDS)
+        evaluated = set(self.meta["evaluated"])
+        todo = [
+            int(day) for day in dayStarts if not (self.seen(int(day)) and (day < firstStart or int(day) in evaluated))
+        ]
+        if not todo or not len(archive):
+            return 0
+        flagged = 0
+        for dayStart, covered in zip(todo, archive.coveredDays(todo)):
+            if not covered:
+                continue
+            epochs, maps = archive.slice(dayStart, dayStart + DAY_SECONDS - 1)
+            flagged += self.update(dayStart, epochs, maps, archive.lats, archive.lons) or 0
+        return flagged
+
+    def events(self, start=-np.inf, end=np.inf):
+        with self.lock:
+            if self.eventsView is None:
+                count = self.meta["count"]
+                if count:
+                    self.eventsView = np.memmap(self.eventsPath, dtype=EVENT_DTYPE, mode="r", shape=(count,))
+                else:
+                    self.eventsView = np.empty(0, dtype=EVENT_DTYPE)
+            events = self.eventsView[(self.eventsView["epoch"] >= start) & (self.eventsView["epoch"] <= end)]
+            return np.sort(np.asarray(events), order="epoch")
+
+
+def kpAt(epochs, startDate, kpValues):
+    # Kp of the three hour slot each epoch falls in, kpValues is a row of 8 per day from startDate
+    values = np.asarray(kpValues, dtype=np.float32).ravel()
+    index = (np.asarray(epochs, dtype=np.int64) - dayStartOf(startDate)) // KP_SLOT_SECONDS
+    inside = (index >= 0) & (index < len(values))
+    kp = np.full(len(index), np.nan, dtype=np.float32)
+    kp[inside] = values[index[inside]]
+    return kp
+
+
+def eventSummary(events, startDate, kpValues, stormKp=5):
+    # one row per flagged epoch with its Kp, and how flagged cells per Kp slot follow Kp
+    epochs, first, cells = np.unique(events["epoch"], return_index=True, return_counts=True)
+    scores = np.abs(events["score"])
+    summary = {
+        "epochs": epochs,
+        "cells": cells,
+        "maxScore": np.maximum.reduceat(scores, first) if len(first) else np.empty(0, dtype=np.float32),
+        "enhanced": np.add.reduceat(events["deviation"] > 0, first) if len(first) else np.empty(0, dtype=np.int64),
+        "kp": kpAt(epochs, startDate, kpValues),
+    }
+    values = np.asarray(kpValues, dtype=np.float32).ravel()
+    slotCells = np.zeros(len(values))
+    slots = (epochs - dayStartOf(startDate)) // KP_SLOT_SECONDS
+    inside = (slots >= 0) & (slots < len(values))
+    np.add.at(slotCells, slots[inside], cells[inside])
+    known = ~np.isnan(values)
+    correlation = np.nan
+    if known.sum() > 2 and np.ptp(values[known]) > 0 and np.ptp(slotCells[known]) > 0:
+        correlation = float(np.corrcoef(values[known], slotCells[known])[0, 1])
+    summary["kpCorrelation"] = correlation
+    summary["stormEpochs"] = int(np.count_nonzero(summary["kp"] >= stormKp))
+    return summary
@@ -0,0 +1,21 @@
+import json
+import os
+import tempfile
+
+
+def writeAtomic(path, content, mode="w"):
+    # through a unique temp file next to path, so threads and processes saving the same file never share one
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmpPath = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(content)
+        os.replace(tmpPath, path)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+def writeJson(path, value, **kwargs):
+    writeAtomic(path, json.dumps(value, **kwargs))
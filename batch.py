@@ -0,0 +1,108 @@
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+import numpy as np
+
+from downloads import DownloadError
+from kpIndex import KpService
+from navFetcher import NavFetcher, readStationNames
+from network import NetworkError
+from products import ProductSource
+from sampling import stackFrames
+
+PRODUCTS = ["IGS", "UPC", "ESA"]
+
+
+def processDay(day, products, outDir, downloadDir, stepMinutes, kpValues):
+    year, doy, selectedDate = day.year, f"{day.timetuple().tm_yday:03d}", day.isoformat()
+    navFetcher = NavFetcher(readStationNames(), statsPath=os.path.join(downloadDir, "stationStats.json"))
+    source = ProductSource(downloadDir, navFetcher=navFetcher)
+
+    arrays = {"minutes": np.arange(0, 24 * 60, stepMinutes, dtype=np.int16)}
+    if kpValues is not None:
+        arrays["kp"] = np.asarray(kpValues, dtype=np.float32)
+    errors = []
+
+    try:
+        arrays["klobuchar"] = stackFrames(source.klobucharCube(selectedDate, stepMinutes=stepMinutes))
+    except DownloadError as e:
+        errors.append(str(e))
+
+    for product in products:
+        try:
+            arrays[f"{product}_tec"] = stackFrames(source.tecCube(product, selectedDate, stepMinutes=stepMinutes))
+        except DownloadError as e:
+            errors.append(str(e))
+            continue
+        lats, lons = source.grids[product]
+        arrays.setdefault("lats", lats)
+        arrays.setdefault("lons", lons)
+        if "klobuchar" not in arrays:
+            continue
+        try:
+            delta, stats = source.deltaCube(product, selectedDate, stepMinutes=stepMinutes)
+        except ValueError as e:
+            errors.append(str(e))
+            continue
+        arrays[f"{product}_delta"] = stackFrames(delta)
+        for name, values in stats.items():
+            arrays[f"{product}_{name}"] = values
+
+    path = os.path.join(outDir, f"{year}{doy}.npz")
+    np.savez_compressed(path, **arrays)
+    return path, errors
+
+
+def dateRange(startDate, endDate):
+    return [startDate + timedelta(days=i) for i in range((endDate - startDate).days + 1)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Process TEC, Klobuchar and Kp data for a range of days")
+    parser.add_argument("start", type=date.fromisoformat, help="first day, YYYY-MM-DD")
+    parser.add_argument("end", type=date.fromisoformat, help="last day, YYYY-MM-DD")
+    parser.add_argument("--products", nargs="+", choices=PRODUCTS, default=["IGS"])
+    parser.add_argument("--out", default="batch_output")
+    parser.add_argument("--downloads", default=os.path.join(os.getcwd(), "downloads"))
+    parser.add_argument("--step", type=int, default=15, help="frame cadence in minutes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--no-kp", action="store_true", help="skip the Kp index download")
+    args = parser.parse_args(argv)
+
+    days = dateRange(args.start, args.end)
+    os.makedirs(args.out, exist_ok=True)
+    os.makedirs(args.downloads, exist_ok=True)
+
+    kpByDay = {}
+    if not args.no_kp:
+        try:
+            kpService = KpService(os.path.join(args.downloads, "kpStore.json"))
+            kpByDay = dict(zip(days, kpService.kpValues(args.start, args.end)))
+        except (NetworkError, OSError) as e:
+            print(f"Kp download failed: {e}", file=sys.stderr)
+
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(processDay, day, args.products, args.out, args.downloads, args.step, kpByDay.get(day)): day
+            for day in days
+        }
+        for future in as_completed(futures):
+            day = futures[future]
+            try:
+                path, errors = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"{day}: failed: {e}", file=sys.stderr)
+                continue
+            for error in errors:
+                print(f"{day}: {error}", file=sys.stderr)
+            print(f"{day}: {path}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1340 @@
+import argparse
+import copy
+import gzip
+import json
+import math
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+
+import cartopy
+import cartopy.feature as cfeature
+import cartopy.io.shapereader  # registers the Natural Earth downloader
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from cartopy.io import Downloader
+from matplotlib.figure import Figure
+import numpy as np
+import requests
+
+import instrumentation
+from anomaly import AnomalyDetector, eventSummary
+from atomicFile import writeJson
+from downloads import DownloadError, downloadAndExtract
+from export import exportFrames, initWorker, renderFrames
+from fixtures import (
+    NAV_ALPHA,
+    NAV_BETA,
+    forecastText,
+    serveArchive,
+    serveDirectory,
+    serveKp,
+    serveTiles,
+    writeSyntheticIonex,
+    writeSyntheticNav,
+)
+from frames import InterpolatedFrames, fillCube
+from ionex import readIonex
+from klobuchar import KlobucharModel
+from kpChart import KpChart
+from mapView import BlitMesh, CompareView, MapView, drawMap
+from kpIndex import KpService
+from navFetcher import NavFetcher, parseKlobucharLines
+from network import NetworkClient
+from pipeline import TaskPipeline
+from productCache import INDEX_FILE, ProductCache
+from products import L1_METRES_PER_TECU, ProductSource, cubeMinutes, dayOfYear, ionexFileName, pairDifferences
+from sampling import GridSampler
+from slantDelay import SlantDelay
+from tecArchive import TecArchive
+from tileCache import TileStore
+
+# timings this short vary run to run by more than any threshold
+NOISE_FLOOR = 1e-3
+# name -> {"value", "unit"} for every number a benchmark measured, see --json and --compare
+results = {}
+
+
+class BenchmarkSkipped(Exception):
+    pass
+
+
+def requireNaturalEarth(*extents):
+    # cartopy downloads the borders and coastline on the first draw, offline that only works from its cache
+    missing = set()
+    for feature in (cfeature.BORDERS, cfeature.COASTLINE):
+        if not isinstance(feature, cfeature.NaturalEarthFeature):
+            continue
+        for extent in extents:
+            scale = copy.copy(feature.scaler).scale_from_extent(extent)
+            downloader = Downloader.from_config(("shapefiles", "natural_earth", scale, feature.category, feature.name))
+            where = {"config": cartopy.config, "category": feature.category, "name": feature.name, "resolution": scale}
+            if not any(
+                os.path.exists(path) for path in (downloader.pre_downloaded_path(where), downloader.target_path(where))
+            ):
+                missing.add(f"{scale} {feature.name}")
+    if missing:
+        raise BenchmarkSkipped(f"Natural Earth {', '.join(sorted(missing))} not in the cartopy cache")
+
+
+def record(name, value, unit="s"):
+    results[name.replace(" ", "_")] = {"value": float(value), "unit": unit}
+
+
+def legacyGetTecData(fileNamePath):
+    mapsData = []
+    currentRow, currentMap = [], []
+
+    with open(fileNamePath, "r") as file:
+        inBlock = False
+        for line in file:
+            if "START OF TEC MAP" in line:
+                if currentMap:
+                    mapsData.append(np.array(currentMap))
+                currentMap = []
+            elif "END OF TEC MAP" in line:
+                if currentRow:
+                    currentMap.append(currentRow)
+                currentRow = []
+            elif "LAT/LON1/LON2/DLON/H" in line:
+                if currentRow:
+                    currentMap.append(currentRow)
+                currentRow = []
+                inBlock = True
+            elif inBlock:
+                try:
+                    nums = [int(num) for num in line.split()]
+                    currentRow.extend(nums)
+                except ValueError:
+                    continue
+        if currentMap:
+            mapsData.append(np.array(currentMap))
+            mapsData[12] = mapsData[12][:71, :73]
+    return mapsData
+
+
+def legacyCreateWorldPoints():
+    lat = np.linspace(87.5, -87.5, 71) / 180
+    lon = np.linspace(-180, 180, 73) / 180
+    return np.meshgrid(lon, lat)
+
+
+def legacyCalcKlobuchar(seconds, alpha, beta, semicircleF=False, semicirclePole=False):
+    # the original per-epoch code, the flags patch in the two ICD-GPS-200 fixes klobucharTerms has
+    lonPoints, latPoints = legacyCreateWorldPoints()
+    elevation = np.radians(90)
+    azimuth = np.radians(0)
+    earthCentredAngle = (0.0137 / (elevation / np.pi + 0.11)) - 0.022
+    latIPP = latPoints + earthCentredAngle * np.cos(azimuth)
+    latIPP = np.clip(latIPP, -0.416, 0.416)
+    lonIPP = lonPoints + (earthCentredAngle * np.sin(azimuth) / np.cos(np.radians(latIPP)))
+    if semicirclePole:
+        geomagneticLatIPP = latIPP + (0.064 * np.cos((lonIPP - 1.617) * np.pi))
+    else:
+        geomagneticLatIPP = latIPP + (0.064 * np.cos(lonIPP * np.pi - 1.617))
+    localTimes = (43200 * lonIPP + seconds) % 86400
+    A = sum(alpha[i] * geomagneticLatIPP**i for i in range(4))
+    A = np.maximum(A, 0)
+    P = sum(beta[i] * geomagneticLatIPP**i for i in range(4))
+    P = np.maximum(P, 72000)
+    Xi = (2 * np.pi * (localTimes - 50400)) / P
+    if semicircleF:
+        F = 1.0 + 16.0 * (0.53 - elevation / np.pi) ** 3
+    else:
+        F = 1.0 + 16.0 * (0.53 - (np.radians(elevation))) ** 3
+    ionoDelay = np.where(np.abs(Xi) <= 1.57, (5e-9 + A * (1 - (Xi**2 / 2) + (Xi**4 / 24))) * F, 5e-9 * F)
+    return ionoDelay * 299792458
+
+
+def timeIt(function, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmarkIonexParser(workDir):
+    path = os.path.join(workDir, "SYNTH0OPSRAP_20240010000_01D_02H_GIM.INX")
+    expected = writeSyntheticIonex(path)
+
+    parsed = readIonex(path)
+    assert np.array_equal(parsed.tec, expected)
+    assert all(np.array_equal(a, b) for a, b in zip(legacyGetTecData(path), expected))
+
+    legacy = timeIt(legacyGetTecData, path)
+    tecOnly = timeIt(lambda: readIonex(path, readRms=False))
+    withRms = timeIt(readIonex, path)
+    record("ionexParser.legacy", legacy)
+    record("ionexParser.vectorized", tecOnly)
+    record("ionexParser.withRms", withRms)
+    print(f"ionex parser: legacy {legacy * 1000:.1f} ms, vectorized {tecOnly * 1000:.1f} ms (x{legacy / tecOnly:.1f})")
+    print(f"ionex parser: vectorized with rms maps {withRms * 1000:.1f} ms")
+
+
+def legacyInterpolate(mapsData):
+    allMaps = []
+    for i in range(len(mapsData) - 1):
+        allMaps.append(mapsData[i])
+        for j in range(1, 8):
+            alpha = j / 8
+            interpolatedMap = (1 - alpha) * mapsData[i] + alpha * mapsData[i + 1]
+            allMaps.append(interpolatedMap)
+    return allMaps
+
+
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def benchmarkInterpolation(workDir):
+    maps = list(np.random.default_rng(0).integers(0, 999, size=(13, 71, 73)))
+    klobucharMap = np.ones((71, 73))
+
+    def legacy():
+        tecMaps = legacyInterpolate(maps)
+        klobucharMaps = [klobucharMap * seconds for seconds in range(len(tecMaps))]
+        deltaMaps = np.array(tecMaps) - np.array(klobucharMaps)
+        return tecMaps[0], klobucharMaps[0], deltaMaps[0]
+
+    def cubes(stepMinutes):
+        # TEC, Klobuchar and delta float32 TECU cubes for one day at this cadence
+        tec = fillCube(InterpolatedFrames(maps, stepMinutes=stepMinutes))
+        klobuchar = klobucharMap.astype(np.float32) * np.arange(len(tec), dtype=np.float32)[:, None, None]
+        return tec, klobuchar, np.subtract(tec, klobuchar, dtype=np.float32)
+
+    def animate(stepMinutes):
+        # what ProductSource does below 15 min: 15 min cubes, every finer frame interpolated when it is shown
+        for cube in cubes(15):
+            for frame in InterpolatedFrames(cube, 15, stepMinutes):
+                pass
+
+    for name, function in [
+        ("legacy 15 min", legacy),
+        ("cubes 15 min", lambda: cubes(15)),
+        ("cubes 1 min", lambda: cubes(1)),
+        ("1 min frames from 15 min cubes", lambda: animate(1)),
+    ]:
+        elapsed, peak = measure(function)
+        record(f"interpolation.{name}.build", elapsed)
+        record(f"interpolation.{name}.peakMemory", peak, "bytes")
+        print(f"interpolation {name}: build {elapsed * 1000:.2f} ms, peak memory {peak / 2**20:.2f} MiB")
+
+    # finer cadences share the 15 min cube, only a cadence that does not divide it adds one
+    source = ProductSource(workDir, maxBytes=40 * 2**20)
+    for stepMinutes in (15, 5, 1, 10, 15):
+        source.cached(("tec", cubeMinutes(stepMinutes)), lambda: cubes(cubeMinutes(stepMinutes))[0])
+    cachedBytes = sum(source.sizes.values())
+    assert list(source.cubes) == [("tec", 10), ("tec", 15)] and cachedBytes == (144 + 96) * 71 * 73 * 4
+    print(f"interpolation cube cache: 15, 5, 1 and 10 min in {len(source.cubes)} cubes, {cachedBytes / 2**20:.1f} MiB")
+
+
+def benchmarkNavHeader(workDir):
+    station = "SYNT00XXX"
+    archive = os.path.join(workDir, "archive")
+    os.makedirs(os.path.join(archive, "2024", "001", "24n"))
+    fetcher = NavFetcher([station])
+    server, baseUrl = serveDirectory(archive)
+    fetcher.baseUrl = baseUrl
+    url = fetcher.navUrl(station, 2024, "001")
+    writeSyntheticNav(os.path.join(archive, url[len(baseUrl) + 1 :]))
+
+    def fullDownload():
+        zipPath, savePath = os.path.join(workDir, "nav.gz"), os.path.join(workDir, "nav.rnx")
+        with requests.Session() as session:
+            response = session.get(url, stream=True, timeout=5)
+            with open(zipPath, "wb") as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    f.write(chunk)
+        with gzip.open(zipPath, "rb") as zipFile, open(savePath, "wb") as saveFile:
+            shutil.copyfileobj(zipFile, saveFile)
+        with open(savePath, "r") as f:
+            coefficients = parseKlobucharLines(f)
+        written = os.path.getsize(zipPath) + os.path.getsize(savePath)
+        os.remove(zipPath)
+        os.remove(savePath)
+        return coefficients, written
+
+    def headerOnly():
+        return fetcher.fetch(2024, 1)
+
+    coefficients, written = fullDownload()
+    assert headerOnly()[1:] == coefficients
+    fetcher.bytesRead = 0
+    headerOnly()
+    bytesRead = fetcher.bytesRead
+    full = timeIt(fullDownload)
+    streamed = timeIt(headerOnly)
+    compressedSize = os.path.getsize(os.path.join(archive, url[len(baseUrl) + 1 :]))
+    record("navHeader.fullDownload", full)
+    record("navHeader.streamed", streamed)
+    record("navHeader.bytesRead", bytesRead, "bytes")
+    print(f"nav header: full download {full * 1000:.1f} ms, {compressedSize} bytes read, {written} bytes written")
+    print(f"nav header: streamed {streamed * 1000:.1f} ms, {bytesRead} bytes read, 0 bytes written")
+    server.shutdown()
+
+
+def benchmarkNavStations(workDir, stations=30, serving=17, latency=0.05):
+    # only one station has the day, the race has to find it, cancel the rest and rank it first next time
+    names = [f"ST{index:02d}00XXX" for index in range(1, stations + 1)]
+    archive = os.path.join(workDir, "navStations")
+    os.makedirs(os.path.join(archive, "2024", "001", "24n"))
+    server, baseUrl = serveDirectory(archive, delay=latency)
+    fetcher = NavFetcher(names, statsPath=os.path.join(workDir, "navStationStats.json"), baseUrl=baseUrl)
+    station = names[serving - 1]
+    writeSyntheticNav(os.path.join(archive, fetcher.navUrl(station, 2024, "001")[len(baseUrl) + 1 :]), records=10)
+
+    started = time.perf_counter()
+    result = fetcher.fetch(2024, 1)
+    firstTime = time.perf_counter() - started
+    assert result is not None and result[0] == station
+    assert np.allclose(result[1], NAV_ALPHA) and np.allclose(result[2], NAV_BETA)
+    # the race stops once #serving answers, stations past its window are never asked
+    assert not any(name in fetcher.stationStats for name in names[serving - 1 + fetcher.maxWorkers :])
+    assert fetcher.orderedStations()[0] == station and fetcher.fetch(2024, 1)[0] == station
+    rankedTime = timeIt(fetcher.fetch, 2024, 1, repeat=1)
+    tries = sum(stats["tries"] for stats in fetcher.stationStats.values())
+
+    missingTime = timeIt(fetcher.fetch, 2024, 2, repeat=1)
+    assert fetcher.fetch(2024, 2) is None and fetcher.orderedStations()[0] == station
+    assert NavFetcher(names, statsPath=fetcher.statsPath).orderedStations()[0] == station
+    server.shutdown()
+    record("navStations.firstFetch", firstTime)
+    record("navStations.rankedFetch", rankedTime)
+    record("navStations.allMissing", missingTime)
+    print(f"nav stations: {stations} stations, only #{serving} has the day, {latency * 1000:.0f} ms per request")
+    print(f"nav stations: first fetch {firstTime * 1000:.0f} ms, ranked first afterwards {rankedTime * 1000:.0f} ms")
+    print(f"nav stations: {tries} attempts over three fetches, a day nobody has {missingTime * 1000:.0f} ms")
+
+
+def legacyDownloadAndExtract(url, downloadDir, saveFileName, timeout=5):
+    zipPath = os.path.join(downloadDir, saveFileName + ".gz")
+    savePath = os.path.join(downloadDir, saveFileName)
+    with requests.Session() as session:
+        response = session.get(url, stream=True, timeout=timeout)
+        with open(zipPath, "wb") as f:
+            for chunk in response.iter_content(chunk_size=8192):
+                f.write(chunk)
+    with gzip.open(zipPath, "rb") as zipFile, open(savePath, "wb") as saveFile:
+        shutil.copyfileobj(zipFile, saveFile)
+    os.remove(zipPath)
+    return savePath
+
+
+def benchmarkNetwork(workDir, files=10, handshake=0.05):
+    served = os.path.join(workDir, "network")
+    os.makedirs(os.path.join(served, "2024", "001"))
+    names = []
+    for index in range(files):
+        rawPath = os.path.join(workDir, f"FILE{index:02d}.24I")
+        writeSyntheticIonex(rawPath)
+        with open(rawPath, "rb") as raw, gzip.open(
+            os.path.join(served, "2024", "001", f"FILE{index:02d}.24I.gz"), "wb"
+        ) as f:
+            shutil.copyfileobj(raw, f)
+        os.remove(rawPath)
+        names.append(f"FILE{index:02d}.24I")
+
+    def downloadAll(download, **kwargs):
+        downloadDir = tempfile.mkdtemp(dir=workDir)
+        for name in names:
+            download(f"{baseUrl}/2024/001/{name}.gz", downloadDir, name, **kwargs)
+        shutil.rmtree(downloadDir)
+
+    server, baseUrl, stats = serveArchive(served, handshake=handshake)
+    legacyTime = timeIt(downloadAll, legacyDownloadAndExtract, repeat=1)
+    legacyConnections, stats["connections"] = stats["connections"], 0
+    client = NetworkClient()
+    pooledTime = timeIt(lambda: downloadAll(downloadAndExtract, client=client), repeat=1)
+    record("network.sessionPerFile", legacyTime)
+    record("network.sharedClient", pooledTime)
+    record("network.connections", stats["connections"], "count")
+    print(f"network: {files} files, {handshake * 1000:.0f} ms per connection setup")
+    print(f"network: session per file {legacyTime * 1000:.0f} ms, {legacyConnections} connections")
+    print(f"network: shared client {pooledTime * 1000:.0f} ms, {stats['connections']} connections")
+
+    with open(os.path.join(served, "forecast.txt"), "w") as f:
+        f.write(forecastText())
+    lines, validators = client.lines(f"{baseUrl}/forecast.txt")
+    assert client.lines(f"{baseUrl}/forecast.txt", validators) == (None, validators)
+    client.close()
+    server.shutdown()
+
+    server, baseUrl, stats = serveArchive(served, dropFirst=True)
+    client = NetworkClient()
+    downloadDir = tempfile.mkdtemp(dir=workDir)
+    url = f"{baseUrl}/2024/001/{names[0]}.gz"
+    try:
+        downloadAndExtract(url, downloadDir, names[0], client=client)
+    except DownloadError:
+        pass
+    savePath = downloadAndExtract(url, downloadDir, names[0], client=client)
+    readIonex(savePath)
+    compressedSize = os.path.getsize(os.path.join(served, "2024", "001", names[0] + ".gz"))
+    record("network.resumeBytes", stats["bytes"], "bytes")
+    print(
+        f"network: interrupted {compressedSize} byte transfer resumed, {stats['bytes']} bytes sent over both requests"
+    )
+    client.close()
+    server.shutdown()
+
+
+def benchmarkTileCache(workDir, maxZoom=4, latency=0.02):
+    server, tileServer, requested = serveTiles(latency)
+    dbPath = os.path.join(workDir, "tiles.db")
+    store = TileStore(dbPath, tileServer)
+    view = [(3, x, y) for x in range(2, 6) for y in range(2, 5)]
+
+    def panView(tileStore):
+        for key in view:
+            assert tileStore.get(*key) is not None
+
+    coldTime = timeIt(panView, store, repeat=1)
+    memoryTime = timeIt(panView, store)
+    diskTime = timeIt(lambda: panView(TileStore(dbPath, tileServer)))
+    record("tileCache.cold", coldTime)
+    record("tileCache.memory", memoryTime)
+    record("tileCache.disk", diskTime)
+    print(f"tile cache, {len(view)} tile view, {latency * 1000:.0f} ms per tile request: cold {coldTime * 1000:.0f} ms")
+    print(f"tile cache: memory {memoryTime * 1000:.2f} ms, new session from disk {diskTime * 1000:.2f} ms")
+
+    requested.clear()
+    prefetchTime = timeIt(store.prefetch, 0, maxZoom, repeat=1)
+    record("tileCache.prefetch", prefetchTime)
+    print(f"tile prefetch zoom 0-{maxZoom}: {len(requested)} tiles fetched in {prefetchTime * 1000:.0f} ms")
+    requested.clear()
+    assert store.prefetch(0, maxZoom) == (0, 0) and not requested
+    server.shutdown()
+
+
+def benchmarkProductCache(workDir, lookups=200):
+    cacheDir = os.path.join(workDir, "productCache")
+    arrays = {"tec": np.random.default_rng(0).uniform(0, 60, size=(13, 71, 73)).astype(np.float32)}
+    cache = ProductCache(cacheDir)
+    cache.put("SYNTH", 2024, 1, arrays)
+    indexPath = os.path.join(cacheDir, INDEX_FILE)
+    written = os.stat(indexPath).st_mtime_ns
+    loaded = cache.get("SYNTH", 2024, 1)
+    assert np.array_equal(loaded["tec"], arrays["tec"]) and cache.contains("SYNTH", 2024, 1)
+    assert cache.get("SYNTH", 2024, 2) is None
+
+    def hits():
+        for _ in range(lookups):
+            cache.get("SYNTH", 2024, 1)
+
+    def legacyHits():
+        # every hit wrote the whole index to record lastUsed
+        for _ in range(lookups):
+            cache.get("SYNTH", 2024, 1)
+            with cache.lock:
+                cache.saveIndex()
+
+    hitTime = timeIt(hits, repeat=1) / lookups
+    assert os.stat(indexPath).st_mtime_ns == written and cache.dirty
+    legacyTime = timeIt(legacyHits, repeat=1) / lookups
+    cache.get("SYNTH", 2024, 1)
+    lastUsed = cache.index[cache.keyName("SYNTH", 2024, 1)]["lastUsed"]
+    cache.close()
+    assert ProductCache(cacheDir).index[cache.keyName("SYNTH", 2024, 1)]["lastUsed"] == lastUsed
+
+    # a file that no longer matches its sha256 is a miss and leaves the cache
+    path = os.path.join(cacheDir, cache.index[cache.keyName("SYNTH", 2024, 1)]["file"])
+    with open(path, "r+b") as f:
+        f.seek(100)
+        f.write(b"corrupt")
+    assert cache.get("SYNTH", 2024, 1) is None and not cache.contains("SYNTH", 2024, 1) and not os.path.exists(path)
+
+    # bounded by bytes, the least recently used day goes first
+    days = [
+        {"tec": np.random.default_rng(day).uniform(0, 60, size=(13, 71, 73)).astype(np.float32)} for day in range(4)
+    ]
+    cache = ProductCache(os.path.join(workDir, "boundedCache"))
+    cache.put("SYNTH", 2024, 1, days[0])
+    cache.maxBytes = int(cache.totalBytes() * 3.5)
+    cache.put("SYNTH", 2024, 2, days[1])
+    cache.put("SYNTH", 2024, 3, days[2])
+    cache.get("SYNTH", 2024, 1)
+    cache.put("SYNTH", 2024, 4, days[3])
+    kept = [day for day in range(1, 5) if cache.contains("SYNTH", 2024, day)]
+    stats = cache.stats()
+    assert kept == [1, 3, 4] and stats["evictions"] == 1 and stats["bytes"] <= cache.maxBytes
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 0, 3)
+    record("productCache.hit", hitTime)
+    record("productCache.legacyHit", legacyTime)
+    print(f"product cache hit: {hitTime * 1000:.2f} ms, writing the index on every hit {legacyTime * 1000:.2f} ms")
+    print(f"product cache: {stats['entries']} days in {stats['bytes'] / 2**20:.1f} MiB, {stats['evictions']} evicted")
+
+
+def benchmarkProductCubes(workDir):
+    station = "SYNT00XXX"
+    served = os.path.join(workDir, "served")
+    os.makedirs(os.path.join(served, "2024", "001"))
+    rawPath = os.path.join(workDir, ionexFileName("SYNTH", 2024, "001"))
+    writeSyntheticIonex(rawPath)
+    with open(rawPath, "rb") as raw, gzip.open(
+        os.path.join(served, "2024", "001", os.path.basename(rawPath) + ".gz"), "wb"
+    ) as f:
+        shutil.copyfileobj(raw, f)
+    server, baseUrl = serveDirectory(served)
+    navFetcher = NavFetcher([station], baseUrl=baseUrl)
+    navPath = os.path.join(served, navFetcher.navUrl(station, 2024, "001")[len(baseUrl) + 1 :])
+    os.makedirs(os.path.dirname(navPath), exist_ok=True)
+    writeSyntheticNav(navPath, records=10)
+
+    downloadDir = os.path.join(workDir, "productDownloads")
+    os.makedirs(downloadDir)
+    source = ProductSource(
+        downloadDir, navFetcher=navFetcher, ionexUrl=baseUrl, archiveDir=os.path.join(downloadDir, "archive")
+    )
+    tecFrames = InterpolatedFrames(readIonex(rawPath).tec)
+    klobucharMaps = source.klobucharMaps(2024, "001", "2024-01-01")
+
+    def legacyDelta():
+        return np.array(list(tecFrames), dtype=np.float64) / 10 - np.array(klobucharMaps, dtype=np.float64)
+
+    def delta():
+        return source.deltaCube("SYNTH", "2024-01-01")
+
+    cold = timeIt(delta, repeat=1)
+    cached = timeIt(delta)
+    legacy = timeIt(legacyDelta)
+    cube, stats = delta()
+    legacyBytes = 3 * legacyDelta().nbytes
+    sharedBytes = cube.nbytes + source.tecCube("SYNTH", "2024-01-01").nbytes + source.klobucharCube("2024-01-01").nbytes
+    record("deltaCube.legacyView", legacy)
+    record("deltaCube.firstBuild", cold)
+    record("deltaCube.sharedView", cached)
+    record("deltaCube.bytes", sharedBytes, "bytes")
+    print(f"delta cube: legacy recompute {legacy * 1000:.1f} ms per view, first build {cold * 1000:.1f} ms")
+    print(f"delta cube: shared cube {cached * 1000:.3f} ms per view, stats for {len(stats['rms'])} epochs")
+    print(
+        f"delta cube: tec/klobuchar/delta {legacyBytes / 2**20:.1f} MiB float64, {sharedBytes / 2**20:.1f} MiB float32"
+    )
+
+    # 1 min frames and stats come from the same 15 min cubes, nothing more is cached
+    cachedBytes = sum(source.sizes.values())
+    tec = source.tecCube("SYNTH", "2024-01-01")
+    fineTec = source.tecCube("SYNTH", "2024-01-01", stepMinutes=1)
+    fine, fineStats = source.deltaCube("SYNTH", "2024-01-01", stepMinutes=1)
+    assert len(fine) == len(fineTec) == 24 * 60 and sum(source.sizes.values()) == cachedBytes
+    assert np.allclose(fineTec[15 * 7 + 5], (2 * tec[7] + tec[8]) / 3) and np.allclose(fine[15 * 7], cube[7])
+    assert fineStats["rms"][15 * 7] == stats["rms"][7] and len(fineStats["rms"]) == len(fine)
+    print(f"delta cube: 1 min view {len(fine)} frames from {cachedBytes / 2**20:.1f} MiB of 15 min cubes")
+    server.shutdown()
+
+
+def benchmarkComparison(workDir, products=("IGS", "UPC", "ESA"), latency=0.2):
+    served = os.path.join(workDir, "comparison")
+    os.makedirs(os.path.join(served, "2024", "001"))
+    for product in products:
+        rawPath = os.path.join(workDir, ionexFileName(product, 2024, "001"))
+        writeSyntheticIonex(rawPath)
+        with open(rawPath, "rb") as raw:
+            with gzip.open(os.path.join(served, "2024", "001", os.path.basename(rawPath) + ".gz"), "wb") as f:
+                shutil.copyfileobj(raw, f)
+        os.remove(rawPath)
+    server, baseUrl = serveDirectory(served, delay=latency)
+
+    def source():
+        downloadDir = tempfile.mkdtemp(dir=workDir)
+        return ProductSource(downloadDir, ionexUrl=baseUrl)
+
+    def sequential():
+        productSource = source()
+        return [productSource.tecCube(product, "2024-01-01") for product in products]
+
+    def concurrent():
+        return source().comparisonCubes(list(products), "2024-01-01")
+
+    sequentialTime = timeIt(sequential, repeat=1)
+    concurrentTime = timeIt(concurrent, repeat=1)
+    record("comparison.sequential", sequentialTime)
+    record("comparison.concurrent", concurrentTime)
+    print(f"comparison load, {latency * 1000:.0f} ms latency: one by one {sequentialTime * 1000:.0f} ms")
+    print(f"comparison load, {latency * 1000:.0f} ms latency: concurrent {concurrentTime * 1000:.0f} ms")
+    cubes, errors = concurrent()
+    assert not errors and len(cubes) == len(products)
+
+    # the GUI's tec and compare stages ask for the same product at the same time
+    for trial in range(5):
+        productSource = source()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            tec = executor.submit(productSource.tecCube, products[0], "2024-01-01")
+            compared = executor.submit(productSource.comparison, list(products), "2024-01-01")
+            assert np.array_equal(tec.result(), compared.result()["cubes"][products[0]], equal_nan=True)
+            assert not compared.result()["errors"]
+    server.shutdown()
+
+    requireNaturalEarth([-180, 180, -90, 90])
+    maps = list(cubes.values()) + list(pairDifferences(cubes).values())
+    fig = plt.figure(figsize=(15, 8), dpi=100)
+    titles = list(cubes) + list(pairDifferences(cubes))
+    view = CompareView(fig.canvas, titles, [m[0] for m in maps], [(0, 100)] * len(maps), ["jet"] * len(maps))
+    fig.canvas.draw()
+
+    def frame(index=[0]):
+        index[0] = (index[0] + 1) % 96
+        view.setData([m[index[0]] for m in maps])
+
+    frameTime = timeIt(frame, repeat=20)
+    record("comparison.sliderStep", frameTime)
+    print(f"comparison view: {len(maps)} maps per slider step {frameTime * 1000:.1f} ms")
+    plt.close(fig)
+
+
+def runLoad(pipeline, load, timeout=5):
+    # what the Tk poll loop does, without Tk
+    deadline = time.perf_counter() + timeout
+    while not load.done():
+        assert time.perf_counter() < deadline, "load did not finish"
+        pipeline.drain()
+        time.sleep(0.001)
+
+
+def benchmarkPipeline(workDir, latency=0.05):
+    pipeline = TaskPipeline(maxWorkers=4)
+    shown, started = [], []
+
+    def fetcher(name, value, fail=False):
+        def work(*ready):
+            started.append(name)
+            time.sleep(latency)
+            if fail:
+                raise DownloadError(f"{name}: no file")
+            return value + sum(ready)
+
+        return work
+
+    # independent stages overlap, a dependent stage runs on its inputs once both are in
+    load = pipeline.newLoad()
+    load.stage("tec", fetcher("tec", 1), onReady=lambda r: shown.append(("tec", r)))
+    load.stage("klobuchar", fetcher("klobuchar", 2), onReady=lambda r: shown.append(("klobuchar", r)))
+    load.stage("delta", fetcher("delta", 0), needs=["tec", "klobuchar"], onReady=lambda r: shown.append(("delta", r)))
+    loadTime = timeIt(runLoad, pipeline, load, repeat=1)
+    assert sorted(shown) == [("delta", 3), ("klobuchar", 2), ("tec", 1)] and shown[-1] == ("delta", 3)
+
+    # a failed stage reports its error and its dependents never start
+    shown, started, errors = [], [], []
+    load = pipeline.newLoad()
+    load.stage("tec", fetcher("tec", 1, fail=True), onError=errors.append)
+    load.stage("delta", fetcher("delta", 0), needs=["tec"], onReady=lambda r: shown.append(("delta", r)))
+    runLoad(pipeline, load)
+    assert len(errors) == 1 and "delta" not in started and not shown and load.failed == {"tec", "delta"}
+
+    # picking another date mid-load cancels the old load, its results are dropped and its dependents never start
+    shown, started = [], []
+    old = pipeline.newLoad()
+    old.stage("tec", fetcher("old tec", 1), onReady=lambda r: shown.append(("old tec", r)))
+    old.stage("delta", fetcher("old delta", 0), needs=["tec"], onReady=lambda r: shown.append(("old delta", r)))
+    load = pipeline.newLoad()
+    load.stage("tec", fetcher("tec", 5), onReady=lambda r: shown.append(("tec", r)))
+    runLoad(pipeline, load)
+    time.sleep(2 * latency)
+    pipeline.drain()
+    assert old.cancelled.is_set() and shown == [("tec", 5)] and "old delta" not in started
+    pipeline.shutdown()
+
+    # a callback that raises, say cartopy failing on the first draw, must not stop the polling for later loads
+    scheduled, caught, shown, errors = [], [], [], []
+    pipeline = TaskPipeline(
+        schedule=lambda delay, poll: scheduled.append(poll), onCallbackError=lambda name, e: caught.append(name)
+    )
+
+    def pollUntilDone(load, timeout=5):
+        # what Tk's after loop does, one scheduled poll at a time
+        deadline = time.perf_counter() + timeout
+        while scheduled:
+            assert time.perf_counter() < deadline, "load did not finish"
+            time.sleep(0.001)
+            scheduled.pop(0)()
+        assert load.done() and not pipeline.polling
+
+    def failingDraw(result):
+        raise RuntimeError("no Natural Earth data")
+
+    load = pipeline.newLoad()
+    load.stage("tec", fetcher("tec", 1), onReady=failingDraw, onError=errors.append)
+    load.stage("delta", fetcher("delta", 0), needs=["tec"], onReady=lambda r: shown.append(("delta", r)))
+    pollUntilDone(load)
+    assert [type(e) for e in errors] == [RuntimeError] and shown == [("delta", 1)]
+    load = pipeline.newLoad()
+    load.stage("tec", fetcher("tec", 2), onReady=failingDraw)
+    load.stage("kp", fetcher("kp", 3), onReady=lambda r: shown.append(("kp", r)))
+    pollUntilDone(load)
+    assert shown[-1] == ("kp", 3) and caught == ["tec"]
+    pipeline.shutdown()
+    record("pipeline.threeStageLoad", loadTime)
+    print(f"pipeline: tec + klobuchar + delta at {latency * 1000:.0f} ms each {loadTime * 1000:.0f} ms")
+    print("pipeline: failed stages skip their dependents, a new load drops the cancelled one")
+
+
+def benchmarkKpService(workDir):
+    server, baseUrl, paths = serveKp()
+    service = KpService(
+        os.path.join(workDir, "kpStore.json"), baseUrl=f"{baseUrl}/kpdata", forecastUrl=f"{baseUrl}/forecast.txt"
+    )
+    today = service.today()
+
+    def window(center):
+        return service.kpValues(center - timedelta(days=3), center + timedelta(days=3))
+
+    for name, center in [
+        ("first week", today - timedelta(days=30)),
+        ("same week again", today - timedelta(days=30)),
+        ("two days later", today - timedelta(days=28)),
+        ("back inside seen range", today - timedelta(days=29)),
+        ("week around today", today),
+        ("today again", today),
+    ]:
+        before = len(paths)
+        elapsed = timeIt(window, center, repeat=1)
+        record(f"kpService.{name}.requests", len(paths) - before, "count")
+        record(f"kpService.{name}", elapsed)
+        print(f"kp service {name}: {len(paths) - before} requests, {elapsed * 1000:.1f} ms")
+    server.shutdown()
+
+
+def legacyKpChart(startDate, matrixValues):
+    dateRange = [startDate + timedelta(days=i) for i in range(len(matrixValues))]
+    times = ["00:00", "03:00", "06:00", "09:00", "12:00", "15:00", "18:00", "21:00"]
+    barWidth = 0.1
+    figKPindex, axKpindex = plt.subplots(figsize=(12, 7), dpi=100)
+    br = np.arange(len(dateRange))
+    norm = matplotlib.colors.Normalize(vmin=0, vmax=9)
+    cmap = matplotlib.colormaps["RdYlGn_r"]
+    for i, hour in enumerate(times):
+        barPositions = [x + barWidth * i for x in br]
+        hoursValues = [matrixValues[day][i] for day in range(len(dateRange))]
+        colors = [cmap(norm(v)) for v in hoursValues]
+        axKpindex.bar(barPositions, hoursValues, color=colors, edgecolor="grey", width=barWidth, label=hour)
+    axKpindex.set_xticks([r + barWidth * 3.5 for r in br])
+    axKpindex.set_xticklabels([d.strftime("%b %d") for d in dateRange])
+    axKpindex.legend(title="Hours", handlelength=0, handletextpad=1, loc="upper right", bbox_to_anchor=(1.35, 1.1))
+    figKPindex.colorbar(matplotlib.cm.ScalarMappable(norm=norm, cmap=cmap), ax=axKpindex, label="Kp Index")
+    figKPindex.canvas.draw()
+    plt.close(figKPindex)
+
+
+def benchmarkKpChart(workDir):
+    startDate = date(2024, 1, 1)
+    fig = plt.figure(figsize=(12, 7), dpi=100)
+    chart = KpChart(fig)
+    for days in [7, 90]:
+        values = np.random.default_rng(days).uniform(0, 9, size=(days, 8))
+
+        def persistent():
+            chart.update(startDate, values)
+            fig.canvas.draw()
+
+        legacy = timeIt(legacyKpChart, startDate, values.tolist(), repeat=3)
+        updated = timeIt(persistent, repeat=3)
+        record(f"kpChart.{days}days.legacy", legacy)
+        record(f"kpChart.{days}days.collection", updated)
+        print(f"kp chart {days} days: legacy {legacy * 1000:.1f} ms, persistent collection {updated * 1000:.1f} ms")
+    plt.close(fig)
+
+
+def benchmarkKlobuchar(workDir):
+    alpha = [1.1176e-08, 7.4506e-09, -5.9605e-08, -5.9605e-08]
+    beta = [90112.0, 0.0, -196610.0, -65536.0]
+    times = [86400 + i * 900 for i in range(96)]
+
+    def legacy(alpha=alpha, beta=beta, **fixes):
+        return np.array([legacyCalcKlobuchar(seconds, alpha, beta, **fixes) for seconds in times])
+
+    def batched():
+        return KlobucharModel(alpha, beta).cube(times)
+
+    # the batched model is the original code with both fixes patched in, and nothing else changed
+    assert np.allclose(legacy(semicircleF=True, semicirclePole=True), batched(), rtol=1e-6, atol=1e-6)
+    # the obliquity fix alone scales every zenith delay by the same factor, about 3x
+    ratio = (1.0 + 16.0 * (0.53 - np.radians(np.pi / 2)) ** 3) / (1.0 + 16.0 * (0.53 - 0.5) ** 3)
+    assert np.allclose(legacy(semicirclePole=True), ratio * legacy(semicircleF=True, semicirclePole=True))
+    assert 2.9 < ratio < 3.1
+    # the pole offset fix alone moves the geomagnetic latitude, with F unchanged
+    original, poleFixed = legacy(), legacy(semicirclePole=True)
+    assert not np.allclose(original, poleFixed)
+    poleChange = float(np.max(np.abs(poleFixed / original - 1)))
+    legacyTime, batchedTime = timeIt(legacy), timeIt(batched)
+    record("klobuchar.legacy", legacyTime)
+    record("klobuchar.batched", batchedTime)
+    print(f"klobuchar 96 epochs: legacy {legacyTime * 1000:.1f} ms, batched {batchedTime * 1000:.1f} ms")
+    print(f"klobuchar fixes: obliquity factor {ratio:.2f}x smaller, pole offset changes delays up to {poleChange:.0%}")
+
+
+def benchmarkRendering(workDir, frames=48):
+    requireNaturalEarth([-180, 180, -90, 90])
+    maps = np.random.default_rng(0).uniform(0, 60, size=(frames, 71, 73))
+
+    def createCanvas():
+        # what Gui.createCanvas does for a new tab, on an Agg canvas
+        fig = Figure(figsize=(12, 7), dpi=100)
+        canvas = FigureCanvasAgg(fig)
+        MapView(canvas, "benchmark", [-180, 180, -90, 90], maps[0])
+        canvas.draw()
+
+    createTime = timeIt(createCanvas, repeat=3)
+    record("rendering.createCanvas", createTime)
+    print(f"map canvas: create and first draw {createTime * 1000:.0f} ms")
+    fig = plt.figure(figsize=(12, 7), dpi=100)
+    ax, mesh, overlays = drawMap(fig, "benchmark", [-180, 180, -90, 90], maps[0])
+    fig.canvas.draw()
+
+    def fullRedraw():
+        for data in maps:
+            mesh.set_array(data.ravel())
+            fig.canvas.draw()
+
+    fullTime = timeIt(fullRedraw, repeat=1) / frames
+    reference = np.asarray(fig.canvas.buffer_rgba(), dtype=np.float32)
+    plt.close(fig)
+
+    def blitFrames(cacheFeatures):
+        fig = plt.figure(figsize=(12, 7), dpi=100)
+        ax, mesh, overlays = drawMap(fig, "benchmark", [-180, 180, -90, 90], maps[0])
+        if cacheFeatures:
+            blitMesh = BlitMesh(fig.canvas, ax, mesh, features=overlays)
+        else:
+            blitMesh = BlitMesh(fig.canvas, ax, mesh, overlays)
+        fig.canvas.draw()
+
+        def blitRedraw():
+            for data in maps:
+                blitMesh.setData(data)
+
+        elapsed = timeIt(blitRedraw, repeat=1) / frames
+        image = np.asarray(fig.canvas.buffer_rgba(), dtype=np.float32)
+        plt.close(fig)
+        return elapsed, image
+
+    redrawnTime, redrawn = blitFrames(False)
+    blitTime, blitted = blitFrames(True)
+    # the cached feature layer gives the same picture as drawing the features over the last frame
+    assert np.abs(blitted - reference).mean() < 0.5 and np.abs(redrawn - reference).mean() < 0.5
+    record("rendering.fullRedraw", fullTime)
+    record("rendering.blitRedrawnFeatures", redrawnTime)
+    record("rendering.blit", blitTime)
+    print(f"map frame: full redraw {fullTime * 1000:.1f} ms ({1 / fullTime:.0f} fps)")
+    print(f"map frame: blit, features drawn every frame {redrawnTime * 1000:.1f} ms ({1 / redrawnTime:.0f} fps)")
+    print(f"map frame: blit, cached feature layer {blitTime * 1000:.1f} ms ({1 / blitTime:.0f} fps)")
+
+
+def benchmarkExport(workDir, frames=24):
+    requireNaturalEarth([-180, 180, -90, 90])
+    cube = np.random.default_rng(0).uniform(0, 60, size=(frames, 71, 73)).astype(np.float32)
+    frameDir = os.path.join(workDir, "exportFrames")
+    os.makedirs(frameDir)
+
+    def newFigurePerFrame():
+        for index in range(frames):
+            fig = plt.figure(figsize=(12, 7), dpi=100)
+            drawMap(fig, f"benchmark {index}", [-180, 180, -90, 90], cube[index])
+            fig.savefig(os.path.join(frameDir, f"legacy_{index}.png"))
+            plt.close(fig)
+
+    def reusedFigure():
+        cubePath = os.path.join(workDir, "exportCube.npy")
+        np.save(cubePath, cube)
+        initWorker(cubePath, "benchmark", datetime(2024, 1, 1), 15, "jet", "tecu", 0, 60, (12, 7), 100)
+        renderFrames(range(frames), frameDir)
+
+    rebuild = timeIt(newFigurePerFrame, repeat=1) / frames
+    reused = timeIt(reusedFigure, repeat=1) / frames
+    record("export.newFigureFrame", rebuild)
+    record("export.reusedFigureFrame", reused)
+    print(f"export: new figure per frame {rebuild * 1000:.0f} ms, reused figure {reused * 1000:.0f} ms per frame")
+    pooled = timeIt(lambda: exportFrames(cube, os.path.join(workDir, "export.gif"), "gif"), repeat=1)
+    record("export.gif", pooled)
+    print(f"export: {frames} frame gif on {os.cpu_count()} worker processes {pooled:.1f} s")
+
+
+def benchmarkMapSwitch(workDir, switches=5):
+    maps = np.random.default_rng(0).uniform(0, 60, size=(switches, 71, 73))
+    extents = [[lon - 10, lon + 10, 0, 10] for lon in range(-150, 150, 300 // switches)]
+    requireNaturalEarth([-180, 180, -90, 90], *extents)
+
+    def rebuild():
+        for data, extent in zip(maps, extents):
+            fig = plt.figure(figsize=(12, 7), dpi=100)
+            drawMap(fig, "benchmark", extent, data)
+            fig.canvas.draw()
+            plt.close(fig)
+
+    fig = plt.figure(figsize=(12, 7), dpi=100)
+    mapView = MapView(fig.canvas, "benchmark", [-180, 180, -90, 90], maps[0])
+    fig.canvas.draw()
+
+    def inPlace():
+        for data, extent in zip(maps, extents):
+            mapView.update("benchmark", extent, data)
+
+    rebuildTime = timeIt(rebuild, repeat=1) / switches
+    inPlaceTime = timeIt(inPlace, repeat=1) / switches
+    plt.close(fig)
+    record("mapSwitch.rebuild", rebuildTime)
+    record("mapSwitch.inPlace", inPlaceTime)
+    print(f"area zoom: rebuild figure {rebuildTime * 1000:.1f} ms, update in place {inPlaceTime * 1000:.1f} ms")
+
+
+def benchmarkTecArchive(workDir, days=180):
+    archive = TecArchive(os.path.join(workDir, "tecArchive"), "SYNTH")
+    rng = np.random.default_rng(0)
+    start = datetime(2024, 1, 1).timestamp()
+    lats, lons = np.arange(87.5, -88, -2.5), np.arange(-180, 181, 5.0)
+    appendTime = 0.0
+    for day in range(days):
+        epochs = start + day * 86400 + np.arange(13) * 7200
+        maps = rng.uniform(0, 80, size=(13, len(lats), len(lons))).astype(np.float32)
+        appendTime += timeIt(archive.appendMaps, epochs, maps, lats, lons, repeat=1)
+    record("tecArchive.appendDay", appendTime / days)
+    print(f"tec archive: {len(archive)} maps, append {appendTime / days * 1000:.2f} ms per day")
+
+    def loadAll():
+        month = np.array(archive.maps())[: 30 * 12 + 1]
+        return month.mean(axis=0), np.percentile(month, (10, 50, 90), axis=0)
+
+    monthEnd = start + 30 * 86400
+    for name, function in [
+        ("load all, 30 day mean/percentiles", loadAll),
+        ("30 day mean/percentiles", lambda: archive.statistics(start, monthEnd)),
+        ("point series, all days", lambda: archive.pointSeries(32.0, 35.0)),
+        ("3 day frames, first frame", lambda: archive.frames(start + 86400, days=3)[0]),
+    ]:
+        elapsed, peak = measure(function)
+        record(f"tecArchive.{name}", elapsed)
+        record(f"tecArchive.{name}.peakMemory", peak, "bytes")
+        print(f"tec archive {name}: {elapsed * 1000:.1f} ms, peak memory {peak / 2**20:.2f} MiB")
+
+
+def legacySamplePoint(cube, lat, lon):
+    i, j = min(int((87.5 - lat) // 2.5), 69), min(int((lon + 180) // 5), 71)
+    latFraction, lonFraction = (87.5 - 2.5 * i - lat) / 2.5, (lon + 180 - 5 * j) / 5
+    values = []
+    for frame in cube:
+        top = (1 - lonFraction) * frame[i, j] + lonFraction * frame[i, j + 1]
+        bottom = (1 - lonFraction) * frame[i + 1, j] + lonFraction * frame[i + 1, j + 1]
+        values.append((1 - latFraction) * top + latFraction * bottom)
+    return values
+
+
+def benchmarkSampling(workDir, sites=500):
+    rng = np.random.default_rng(0)
+    cube = rng.uniform(0, 80, size=(96, 71, 73)).astype(np.float32)
+    lats, lons = rng.uniform(-87.5, 87.5, sites), rng.uniform(-180, 179.9, sites)
+    sampler = GridSampler()
+
+    def legacy():
+        return np.array([legacySamplePoint(cube, lat, lon) for lat, lon in zip(lats, lons)]).T
+
+    weights = sampler.points(lats, lons)
+    assert np.allclose(legacy(), weights.apply(cube), atol=1e-3)
+    # straight up samples the receiver's cell, 30 degrees north from 80 N reaches the 450 km shell near 86 N
+    zenith = sampler.piercePoints(lats, lons, 90, 0)
+    assert np.allclose(zenith.apply(cube), weights.apply(cube), atol=1e-3)
+    north = sampler.piercePoints(80, 0, 30, 0)
+    assert np.allclose(north.apply(cube), sampler.points(86.012, 0).apply(cube), atol=1e-2)
+    legacyTime = timeIt(legacy, repeat=1)
+    weightTime = timeIt(sampler.points, lats, lons)
+    gatherTime = timeIt(weights.apply, cube)
+    record("sampling.legacy", legacyTime)
+    record("sampling.weights", weightTime)
+    record("sampling.gather", gatherTime)
+    print(f"sampling {sites} sites x 96 epochs: per-point loop {legacyTime * 1000:.1f} ms")
+    print(f"sampling {sites} sites x 96 epochs: weights {weightTime * 1000:.2f} ms, gather {gatherTime * 1000:.2f} ms")
+
+
+def benchmarkInstrumentation(workDir, calls=1000000):
+    def plain(value):
+        return value
+
+    decorated = instrumentation.timed("benchmark.call")(plain)
+
+    def callAll(function):
+        for i in range(calls):
+            function(i)
+
+    instrumentation.enable(False)
+    baseline = timeIt(callAll, plain, repeat=3)
+    disabled = timeIt(callAll, decorated, repeat=3)
+    instrumentation.enable(True)
+    enabled = timeIt(callAll, decorated, repeat=1)
+    tracePath = instrumentation.exportTrace(os.path.join(workDir, "trace.json"))
+    traceSize, events = os.path.getsize(tracePath), len(instrumentation.recorder.events)
+    instrumentation.enable(False)
+    instrumentation.recorder.reset()
+    perCall = lambda seconds: (seconds - baseline) / calls * 1e9
+    record("instrumentation.disabledCall", perCall(disabled), "ns")
+    record("instrumentation.enabledCall", perCall(enabled), "ns")
+    print(
+        f"instrumentation: disabled {perCall(disabled):.0f} ns, enabled {perCall(enabled):.0f} ns per call, "
+        f"trace of {events} events {traceSize / 2**20:.1f} MiB"
+    )
+
+
+def benchmarkDatePicker(workDir, flips=24):
+    served = os.path.join(workDir, "availability")
+    product, month = "IGS", date(2024, 3, 1)
+    days = [month + timedelta(days=i) for i in range(31)]
+    for day in days[10:20]:
+        dayDir = os.path.join(served, str(day.year), dayOfYear(day))
+        os.makedirs(dayDir, exist_ok=True)
+        open(os.path.join(dayDir, ionexFileName(product, day.year, dayOfYear(day)) + ".gz"), "wb").close()
+    server, baseUrl, stats = serveArchive(served, handshake=0.02)
+    navFetcher = NavFetcher(["SYNT00XXX"], baseUrl=baseUrl, client=NetworkClient())
+    for day in days[12:18]:
+        navPath = os.path.join(served, navFetcher.navUrl("SYNT00XXX", day.year, dayOfYear(day))[len(baseUrl) + 1 :])
+        os.makedirs(os.path.dirname(navPath), exist_ok=True)
+        open(navPath, "wb").close()
+    archiveDir = os.path.join(workDir, "availabilityArchive")
+    source = ProductSource(
+        workDir, navFetcher=navFetcher, ionexUrl=baseUrl, archiveDir=archiveDir, client=NetworkClient()
+    )
+    lats, lons = np.arange(87.5, -88, -2.5), np.arange(-180, 181, 5.0)
+    for day in days[:5]:
+        start = datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp()
+        maps = np.zeros((13, len(lats), len(lons)), dtype=np.float32)
+        source.archive(product).appendMaps(start + np.arange(13) * 7200, maps, lats, lons)
+
+    coldTime = timeIt(source.availability, product, days[0], days[-1], repeat=1)
+    warmTime = timeIt(source.availability, product, days[0], days[-1], repeat=1)
+    statuses = source.availability(product, days[0], days[-1])
+    # a day is only as available as its navigation file, which nobody has checked unless a station has it
+    assert [statuses[day] for day in days[12:18]] == ["upstream"] * 6
+    assert [statuses[day] for day in days[:5] + days[10:12] + days[18:20]] == ["unknown"] * 9
+    assert all(statuses[day] == "missing" for day in days[5:10] + days[20:])
+    counts = {status: list(statuses.values()).count(status) for status in set(statuses.values())}
+    record("dateAvailability.cold", coldTime)
+    record("dateAvailability.warm", warmTime)
+    print(f"date availability, one month: cold {coldTime * 1000:.0f} ms, again {warmTime * 1000:.0f} ms, {counts}")
+    server.shutdown()
+
+    if not os.environ.get("DISPLAY"):
+        print("date picker: no display, skipping month navigation")
+        return
+    import customtkinter as ctk
+    from ctk_date_picker import CTkDatePicker
+
+    root = ctk.CTk()
+    picker = CTkDatePicker(root)
+    picker.open_calendar()
+    root.update()
+    widgets = len(picker.calendar_frame.winfo_children())
+
+    def flip():
+        for _ in range(flips):
+            picker.prev_month()
+            root.update_idletasks()
+
+    flipTime = timeIt(flip, repeat=1) / flips
+    assert len(picker.calendar_frame.winfo_children()) == widgets
+    record("datePicker.monthFlip", flipTime)
+    print(f"date picker: {flipTime * 1000:.1f} ms per month, {widgets} widgets reused")
+    root.destroy()
+
+
+def legacySlantKlobuchar(lat, lon, azimuth, elevation, seconds, alpha, beta):
+    # one line of sight at a time, straight from the ICD formulas
+    E, A = elevation / 180, math.radians(azimuth)
+    psi = 0.0137 / (E + 0.11) - 0.022
+    latIPP = min(max(lat / 180 + psi * math.cos(A), -0.416), 0.416)
+    lonIPP = lon / 180 + psi * math.sin(A) / math.cos(latIPP * math.pi)
+    latM = latIPP + 0.064 * math.cos((lonIPP - 1.617) * math.pi)
+    t = (43200 * lonIPP + seconds) % 86400
+    amplitude = max(sum(a * latM**i for i, a in enumerate(alpha)), 0)
+    period = max(sum(b * latM**i for i, b in enumerate(beta)), 72000)
+    x = 2 * math.pi * (t - 50400) / period
+    F = 1 + 16 * (0.53 - E) ** 3
+    delay = F * (5e-9 + (amplitude * (1 - x**2 / 2 + x**4 / 24) if abs(x) < 1.57 else 0))
+    return delay * 299792458
+
+
+def benchmarkSlantDelay(workDir, lines=2000000, legacyLines=20000):
+    alpha, beta = [1.2e-8, 1.5e-8, -6e-8, -6e-8], [98304, 65536, -65536, -393216]
+    rng = np.random.default_rng(0)
+    rawPath = os.path.join(workDir, "slant.24I")
+    writeSyntheticIonex(rawPath)
+    engine = SlantDelay.fromIonex(readIonex(rawPath), alpha, beta)
+    start = engine.epochs[0]
+    lat, lon = rng.uniform(-80, 80, lines), rng.uniform(-180, 180, lines)
+    azimuth, elevation = rng.uniform(0, 360, lines), rng.uniform(5, 90, lines)
+    epochs = start + rng.uniform(0, 86400, lines)
+
+    legacy = [
+        legacySlantKlobuchar(*los, alpha, beta)
+        for los in zip(
+            lat[:legacyLines],
+            lon[:legacyLines],
+            azimuth[:legacyLines],
+            elevation[:legacyLines],
+            epochs[:legacyLines] % 86400,
+        )
+    ]
+    sample = engine.compute(
+        lat[:legacyLines], lon[:legacyLines], azimuth[:legacyLines], elevation[:legacyLines], epochs[:legacyLines]
+    )
+    assert np.allclose(sample["klobuchar"], legacy, rtol=1e-3, atol=1e-3)
+    zenith = engine.compute(lat[:100], lon[:100], 0, 90, start)
+    expected = (
+        GridSampler(engine.sampler.lats, engine.sampler.lons)
+        .points(lat[:100], lon[:100])
+        .apply(engine.maps[:1].reshape(1, len(engine.sampler.lats), -1))[0]
+    )
+    assert np.allclose(zenith["gim"], expected * L1_METRES_PER_TECU, rtol=1e-4)
+
+    legacyTime = timeIt(
+        lambda: [
+            legacySlantKlobuchar(*los, alpha, beta)
+            for los in zip(
+                lat[:legacyLines],
+                lon[:legacyLines],
+                azimuth[:legacyLines],
+                elevation[:legacyLines],
+                epochs[:legacyLines],
+            )
+        ],
+        repeat=1,
+    )
+    tracemalloc.start()
+    engineTime = timeIt(engine.compute, lat, lon, azimuth, elevation, epochs, repeat=1)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    record("slantDelay.legacyLine", legacyTime / legacyLines * 1e9, "ns")
+    record("slantDelay.engineLine", engineTime / lines * 1e9, "ns")
+    record("slantDelay.peakMemory", peak, "bytes")
+    print(f"slant delay: per-line loop, Klobuchar only {legacyTime / legacyLines * 1e9:.0f} ns per line of sight")
+    print(
+        f"slant delay: engine, Klobuchar and GIM {engineTime / lines * 1e9:.0f} ns per line of sight, "
+        f"{lines} lines, peak {peak / 2**20:.0f} MiB"
+    )
+
+
+def legacyAnomalies(archive, dayStart, window=27, threshold=3.0, minDeviation=5.0):
+    # rereads the whole window from the archive for every day
+    epochs, maps = archive.slice(dayStart - window * 86400, dayStart - 1)
+    slotOf = (epochs - epochs[0]) % 86400 // 7200
+    todayEpochs, today = archive.slice(dayStart, dayStart + 86399)
+    flags = 0
+    for slot in range(12):
+        history = maps[(slotOf == slot) & (epochs % 86400 == slot * 7200)]
+        q1, median, q3 = np.percentile(history, (25, 50, 75), axis=0)
+        deviation = today[slot] - median
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = deviation / ((q3 - q1) / 1.349)
+        flags += np.count_nonzero((np.abs(score) > threshold) & (np.abs(deviation) > minDeviation))
+    return flags
+
+
+def benchmarkAnomaly(workDir, days=60, stormDay=50):
+    archive = TecArchive(os.path.join(workDir, "anomalyArchive"), "SYNTH")
+    rng = np.random.default_rng(0)
+    start = int(datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp())
+    lats, lons = np.arange(87.5, -88, -2.5), np.arange(-180, 181, 5.0)
+    hours = np.arange(13) * 2
+    # a sun-following daytime bump in every map, low latitudes brightest
+    localHour = (hours[:, None] + lons[None, :] / 15) % 24
+    diurnal = 20 + 30 * np.exp(-(((localHour - 14) / 4) ** 2))[:, None, :] * np.cos(np.radians(lats))[None, :, None]
+    storm = np.zeros(diurnal.shape, dtype=np.float32)
+    storm[6:9, 8:20, 30:45] = 40
+    for day in range(days):
+        maps = diurnal * rng.normal(1, 0.02) + rng.normal(0, 1, size=diurnal.shape)
+        if day == stormDay:
+            maps = maps + storm
+        archive.appendMaps(start + day * 86400 + hours * 3600, maps.astype(np.float32), lats, lons)
+
+    detector = AnomalyDetector(os.path.join(workDir, "anomaly"), "SYNTH")
+    firstDay, lastDay = date(2024, 1, 1) + timedelta(days=30), date(2024, 1, 1) + timedelta(days=days - 1)
+    coldTime = timeIt(detector.catchUp, archive, firstDay, lastDay, repeat=1)
+    againTime = timeIt(detector.catchUp, archive, firstDay, lastDay, repeat=1)
+    events = detector.events()
+    stormStart = start + stormDay * 86400
+    inStorm = (events["epoch"] >= stormStart + 12 * 3600) & (events["epoch"] <= stormStart + 16 * 3600)
+    # every injected cell is found, and the quiet days stay almost clean
+    falseRate = np.count_nonzero(~inStorm) / ((days - 30) * storm[:12].size)
+    assert inStorm.sum() == np.count_nonzero(storm[6:9]) and falseRate < 1e-3
+
+    nextDay = start + days * 86400
+    maps = (diurnal + rng.normal(0, 1, size=diurnal.shape)).astype(np.float32)
+    archive.appendMaps(nextDay + hours * 3600, maps, lats, lons)
+    epochs, dayMaps = archive.slice(nextDay, nextDay + 86399)
+    streamTime = timeIt(detector.update, nextDay, epochs, dayMaps, lats, lons, repeat=1)
+    legacyTime = timeIt(legacyAnomalies, archive, nextDay, repeat=3)
+
+    kp = np.full((days, 8), 2.0)
+    kp[stormDay, 4:6] = 7
+    summary = eventSummary(events, date(2024, 1, 1), kp)
+    record("anomaly.catchUp", coldTime)
+    record("anomaly.catchUpAgain", againTime)
+    record("anomaly.streamDay", streamTime)
+    record("anomaly.legacyDay", legacyTime)
+    print(
+        f"anomaly: {days - 30} days against a 27 day baseline {coldTime * 1000:.0f} ms, "
+        f"again {againTime * 1000:.1f} ms, {inStorm.sum()} storm cells found, false flag rate {falseRate:.1e}"
+    )
+    print(f"anomaly: one new day, window reread {legacyTime * 1000:.1f} ms, streaming {streamTime * 1000:.1f} ms")
+    print(f"anomaly: {summary['stormEpochs']} flagged epochs at Kp >= 5, r(Kp) {summary['kpCorrelation']:.2f}")
+
+
+FIRST_WINDOW_SCRIPT = """
+import time
+start = time.perf_counter()
+import customtkinter as ctk
+import gui
+
+def firstPaint(root):
+    root.update()
+    print(time.perf_counter() - start)
+    root.destroy()
+
+ctk.CTk.mainloop = firstPaint
+gui.isNetrcExists = lambda: None
+gui.Gui()
+"""
+
+
+def runPython(code):
+    repoDir = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run([sys.executable, "-c", code], cwd=repoDir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+    return result.stdout.strip().splitlines()
+
+
+def benchmarkStartup(workDir):
+    modules = ["customtkinter", "numpy", "matplotlib.pyplot", "matplotlib.backends.backend_tkagg", "cartopy.crs"]
+    modules += ["cartopy.feature", "requests", "tkintermapview", "gui"]
+    for name in modules:
+        seconds = float(
+            runPython(f"import time; t = time.perf_counter(); import {name}; print(time.perf_counter() - t)")[0]
+        )
+        record(f"startup.import.{name}", seconds)
+        print(f"startup: import {name} {seconds * 1000:.0f} ms")
+
+    heavy = ["numpy", "matplotlib", "cartopy", "requests", "tkintermapview"]
+    loaded = runPython(f"import sys, gui; print(*[m for m in {heavy!r} if m in sys.modules])")
+    print(f"startup: heavy modules loaded by import gui: {loaded[0] if loaded else 'none'}")
+
+    if not os.environ.get("DISPLAY"):
+        print("startup: no display, skipping time to first window")
+        return
+    seconds = float(runPython(FIRST_WINDOW_SCRIPT)[-1])
+    record("startup.firstWindow", seconds)
+    print(f"startup: time to first window {seconds * 1000:.0f} ms")
+
+
+BENCHMARKS = [
+    benchmarkIonexParser,
+    benchmarkInterpolation,
+    benchmarkNavHeader,
+    benchmarkNavStations,
+    benchmarkNetwork,
+    benchmarkTileCache,
+    benchmarkProductCache,
+    benchmarkProductCubes,
+    benchmarkComparison,
+    benchmarkPipeline,
+    benchmarkKpService,
+    benchmarkKpChart,
+    benchmarkKlobuchar,
+    benchmarkRendering,
+    benchmarkMapSwitch,
+    benchmarkExport,
+    benchmarkTecArchive,
+    benchmarkSampling,
+    benchmarkDatePicker,
+    benchmarkSlantDelay,
+    benchmarkAnomaly,
+    benchmarkInstrumentation,
+    benchmarkStartup,
+]
+
+
+def environment():
+    repoDir = os.path.dirname(os.path.abspath(__file__))
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=repoDir, capture_output=True, text=True)
+    return {
+        "commit": commit.stdout.strip() or None,
+        "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def writeResults(path, failures, skipped):
+    report = {"environment": environment(), "results": results, "failures": failures, "skipped": skipped}
+    writeJson(path, report, indent=1)
+
+
+def compareResults(path, threshold):
+    # every unit here is lower-is-better, a result more than threshold above the baseline is a regression
+    with open(path, "r") as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline.get(name)
+        if before is None or before["unit"] != result["unit"] or before["value"] <= 0:
+            continue
+        change = result["value"] / before["value"] - 1
+        noise = result["unit"] == "s" and max(before["value"], result["value"]) < NOISE_FLOOR
+        flag = "REGRESSION" if change > threshold and not noise else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<45}{before['value']:>12.4g}{result['value']:>12.4g} {result['unit']:<6}{change:>+8.0%} {flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks on synthetic IONEX, nav and Kp fixtures")
+    parser.add_argument("names", nargs="*", help="run only benchmarks whose name contains one of these")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    selected = [
+        benchmark
+        for benchmark in BENCHMARKS
+        if not args.names or any(name.lower() in benchmark.__name__.lower() for name in args.names)
+    ]
+    failures, skipped = {}, {}
+    with tempfile.TemporaryDirectory() as workDir:
+        for benchmark in selected:
+            # one failing benchmark is reported, the others still run
+            try:
+                benchmark(workDir)
+            except BenchmarkSkipped as e:
+                skipped[benchmark.__name__] = str(e)
+                print(f"{benchmark.__name__} skipped: {e}", file=sys.stderr)
+            except Exception as e:
+                failures[benchmark.__name__] = f"{type(e).__name__}: {e}"
+                print(f"{benchmark.__name__} failed: {failures[benchmark.__name__]}", file=sys.stderr)
+
+    if args.json:
+        writeResults(args.json, failures, skipped)
+    regressions = compareResults(args.compare, args.threshold) if args.compare else []
+    if regressions:
+        print(f"{len(regressions)} regressions above {args.threshold:.0%}: {', '.join(regressions)}")
+    return 1 if failures or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,12 @@
 import tkinter as tk
 import customtkinter as ctk
-from datetime import datetime
+from datetime import date, datetime
 import calendar
+import queue
+import threading
+
+# day shading for the statuses returned by the availability callback, anything else stays transparent
+AVAILABILITY_COLORS = {"local": "#2d6a3e", "upstream": "#3a4a5e", "missing": "#6b2d2d"}
 
 
 class CTkDatePicker(ctk.CTkFrame):
@@ -22,6 +27,16 @@ class CTkDatePicker(ctk.CTkFrame):
         self.add_months = 0
         self.subtract_months = 0
         self.max_date = datetime.now().date()
+        self.day_buttons = []
+        self.availability_callback = None
+        self.select_callback = None
+        self.availability_colors = AVAILABILITY_COLORS
+        self.availability = {}
+        self.availability_pending = set()
+        self.availability_results = queue.Queue()
+        self.availability_generation = 0
+        # one poll loop at a time, clearing and asking again must not start a second one
+        self.availability_poll_id = None
 
     def set_date_format(self, date_format):
         self.date_format = date_format
@@ -33,42 +48,31 @@ class CTkDatePicker(ctk.CTkFrame):
         locale.setlocale(locale.LC_NUMERIC, "C")
 
     def open_calendar(self):
-        if self.popup is not None:
-            self.popup.destroy()
-        self.popup = ctk.CTkToplevel(self)
-        self.popup.title("Select Date")
+        # the popup and its grid are built once and hidden between uses
+        if self.popup is None or not self.popup.winfo_exists():
+            self.popup = ctk.CTkToplevel(self)
+            self.popup.title("Select Date")
+            self.popup.resizable(False, False)
+            self.popup.protocol("WM_DELETE_WINDOW", self.popup.withdraw)
+            self.build_calendar()
+        else:
+            self.popup.deiconify()
         self.popup.geometry("+%d+%d" % (self.winfo_rootx(), self.winfo_rooty() + self.winfo_height()))
-        self.popup.resizable(False, False)
         self.popup.after(500, lambda: self.popup.focus())
         self.current_year = datetime.now().year
         self.current_month = datetime.now().month
-        self.build_calendar()
+        for i in range(self.add_months):
+            self.step_month(1)
+        for i in range(self.subtract_months):
+            self.step_month(-1)
+        self.show_month()
 
     def build_calendar(self):
-        if hasattr(self, "calendar_frame"):
-            self.calendar_frame.destroy()
-
         self.calendar_frame = ctk.CTkFrame(self.popup)
         self.calendar_frame.grid(row=0, column=0)
 
-        for i in range(self.add_months):
-            if self.current_month == 12:
-                self.current_month = 1
-                self.current_year += 1
-            else:
-                self.current_month += 1
-
-        for i in range(self.subtract_months):
-            if self.current_month == 1:
-                self.current_month = 12
-                self.current_year -= 1
-            else:
-                self.current_month -= 1
-
-        month_label = ctk.CTkLabel(
-            self.calendar_frame, text=f"{calendar.month_name[self.current_month].capitalize()}, {self.current_year}"
-        )
-        month_label.grid(row=0, column=1, columnspan=5)
+        self.month_label = ctk.CTkLabel(self.calendar_frame, text="")
+        self.month_label.grid(row=0, column=1, columnspan=5)
 
         if self.allow_change_month:
             prev_month_button = ctk.CTkButton(self.calendar_frame, text="<", width=5, command=self.prev_month)
@@ -82,57 +86,121 @@ class CTkDatePicker(ctk.CTkFrame):
             lbl = ctk.CTkLabel(self.calendar_frame, text=day)
             lbl.grid(row=1, column=i)
 
-        month_days = calendar.monthrange(self.current_year, self.current_month)[1]
-        start_day = calendar.monthrange(self.current_year, self.current_month)[0]
-        day = 1
+        text_color = "black" if ctk.get_appearance_mode() == "Light" else None
+        self.day_buttons = []
         for week in range(2, 8):
             for day_col in range(7):
-                if week == 2 and day_col < start_day:
-                    lbl = ctk.CTkLabel(self.calendar_frame, text="")
-                    lbl.grid(row=week, column=day_col)
-                elif day > month_days:
-                    lbl = ctk.CTkLabel(self.calendar_frame, text="")
-                    lbl.grid(row=week, column=day_col)
-                else:
-                    candidate_date = datetime(self.current_year, self.current_month, day).date()
-                    if candidate_date > self.max_date:
-                        btn = ctk.CTkButton(self.calendar_frame, text=str(day), width=3, state="disabled")
-                    else:
-                        if ctk.get_appearance_mode() == "Light":
-                            btn = ctk.CTkButton(
-                                self.calendar_frame,
-                                text=str(day),
-                                width=3,
-                                command=lambda day=day: self.select_date(day),
-                                fg_color="transparent",
-                                text_color="black",
-                            )
-                        else:
-                            btn = ctk.CTkButton(
-                                self.calendar_frame,
-                                text=str(day),
-                                width=3,
-                                command=lambda day=day: self.select_date(day),
-                                fg_color="transparent",
-                            )
-                    btn.grid(row=week, column=day_col)
-                    day += 1
+                cell = len(self.day_buttons)
+                btn = ctk.CTkButton(
+                    self.calendar_frame,
+                    text="",
+                    width=3,
+                    command=lambda cell=cell: self.select_cell(cell),
+                    fg_color="transparent",
+                    text_color=text_color,
+                )
+                btn.grid(row=week, column=day_col)
+                self.day_buttons.append(btn)
+
+    def show_month(self):
+        # navigation only reconfigures the 6x7 grid, no widget is created or destroyed
+        self.month_label.configure(text=f"{calendar.month_name[self.current_month].capitalize()}, {self.current_year}")
+        start_day, month_days = calendar.monthrange(self.current_year, self.current_month)
+        for cell, btn in enumerate(self.day_buttons):
+            day = cell - start_day + 1
+            if 1 <= day <= month_days:
+                candidate_date = datetime(self.current_year, self.current_month, day).date()
+                state = "disabled" if candidate_date > self.max_date else "normal"
+                btn.configure(text=str(day), state=state)
+            else:
+                btn.configure(text="", state="disabled")
+        self.shade_days()
+        self.request_availability()
+
+    def step_month(self, months):
+        month = self.current_year * 12 + self.current_month - 1 + months
+        self.current_year, self.current_month = divmod(month, 12)
+        self.current_month += 1
 
     def prev_month(self):
-        if self.current_month == 1:
-            self.current_month = 12
-            self.current_year -= 1
-        else:
-            self.current_month -= 1
-        self.build_calendar()
+        self.step_month(-1)
+        self.show_month()
 
     def next_month(self):
-        if self.current_month == 12:
-            self.current_month = 1
-            self.current_year += 1
-        else:
-            self.current_month += 1
-        self.build_calendar()
+        self.step_month(1)
+        self.show_month()
+
+    def set_on_select(self, callback):
+        # callback(date_string) after the user picks a day in the popup
+        self.select_callback = callback
+
+    def set_availability_callback(self, callback, colors=None):
+        # callback(first_date, last_date) -> {date: status}, called off the Tk thread once per month shown
+        self.availability_callback = callback
+        self.availability_colors = colors or AVAILABILITY_COLORS
+        self.clear_availability()
+
+    def clear_availability(self):
+        # results still on their way for the old settings are dropped by generation
+        self.availability = {}
+        self.availability_pending = set()
+        self.availability_generation += 1
+        if self.popup is not None and self.popup.winfo_exists():
+            self.shade_days()
+            self.request_availability()
+
+    def request_availability(self):
+        key = (self.current_year, self.current_month)
+        if self.availability_callback is None or key in self.availability or key in self.availability_pending:
+            return
+        self.availability_pending.add(key)
+        first_date = date(self.current_year, self.current_month, 1)
+        last_date = date(self.current_year, self.current_month, calendar.monthrange(*key)[1])
+        generation = self.availability_generation
+
+        def work():
+            try:
+                result = self.availability_callback(first_date, last_date)
+            except Exception as e:
+                print(f"availability lookup failed: {e}")
+                result = {}
+            self.availability_results.put((generation, key, result))
+
+        threading.Thread(target=work, daemon=True).start()
+        if self.availability_poll_id is None:
+            self.availability_poll_id = self.after(50, self.poll_availability)
+
+    def poll_availability(self):
+        self.availability_poll_id = None
+        while True:
+            try:
+                generation, key, result = self.availability_results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.availability_generation:
+                continue
+            self.availability_pending.discard(key)
+            self.availability[key] = result
+            if key == (self.current_year, self.current_month):
+                self.shade_days()
+        if self.availability_pending:
+            self.availability_poll_id = self.after(50, self.poll_availability)
+
+    def shade_days(self):
+        statuses = self.availability.get((self.current_year, self.current_month), {})
+        start_day, month_days = calendar.monthrange(self.current_year, self.current_month)
+        for cell, btn in enumerate(self.day_buttons):
+            day = cell - start_day + 1
+            status = None
+            if 1 <= day <= month_days:
+                status = statuses.get(date(self.current_year, self.current_month, day))
+            btn.configure(fg_color=self.availability_colors.get(status, "transparent"))
+
+    def select_cell(self, cell):
+        start_day, month_days = calendar.monthrange(self.current_year, self.current_month)
+        day = cell - start_day + 1
+        if 1 <= day <= month_days:
+            self.select_date(day)
 
     def select_date(self, day):
         candidate_date = datetime(self.current_year, self.current_month, day).date()
@@ -145,8 +213,9 @@ class CTkDatePicker(ctk.CTkFrame):
         self.date_entry.insert(0, self.selected_date.strftime(self.date_format))
         if not self.allow_manual_input:
             self.date_entry.configure(state="disabled")
-        self.popup.destroy()
-        self.popup = None
+        self.popup.withdraw()
+        if self.select_callback is not None:
+            self.select_callback(self.get_date())
 
     def get_date(self):
         return self.date_entry.get()
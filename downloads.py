@@ -0,0 +1,47 @@
+import gzip
+import os
+import shutil
+import threading
+
+from instrumentation import timed
+from network import NetworkError, sharedClient
+
+pathLocks = {}
+pathLocksLock = threading.Lock()
+
+
+class DownloadError(Exception):
+    pass
+
+
+def pathLock(path):
+    # one lock per target file, reentrant so a caller can hold it over downloading, reading and removing the file
+    with pathLocksLock:
+        return pathLocks.setdefault(os.path.abspath(path), threading.RLock())
+
+
+@timed("download.ionex")
+def downloadAndExtract(url, downloadDir, saveFileName, timeout=5, client=None):
+    zipPath = os.path.join(downloadDir, saveFileName + ".gz")
+    savePath = os.path.join(downloadDir, saveFileName)
+
+    with pathLock(savePath):
+        if os.path.exists(savePath):
+            return savePath
+        client = client or sharedClient()
+        extractPath = savePath + ".extracting"
+        try:
+            # an interrupted transfer leaves zipPath.part behind and the next call resumes it
+            client.download(url, zipPath, timeout=timeout)
+            with gzip.open(zipPath, "rb") as zipFile, open(extractPath, "wb") as saveFile:
+                shutil.copyfileobj(zipFile, saveFile)
+            # readers only ever see a complete file under savePath
+            os.replace(extractPath, savePath)
+        except (NetworkError, OSError, EOFError) as e:
+            if os.path.exists(extractPath):
+                os.remove(extractPath)
+            raise DownloadError(f"{saveFileName}: {e}") from e
+        finally:
+            if os.path.exists(zipPath):
+                os.remove(zipPath)
+        return savePath
@@ -0,0 +1,172 @@
+import argparse
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+FORMATS = ["gif", "mp4", "png"]
+FRAME_NAME = "frame_{:04d}.png"
+
+# one figure per worker process, built by initWorker and reused for every frame it renders
+worker = {}
+
+
+class ExportError(Exception):
+    pass
+
+
+def initWorker(cubePath, title, startTime, stepMinutes, cmap, label, vmin, vmax, figsize, dpi):
+    import matplotlib
+
+    matplotlib.use("Agg")
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    from mapView import drawMap
+
+    cube = np.load(cubePath, mmap_mode="r")
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax, mesh, overlays = drawMap(
+        fig, title, [-180, 180, -90, 90], cube[0], cmap=cmap, label=label, vmin=vmin, vmax=vmax
+    )
+    worker.update(cube=cube, fig=fig, ax=ax, mesh=mesh, title=title, startTime=startTime, stepMinutes=stepMinutes)
+
+
+def renderFrames(indices, frameDir):
+    paths = []
+    for index in indices:
+        frameTime = worker["startTime"] + timedelta(minutes=index * worker["stepMinutes"])
+        worker["ax"].set_title(f"{worker['title']} - {frameTime:%Y-%m-%d %H:%M}")
+        worker["mesh"].set_array(np.ravel(worker["cube"][index]))
+        path = os.path.join(frameDir, FRAME_NAME.format(index))
+        worker["fig"].savefig(path)
+        paths.append(path)
+    return paths
+
+
+def writeGif(paths, outPath, fps):
+    from PIL import Image
+
+    frames = (Image.open(path).convert("P", palette=Image.Palette.ADAPTIVE) for path in paths)
+    first = next(frames)
+    first.save(outPath, save_all=True, append_images=frames, duration=int(1000 / fps), loop=0)
+
+
+def writeMp4(frameDir, outPath, fps):
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg is None:
+        raise ExportError("mp4 export needs ffmpeg on the PATH")
+    framePattern = os.path.join(frameDir, "frame_%04d.png")
+    command = [ffmpeg, "-y", "-loglevel", "error", "-framerate", str(fps), "-i", framePattern]
+    command += ["-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p", outPath]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise ExportError(f"ffmpeg failed: {result.stderr.strip()}")
+
+
+def exportFrames(
+    cube,
+    outPath,
+    fmt="gif",
+    title="",
+    startTime=None,
+    stepMinutes=15,
+    cmap="jet",
+    label="tecu",
+    limits=None,
+    symmetric=False,
+    fps=10,
+    workers=None,
+    chunkSize=8,
+    figsize=(12, 7),
+    dpi=100,
+):
+    if fmt not in FORMATS:
+        raise ExportError(f"unknown format {fmt}, expected one of {', '.join(FORMATS)}")
+    startTime = startTime or datetime(2000, 1, 1)
+    workers = workers or os.cpu_count()
+
+    workDir = tempfile.mkdtemp(prefix="export_")
+    frameDir = outPath if fmt == "png" else workDir
+    os.makedirs(frameDir, exist_ok=True)
+    try:
+        # workers map the cube from disk instead of receiving a pickled copy each, it is written a frame at a
+        # time so lazily interpolated frames are never all in memory at once
+        cubePath = os.path.join(workDir, "cube.npy")
+        frames = np.lib.format.open_memmap(
+            cubePath, mode="w+", dtype=np.float32, shape=(len(cube),) + np.shape(cube[0])
+        )
+        low, high = np.inf, -np.inf
+        for index, frame in enumerate(cube):
+            frames[index] = frame
+            if not np.isnan(frames[index]).all():
+                low, high = min(low, float(np.nanmin(frames[index]))), max(high, float(np.nanmax(frames[index])))
+        frames.flush()
+        del frames
+        spread = max(abs(low), abs(high))
+        vmin, vmax = limits if limits is not None else (-spread, spread) if symmetric else (low, high)
+        initArgs = (cubePath, title, startTime, stepMinutes, cmap, label, vmin, vmax, figsize, dpi)
+        chunks = [range(start, min(start + chunkSize, len(cube))) for start in range(0, len(cube), chunkSize)]
+        # spawn rather than fork, the caller may be a Tk process
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=context, initializer=initWorker, initargs=initArgs
+        ) as pool:
+            paths = [path for chunk in pool.map(renderFrames, chunks, [frameDir] * len(chunks)) for path in chunk]
+
+        if fmt == "gif":
+            writeGif(paths, outPath, fps)
+        elif fmt == "mp4":
+            writeMp4(frameDir, outPath, fps)
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+    return outPath
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a cube from a batch .npz file as an animation or PNG frames")
+    parser.add_argument("npz", help="file written by batch.py")
+    parser.add_argument("array", help="array to render, e.g. IGS_tec, klobuchar or IGS_delta")
+    parser.add_argument("--format", choices=FORMATS, default="gif")
+    parser.add_argument("--out", help="output file, or directory for png frames")
+    parser.add_argument("--fps", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args(argv)
+
+    with np.load(args.npz) as arrays:
+        if args.array not in arrays:
+            print(f"{args.array} not in {args.npz}, available: {', '.join(arrays.files)}", file=sys.stderr)
+            return 1
+        cube = arrays[args.array]
+        stepMinutes = int(arrays["minutes"][1] - arrays["minutes"][0]) if "minutes" in arrays else 15
+
+    name = os.path.splitext(os.path.basename(args.npz))[0]
+    startTime = datetime.strptime(name, "%Y%j") if name.isdigit() else None
+    outPath = args.out or f"{name}_{args.array}" + ("" if args.format == "png" else f".{args.format}")
+    try:
+        exportFrames(
+            cube,
+            outPath,
+            args.format,
+            title=args.array,
+            startTime=startTime,
+            stepMinutes=stepMinutes,
+            symmetric=args.array.endswith("_delta"),
+            fps=args.fps,
+            workers=args.workers,
+        )
+    except ExportError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(outPath)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+import functools
+import gzip
+import http.server
+import io
+import os
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+from PIL import Image
+
+# synthetic inputs and local HTTP stand-ins for the benchmarks, nothing here touches the network
+# (cartopy still wants Natural Earth for the map benchmarks, they are skipped when it is not cached)
+
+
+def writeSyntheticIonex(
+    path,
+    nMaps=13,
+    lats=(87.5, -87.5, -2.5),
+    lons=(-180.0, 180.0, 5.0),
+    exponent=-1,
+    rms=True,
+    firstEpoch=datetime(2024, 1, 1),
+    seed=0,
+):
+    latAxis = np.linspace(lats[0], lats[1], int(round((lats[1] - lats[0]) / lats[2])) + 1)
+    lonAxis = np.linspace(lons[0], lons[1], int(round((lons[1] - lons[0]) / lons[2])) + 1)
+    interval = 86400 // max(nMaps - 1, 1)
+    rng = np.random.default_rng(seed)
+
+    def label(text, name):
+        return f"{text:<60}{name:<20}\n"
+
+    def epochLine(epoch, name):
+        fields = "".join(
+            f"{v:6d}" for v in (epoch.year, epoch.month, epoch.day, epoch.hour, epoch.minute, epoch.second)
+        )
+        return label(fields, name)
+
+    lines = [
+        label("     1.0            IONOSPHERE MAPS     GNSS", "IONEX VERSION / TYPE"),
+        epochLine(firstEpoch, "EPOCH OF FIRST MAP"),
+        epochLine(firstEpoch + timedelta(seconds=interval * (nMaps - 1)), "EPOCH OF LAST MAP"),
+        label(f"{interval:6d}", "INTERVAL"),
+        label(f"{nMaps:6d}", "# OF MAPS IN FILE"),
+        label(f"  {450.0:6.1f}{450.0:6.1f}{0.0:6.1f}", "HGT1 / HGT2 / DHGT"),
+        label(f"  {lats[0]:6.1f}{lats[1]:6.1f}{lats[2]:6.1f}", "LAT1 / LAT2 / DLAT"),
+        label(f"  {lons[0]:6.1f}{lons[1]:6.1f}{lons[2]:6.1f}", "LON1 / LON2 / DLON"),
+        label(f"{exponent:6d}", "EXPONENT"),
+        label("", "END OF HEADER"),
+    ]
+
+    def mapBlock(kind, index, values):
+        block = [label(f"{index + 1:6d}", f"START OF {kind} MAP")]
+        block.append(epochLine(firstEpoch + timedelta(seconds=interval * index), "EPOCH OF CURRENT MAP"))
+        for lat, row in zip(latAxis, values):
+            block.append(
+                label(f"  {lat:6.1f}{lons[0]:6.1f}{lons[1]:6.1f}{lons[2]:6.1f}{450.0:6.1f}", "LAT/LON1/LON2/DLON/H")
+            )
+            for i in range(0, len(row), 16):
+                block.append("".join(f"{v:5d}" for v in row[i : i + 16]) + "\n")
+        block.append(label(f"{index + 1:6d}", f"END OF {kind} MAP"))
+        return block
+
+    tec = rng.integers(0, 999, size=(nMaps, len(latAxis), len(lonAxis)))
+    for i in range(nMaps):
+        lines.extend(mapBlock("TEC", i, tec[i]))
+    if rms:
+        for i in range(nMaps):
+            lines.extend(mapBlock("RMS", i, rng.integers(0, 99, size=(len(latAxis), len(lonAxis)))))
+    lines.append(label("", "END OF FILE"))
+
+    with open(path, "w") as file:
+        file.writelines(lines)
+    return tec
+
+
+NAV_ALPHA = (1.1176e-08, 7.4506e-09, -5.9605e-08, -5.9605e-08)
+NAV_BETA = (9.0112e04, 0.0, -1.9661e05, -6.5536e04)
+
+
+def writeSyntheticNav(path, records=20000, alpha=NAV_ALPHA, beta=NAV_BETA, seed=0):
+    header = [
+        f"{'     3.04           N: GNSS NAV DATA    M: MIXED':<60}RINEX VERSION / TYPE\n",
+        f"{'GPSA ' + ''.join(f'{v:12.4E}' for v in alpha):<60}IONOSPHERIC CORR\n",
+        f"{'GPSB ' + ''.join(f'{v:12.4E}' for v in beta):<60}IONOSPHERIC CORR\n",
+        f"{'':<60}END OF HEADER\n",
+    ]
+    rng = np.random.default_rng(seed)
+    body = [
+        f"G{i % 32 + 1:02d} 2024 01 01 {i % 24:02d} 00 00" + "".join(f"{v:19.12E}" for v in rng.normal(size=3)) + "\n"
+        for i in range(records)
+    ]
+    with gzip.open(path, "wt") as f:
+        f.writelines(header + body)
+
+
+def kpText(startDate, endDate, definitive=True):
+    # GFZ kp2 rows, the day value cycles so every slot is distinguishable
+    lines = ["# YYY MM DD hh.h hh._m        days      days_m         Kp  ap  D\n"]
+    for i in range((endDate - startDate).days + 1):
+        day = startDate + timedelta(days=i)
+        for slot in range(8):
+            lines.append(
+                f"{day:%Y %m %d} {slot * 3:04.1f} {slot * 3 + 1.5:05.2f} 0 0 {slot % 5}.333 7 {int(definitive)}\n"
+            )
+    return "".join(lines)
+
+
+def forecastText(values=(2.0, 3.0, 4.0)):
+    # the Kp table of the NOAA 3-day forecast
+    slots = ("00-03UT", "03-06UT", "06-09UT", "09-12UT", "12-15UT", "15-18UT", "18-21UT", "21-00UT")
+    lines = ["NOAA Kp index breakdown\n"]
+    lines += [f"{slot}  " + " ".join(f"{v:.2f}" for v in values) + "\n" for slot in slots]
+    lines.append("Rationale: synthetic\n")
+    return "".join(lines)
+
+
+def serveDirectory(directory, delay=0.0):
+    class QuietHandler(http.server.SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(delay)
+            super().do_GET()
+
+        def copyfile(self, source, outputfile):
+            try:
+                super().copyfile(source, outputfile)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(QuietHandler, directory=directory))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def serveKp():
+    paths = []
+
+    class KpHandler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            paths.append(self.path)
+            query = parse_qs(urlparse(self.path).query)
+            if "startdate" in query:
+                startDate, endDate = date.fromisoformat(query["startdate"][0]), date.fromisoformat(query["enddate"][0])
+                body = kpText(startDate, endDate).encode()
+            else:
+                body = forecastText().encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), KpHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", paths
+
+
+def serveArchive(directory, handshake=0.0, dropFirst=False):
+    # keep-alive HTTP/1.1 with Range and ETag, handshake stands in for the TLS and login round trips of a connection
+    stats = {"connections": 0, "bytes": 0, "dropped": set()}
+
+    class ArchiveHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def setup(self):
+            super().setup()
+            stats["connections"] += 1
+            time.sleep(handshake)
+
+        def do_HEAD(self):
+            path = os.path.join(directory, urlparse(self.path).path.lstrip("/"))
+            self.send_response(200 if os.path.isfile(path) else 404)
+            self.send_header("Content-Length", str(os.path.getsize(path)) if os.path.isfile(path) else "0")
+            self.end_headers()
+
+        def do_GET(self):
+            path = os.path.join(directory, urlparse(self.path).path.lstrip("/"))
+            if not os.path.isfile(path):
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            with open(path, "rb") as f:
+                body = f.read()
+            etag = f'"{zlib.crc32(body):08x}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.end_headers()
+                return
+            start = 0
+            if self.headers.get("Range") and self.headers.get("If-Range", etag) == etag:
+                start = int(self.headers["Range"].split("=")[1].rstrip("-"))
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{len(body) - 1}/{len(body)}")
+            else:
+                self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body) - start))
+            self.end_headers()
+            if dropFirst and path not in stats["dropped"]:
+                # cut the first transfer of every file half way
+                stats["dropped"].add(path)
+                body = body[: start + (len(body) - start) // 2]
+                self.close_connection = True
+            self.wfile.write(body[start:])
+            stats["bytes"] += len(body) - start
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}", stats
+
+
+def serveTiles(latency=0.0):
+    requested = []
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), (170, 211, 223)).save(buffer, "PNG")
+    tile = buffer.getvalue()
+
+    class TileHandler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            requested.append(self.path)
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(tile)))
+            self.end_headers()
+            self.wfile.write(tile)
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), TileHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/{{z}}/{{x}}/{{y}}.png", requested
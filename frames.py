@@ -0,0 +1,72 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LazyFrames(ABC):
+    def __init__(self, length, cacheSize=16):
+        self.length = length
+        self.cacheSize = cacheSize
+        self.cache = OrderedDict()
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        index = int(index)
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(f"frame {index} out of range 0..{self.length - 1}")
+
+        frame = self.cache.get(index)
+        if frame is not None:
+            self.cache.move_to_end(index)
+            return frame
+
+        frame = self.computeFrame(index)
+        self.cache[index] = frame
+        if len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+        return frame
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+    @abstractmethod
+    def computeFrame(self, index):
+        pass
+
+
+class InterpolatedFrames(LazyFrames):
+    def __init__(self, maps, intervalMinutes=120, stepMinutes=15, cacheSize=16):
+        if intervalMinutes % stepMinutes:
+            raise ValueError(f"step of {stepMinutes} min does not divide the {intervalMinutes} min map interval")
+        self.maps = np.asarray(maps, dtype=np.float32)
+        self.stepMinutes = stepMinutes
+        self.stepsPerInterval = intervalMinutes // stepMinutes
+        super().__init__((len(self.maps) - 1) * self.stepsPerInterval, cacheSize)
+
+    def computeFrame(self, index):
+        i, j = divmod(index, self.stepsPerInterval)
+        if j == 0:
+            return self.maps[i]
+        alpha = np.float32(j / self.stepsPerInterval)
+        return (1 - alpha) * self.maps[i] + alpha * self.maps[i + 1]
+
+    def frameMinutes(self, index):
+        return int(index) * self.stepMinutes
+
+
+def fillCube(*sequences):
+    # frames written one by one into a single float32 cube, never a list of every frame next to it
+    count = sum(len(sequence) for sequence in sequences)
+    cube = np.empty((count,) + np.shape(sequences[0][0]), dtype=np.float32)
+    index = 0
+    for sequence in sequences:
+        for frame in sequence:
+            cube[index] = frame
+            index += 1
+    return cube
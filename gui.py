@@ -1,19 +1,31 @@
 import customtkinter as ctk
-import numpy as np
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib.pyplot as plt
-import cartopy.crs as ccrs
-import cartopy.feature as cfeature
-from datetime import date, datetime, timedelta
-import requests, os, gzip, shutil
-import urllib.request
-from matplotlib.colors import Normalize
-import matplotlib
-from matplotlib.cm import ScalarMappable
+from datetime import datetime, timedelta
+import importlib
+import instrumentation
+import os, threading, time
 from ctk_date_picker import CTkDatePicker
-from tkintermapview import TkinterMapView
+from pipeline import TaskPipeline
 from pathlib import Path
 
+# loaded on a background thread after the window is up, then imported locally where used
+HEAVY_MODULES = [
+    "numpy",
+    "matplotlib.pyplot",
+    "matplotlib.backends.backend_tkagg",
+    "frames",
+    "tecArchive",
+    "sampling",
+    "mapView",
+    "products",
+    "productCache",
+    "navFetcher",
+    "kpIndex",
+    "kpChart",
+    "tkintermapview",
+    "tileCache",
+    "anomaly",
+]
+
 
 def isNetrcExists():
     netrcPath = Path.home() / ".netrc"
@@ -37,7 +49,14 @@ password {password}
         print(".netrc file already exists")
 
 
-isNetrcExists()
+def warmUp(done):
+    isNetrcExists()
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print(f"failed to import {name}: {e}")
+    done.set()
 
 
 class Gui:
@@ -47,16 +66,41 @@ class Gui:
         self.root.geometry(f"{self.root.winfo_screenwidth()}x{self.root.winfo_screenheight()}+0+0")
         self.root.title("Ionosphere maps")
 
-        self.tecCanvas, self.kpIndexCanvas, self.klobucharCanvas, self.deltaCanvas = None, None, None, None
+        self.kpIndexCanvas, self.kpChart, self.seriesCanvas = None, None, None
+        self.tecMap, self.klobucharMap, self.deltaMap = None, None, None
         self.animationRun, self.animationId = False, None
+        self.frameIndex, self.frameRate = 0, None
         self.day, self.year = None, None
         self.mapChoice = ctk.StringVar(value="IGS map")
-        self.mapManuAdded = False
+        self.productName = self.mapChoice.get()
+        self.availabilityProduct = self.productName.split()[0]
+        self.tecMaps, self.klobucharMaps, self.deltaMaps = None, None, None
+        self.cadenceChoice = ctk.StringVar(value="15 min")
+        self.spanChoice = ctk.StringVar(value="1 day")
+        self.frameStep, self.deltaStats = 15, None
+        self.compareChoice = ctk.BooleanVar(value=False)
+        self.exportChoice = ctk.StringVar(value="GIF")
+        self.compareCanvas, self.compareView, self.compareMaps = None, None, None
+        self.overlayChoice = ctk.BooleanVar(value=instrumentation.enabled)
+        self.overlayLabel, self.overlayId = None, None
+        self.mapWidget = None
+        self.anomalyChoice = ctk.BooleanVar(value=False)
+        self.anomalies = None
 
         self.downloadDir = os.path.join(os.getcwd(), "downloads")
         os.makedirs(self.downloadDir, exist_ok=True)
+        self.productSource, self.kpService, self.servicesLock = None, None, threading.Lock()
+        self.pipeline = TaskPipeline(schedule=self.root.after, onCallbackError=self.callbackFailed)
+        self.exportPipeline = TaskPipeline(schedule=self.root.after, maxWorkers=1, onCallbackError=self.callbackFailed)
 
         self.buildWindow()
+        if self.overlayChoice.get():
+            # IONO_TRACE=1 starts with the switch on, show the overlay as a click on it would
+            self.toggleOverlay()
+        self.warmedUp = threading.Event()
+        threading.Thread(target=warmUp, args=(self.warmedUp,), daemon=True).start()
+        self.root.after(100, self.addMapWidget)
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.root.mainloop()
 
     def buildWindow(self):
@@ -73,36 +117,86 @@ class Gui:
         self.startButton.grid(row=0, column=0, pady=10, sticky="ew")
 
         self.mapOption = ctk.CTkOptionMenu(
-            self.buttonsFrame, variable=self.mapChoice, values=["IGS map", "UPC map", "ESA map"]
+            self.buttonsFrame,
+            variable=self.mapChoice,
+            values=["IGS map", "UPC map", "ESA map"],
+            command=self.changeProduct,
         )
         self.mapOption.grid(row=1, column=0, pady=5)
 
+        self.cadenceOption = ctk.CTkOptionMenu(
+            self.buttonsFrame, variable=self.cadenceChoice, values=["15 min", "10 min", "5 min", "1 min"]
+        )
+        self.cadenceOption.grid(row=2, column=0, pady=5)
+
         self.date = CTkDatePicker(self.buttonsFrame)
         self.date.grid(row=3, column=0, pady=10)
         self.date.set_date_format("%Y-%m-%d")
         self.date.set_allow_manual_input(False)
+        self.date.set_availability_callback(self.dateAvailability)
+        self.date.set_on_select(self.reloadIfLoading)
+
+        self.spanOption = ctk.CTkOptionMenu(
+            self.buttonsFrame, variable=self.spanChoice, values=["1 day", "2 days", "3 days", "7 days"]
+        )
+        self.spanOption.grid(row=4, column=0, pady=5)
+
+        self.compareSwitch = ctk.CTkSwitch(self.buttonsFrame, text="compare centres", variable=self.compareChoice)
+        self.compareSwitch.grid(row=5, column=0, pady=5)
 
         self.animationButton = ctk.CTkButton(
             self.buttonsFrame, text="start Animation", fg_color="green", command=self.animations, height=50
         )
-        self.animationButton.grid(row=4, column=0, pady=30, sticky="ew")
+        self.animationButton.grid(row=6, column=0, pady=30, sticky="ew")
 
         self.slider = ctk.CTkSlider(self.buttonsFrame, from_=0, to=95, command=self.updateMap, state="disabled")
-        self.slider.grid(row=5, column=0, pady=20)
+        self.slider.grid(row=7, column=0, pady=20)
 
         self.time = ctk.CTkLabel(self.buttonsFrame, text=f"Time: 12:00")
-        self.time.grid(row=6, column=0, pady=10)
+        self.time.grid(row=8, column=0, pady=10)
+
+        self.fpsLabel = ctk.CTkLabel(self.buttonsFrame, text="")
+        self.fpsLabel.grid(row=9, column=0)
+
+        self.statsLabel = ctk.CTkLabel(self.buttonsFrame, text="", wraplength=180)
+        self.statsLabel.grid(row=10, column=0)
 
         self.errorLabel = ctk.CTkLabel(self.buttonsFrame, text="", text_color="red", wraplength=180)
-        self.errorLabel.grid(row=7, column=0, pady=10)
+        self.errorLabel.grid(row=11, column=0, pady=10)
+
+        self.exportOption = ctk.CTkOptionMenu(
+            self.buttonsFrame, variable=self.exportChoice, values=["GIF", "MP4", "PNG"]
+        )
+        self.exportOption.grid(row=12, column=0, pady=5)
+
+        self.exportButton = ctk.CTkButton(self.buttonsFrame, text="export animation", command=self.exportVisible)
+        self.exportButton.grid(row=13, column=0, pady=5, sticky="ew")
+
+        self.overlaySwitch = ctk.CTkSwitch(
+            self.buttonsFrame, text="timing overlay", variable=self.overlayChoice, command=self.toggleOverlay
+        )
+        self.overlaySwitch.grid(row=14, column=0, pady=5)
+
+        self.traceButton = ctk.CTkButton(self.buttonsFrame, text="save trace", command=self.saveTrace)
+        self.traceButton.grid(row=15, column=0, pady=5, sticky="ew")
+
+        self.anomalySwitch = ctk.CTkSwitch(
+            self.buttonsFrame, text="TEC anomalies", variable=self.anomalyChoice, command=self.toggleAnomalies
+        )
+        self.anomalySwitch.grid(row=16, column=0, pady=5)
+
+        self.anomalyLabel = ctk.CTkLabel(self.buttonsFrame, text="", wraplength=180)
+        self.anomalyLabel.grid(row=17, column=0)
 
-        self.tabView = ctk.CTkTabview(self.root)
+        self.tabView = ctk.CTkTabview(self.root, command=self.drawVisibleMap)
         self.tabView.grid(row=0, column=1, sticky="nsew", padx=10, pady=10)
 
         self.tecTab = self.tabView.add("TEC")
         self.kpindexTab = self.tabView.add("Kp Index")
         self.klobucharTab = self.tabView.add("Klobuchar")
         self.deltaTab = self.tabView.add("Delta TEC-klobuchar")
+        self.seriesTab = self.tabView.add("Time series")
+        self.compareTab = self.tabView.add("Compare")
 
         self.tecFrame = ctk.CTkFrame(self.tecTab, fg_color="gray")
         self.tecFrame.pack(expand=True, fill="both", padx=10, pady=10)
@@ -116,138 +210,196 @@ class Gui:
         self.deltaFrame = ctk.CTkFrame(self.deltaTab, fg_color="gray")
         self.deltaFrame.pack(expand=True, fill="both", padx=10, pady=10)
 
+        self.seriesFrame = ctk.CTkFrame(self.seriesTab, fg_color="gray")
+        self.seriesFrame.pack(expand=True, fill="both", padx=10, pady=10)
+
+        self.compareFrame = ctk.CTkFrame(self.compareTab, fg_color="gray")
+        self.compareFrame.pack(expand=True, fill="both", padx=10, pady=10)
+
         self.maplabel = ctk.CTkLabel(self.root, text="right click to choose location", text_color="white", anchor="w")
         self.maplabel.grid(row=1, column=1, sticky="w", padx=10, pady=(10, 0))
 
-        self.mapWidget = TkinterMapView(self.root, width=400, height=200)
+    def addMapWidget(self):
+        if not self.warmedUp.is_set():
+            self.root.after(100, self.addMapWidget)
+            return
+        from tileCache import CachedMapView, TileStore
+
+        # tiles come from downloads/tiles.db first, prefetch it with python tileCache.py
+        tileStore = TileStore(os.path.join(self.downloadDir, "tiles.db"))
+        self.mapWidget = CachedMapView(self.root, width=400, height=200, tileStore=tileStore)
         self.mapWidget.grid(row=2, column=1, sticky="w", padx=10, pady=(0, 10))
         self.mapWidget.set_position(34, 35)
         self.mapWidget.set_zoom(2)
         self.mapWidget.canvas.bind("<Button-3>", self.mapWidget.mouse_right_click)
-        self.mapWidget.set_tile_server("https://mt0.google.com/vt/lyrs=m&hl=en&x={x}&y={y}&z={z}&s=Ga")
+        # showArea only redraws what has been loaded, so the menu can be there from the start
+        self.mapWidget.add_right_click_menu_command(label="show this area", command=self.showArea, pass_coords=True)
+
+    def services(self):
+        # runs on pipeline workers, the first load pays for the imports and the cache index
+        with self.servicesLock:
+            if self.productSource is None:
+                from productCache import ProductCache
+                from navFetcher import NavFetcher, readStationNames
+                from products import ProductSource
+                from kpIndex import KpService
+
+                self.warmedUp.wait()
+                self.kpService = KpService(os.path.join(self.downloadDir, "kpStore.json"))
+                productCache = ProductCache(os.path.join(self.downloadDir, "cache"))
+                statsPath = os.path.join(self.downloadDir, "stationStats.json")
+                navFetcher = NavFetcher(readStationNames(), statsPath=statsPath)
+                archiveDir = os.path.join(self.downloadDir, "archive")
+                self.productSource = ProductSource(self.downloadDir, productCache, navFetcher, archiveDir=archiveDir)
+            return self.productSource
+
+    def close(self):
+        self.stopAnimation()
+        if self.overlayId is not None:
+            self.root.after_cancel(self.overlayId)
+        self.pipeline.shutdown()
+        self.exportPipeline.shutdown()
+        if self.productSource is not None and self.productSource.productCache is not None:
+            self.productSource.productCache.close()
+        self.root.destroy()
 
     def showMaps(self):
-        self.showTec()
-        self.showKpindex()
-        self.showKlobuchar()
-
-        self.showDelta()
-
-        self.mapWidget.delete_all_marker()
-        if not self.mapManuAdded:
-            self.mapWidget.add_right_click_menu_command(label="show this area", command=self.showArea, pass_coords=True)
-        self.mapManuAdded = True
-
-    def showTec(self):
-        fileName = self.calcFileName()
-        url = f"https://cddis.nasa.gov/archive/gnss/products/ionex/{self.year}/{self.day}/{fileName + ".gz"}"
-        path = self.downloadAndExtract(url=url, saveFileName=fileName)
-        self.tecMaps = self.getTecData(path)
-
-        if self.tecCanvas is not None:
-            self.tecCanvas.get_tk_widget().destroy()
-            self.tecCanvas = None
-
-        title = f"{self.mapChoice.get()} - {self.selectedDate}"
-        self.tecCanvas, self.meshTec = self.createCanvas(
-            self.tecFrame, title, [-180, 180, -90, 90], self.tecMaps[0] / 10
+        self.readSelectedDate()
+        self.productName = self.mapChoice.get()
+        product, selectedDate = self.productName.split()[0], self.selectedDate
+        stepMinutes, days = self.stepMinutes(), self.spanDays()
+
+        if self.animationRun:
+            self.animations()
+        self.tecMaps, self.klobucharMaps, self.deltaMaps, self.deltaStats = None, None, None, None
+        self.compareMaps = None
+        self.clearAnomalies()
+        self.frameStep = stepMinutes
+        self.statsLabel.configure(text="")
+        self.slider.configure(state="disabled")
+        self.errorLabel.configure(text="")
+
+        load = self.pipeline.newLoad()
+        load.stage(
+            "tec",
+            lambda: self.services().tecCube(product, selectedDate, days, stepMinutes),
+            onReady=self.showTec,
+            onError=self.stageError("tec", f"No file for date {selectedDate}"),
+        )
+        load.stage(
+            "kp",
+            lambda: self.loadKpData(selectedDate),
+            onReady=self.showKpindex,
+            onError=self.stageError("kp", "error to get the data - no connection"),
+        )
+        load.stage(
+            "klobuchar",
+            lambda: self.services().klobucharCube(selectedDate, days, stepMinutes),
+            onReady=self.showKlobuchar,
+            onError=self.stageError("klobuchar", f"No navigation file for date {selectedDate}"),
+        )
+        load.stage(
+            "delta",
+            lambda tec, klobuchar: self.services().deltaCube(product, selectedDate, days, stepMinutes),
+            needs=["tec", "klobuchar"],
+            onReady=self.showDelta,
+            onError=self.stageError("delta", "failed to compute the delta maps"),
         )
-        self.slider.configure(state="normal")
 
-    def calcFileName(self):
+        if self.compareChoice.get():
+            products = [value.split()[0] for value in self.mapOption.cget("values")]
+            load.stage(
+                "compare",
+                lambda: self.services().comparison(products, selectedDate, days, stepMinutes),
+                onReady=self.showComparison,
+                onError=self.stageError("compare", "failed to compare the centres"),
+            )
+
+        if self.anomalyChoice.get():
+            self.addAnomalyStage(load, product, selectedDate, days, needs=["tec"])
+
+        if self.mapWidget is not None:
+            self.mapWidget.delete_all_marker()
+
+    def changeProduct(self, choice):
+        self.availabilityProduct = choice.split()[0]
+        self.date.clear_availability()
+        self.reloadIfLoading()
+
+    def dateAvailability(self, firstDate, lastDate):
+        # runs on the date picker's lookup thread
+        source = self.services()
+        return source.availability(self.availabilityProduct, firstDate, lastDate, self.kpService)
+
+    def reloadIfLoading(self, choice=None):
+        if self.pipeline.active():
+            self.showMaps()
+
+    def callbackFailed(self, name, error):
+        self.showError(f"{name}: failed to show the result ({error})")
+
+    def stageError(self, stage, message):
+        # onError of a pipeline stage, the label says which stage failed and why
+        return lambda error: self.showError(f"{stage}: {message} ({error})")
+
+    def showError(self, message):
+        text = self.errorLabel.cget("text")
+        self.errorLabel.configure(text=f"{text}\n{message}" if text else message)
+
+    def showTec(self, tecMaps):
+        self.tecMaps = tecMaps
+        self.frameIndex = 0
+        title = f"{self.productName} - {self.selectedDate}"
+        self.tecMap = self.createCanvas(self.tecFrame, self.tecMap, title, [-180, 180, -90, 90], self.tecMaps[0])
+        self.slider.configure(state="normal", to=len(self.tecMaps) - 1, number_of_steps=len(self.tecMaps) - 1)
+        self.slider.set(0)
+
+    def readSelectedDate(self):
+        # runs on the Tk thread before any stage, so nothing here may import the heavy modules
         self.selectedDate = self.date.get_date()
         dateObj = datetime.strptime(self.selectedDate, "%Y-%m-%d")
         self.year = dateObj.year
-        self.day = dateObj.timetuple().tm_yday
-        self.day = f"{self.day:03d}"
-        mapChoice = self.mapChoice.get().split()[0]
-        fileName = f"{mapChoice}0OPSRAP_{self.year}{self.day}0000_01D_02H_GIM.INX"
-        return fileName
+        self.day = f"{dateObj.timetuple().tm_yday:03d}"
 
-    def downloadAndExtract(self, url, saveFileName):
-        zipPath = os.path.join(self.downloadDir, saveFileName + ".gz")
-        savePath = os.path.join(self.downloadDir, saveFileName)
+    def stepMinutes(self):
+        return int(self.cadenceChoice.get().split()[0])
 
-        try:
-            self.errorLabel.configure(text="")
-            if os.path.exists(savePath):
-                return savePath
-            with requests.Session() as session:
-                response = session.get(url, stream=True, timeout=5)
-                if response.status_code != 200:
-                    self.errorLabel.configure(text=f"No file for date {self.selectedDate}")
-                    return None
-                with open(zipPath, "wb") as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        f.write(chunk)
-            with gzip.open(zipPath, "rb") as zipFile, open(savePath, "wb") as saveFile:
-                shutil.copyfileobj(zipFile, saveFile)
-            os.remove(zipPath)
-            return savePath
-        except Exception as e:
-            print(f"Error downloading: {e}")
-            return None
-
-    def getTecData(self, fileNamePath):
-        mapsData = []
-        currentRow, currentMap = [], []
-
-        with open(fileNamePath, "r") as file:
-            inBlock = False
-            for line in file:
-                if "START OF TEC MAP" in line:
-                    if currentMap:
-                        mapsData.append(np.array(currentMap))
-                    currentMap = []
-                elif "END OF TEC MAP" in line:
-                    if currentRow:
-                        currentMap.append(currentRow)
-                    currentRow = []
-                elif "LAT/LON1/LON2/DLON/H" in line:
-                    if currentRow:
-                        currentMap.append(currentRow)
-                    currentRow = []
-                    inBlock = True
-                elif inBlock:
-                    try:
-                        nums = [int(num) for num in line.split()]
-                        currentRow.extend(nums)
-                    except ValueError:
-                        continue
-            if currentMap:
-                mapsData.append(np.array(currentMap))
-                mapsData[12] = mapsData[12][:71, :73]
-        return self.interpolate(mapsData)
-
-    def interpolate(self, mapsData):
-        allMaps = []
-        for i in range(len(mapsData) - 1):
-            allMaps.append(mapsData[i])
-            for j in range(1, 8):
-                alpha = j / 8
-                interpolatedMap = (1 - alpha) * mapsData[i] + alpha * mapsData[i + 1]
-                allMaps.append(interpolatedMap)
-        return allMaps
+    def spanDays(self):
+        return int(self.spanChoice.get().split()[0])
 
     # animations
     def animations(self):
+        if self.tecMaps is None:
+            return
         if not self.animationRun:
             self.animationRun = True
             self.animationButton.configure(text="pause", fg_color="red")
+            self.resetFrameRate()
             self.startAnimation(int(self.slider.get()))
         else:
             self.animationRun = False
             self.animationButton.configure(text="start", fg_color="green")
             self.stopAnimation()
 
+    def resetFrameRate(self):
+        if self.frameRate is None:
+            from mapView import FrameRate
+
+            self.frameRate = FrameRate()
+        self.frameRate.reset()
+
     def startAnimation(self, index):
         if not self.animationRun:
             return
+        frameStart = time.perf_counter()
         if index > len(self.tecMaps) - 1:
             index = 0
         self.slider.set(index)
         self.updateMap(index)
-        self.animationId = self.root.after(50, lambda: self.startAnimation(index + 1))
+        self.frameRate.tick()
+        self.fpsLabel.configure(text=f"FPS: {self.frameRate.fps():.1f}")
+        delay = max(1, 50 - int((time.perf_counter() - frameStart) * 1000))
+        self.animationId = self.root.after(delay, lambda: self.startAnimation(index + 1))
 
     def stopAnimation(self):
         if self.animationId is not None:
@@ -255,244 +407,319 @@ class Gui:
             self.animationId = None
 
     def updateMap(self, index):
-        index = int(index)
-        self.meshTec.set_array((self.tecMaps[index] / 10).flatten())
-        self.tecCanvas.draw()
-        self.meshKlobuchar.set_array((self.klobucharMaps[int(index - 1)]))
-        self.klobucharCanvas.draw()
-        self.meshDelta.set_array((self.deltaMaps[index] / 10).flatten())
-        self.deltaCanvas.draw()
-
-        hours, minutes = divmod(index * 15, 60)
-        self.time.configure(text=f"Time: {hours:02}:{minutes:02}")
-
-    def showKpindex(self):
-        if self.kpIndexCanvas is not None:
-            self.kpIndexCanvas.get_tk_widget().destroy()
-            self.kpIndexCanvas = None
-            figKPindex, axKpindex = None, None
-
-        selectedDate = datetime.strptime(self.selectedDate, "%Y-%m-%d").date()
-        startDate = selectedDate - timedelta(days=3)
-        endDate = selectedDate + timedelta(days=3)
-        dateRange = [startDate + timedelta(days=i) for i in range((endDate - startDate).days + 1)]
-
-        matrixValues = self.downloadKpData(startDate, endDate)
-
-        times = ["00:00", "03:00", "06:00", "09:00", "12:00", "15:00", "18:00", "21:00"]
-        barWidth = 0.1
+        if self.tecMaps is None:
+            return
+        self.frameIndex = int(index)
+        self.drawVisibleMap()
 
-        figKPindex, axKpindex = plt.subplots(
-            figsize=(self.kpIndexFrame.winfo_width() / 100, self.kpIndexFrame.winfo_height() / 100), dpi=100
+        frameTime = datetime.strptime(self.selectedDate, "%Y-%m-%d") + timedelta(
+            minutes=self.frameIndex * self.frameStep
         )
-        br = np.arange(len(dateRange))
-        norm = Normalize(vmin=0, vmax=9)
-        cmap = matplotlib.colormaps["RdYlGn_r"]
-
-        for i, hour in enumerate(times):
-            barPositions = [x + barWidth * i for x in br]
-            hoursValues = [matrixValues[day][i] for day in range(len(dateRange))]
-            colors = [cmap(norm(v)) for v in hoursValues]
-            axKpindex.bar(barPositions, hoursValues, color=colors, edgecolor="grey", width=barWidth, label=hour)
-
-        axKpindex.set_ylabel("Kp Index")
-        axKpindex.set_xticks([r + barWidth * 3.5 for r in br])
-        axKpindex.set_xticklabels([d.strftime("%b %d") for d in dateRange])
-        axKpindex.set_title(f"kp index - dates {startDate} to {endDate}")
-        axKpindex.set_ylim(0, 9)
-        axKpindex.legend(title="Hours", handlelength=0, handletextpad=1, loc="upper right", bbox_to_anchor=(1.35, 1.1))
-
-        sm = ScalarMappable(norm=norm, cmap=cmap)
-        figKPindex.colorbar(sm, ax=axKpindex, label="Kp Index")
-
-        self.kpIndexCanvas = FigureCanvasTkAgg(figKPindex, master=self.kpIndexFrame)
+        timeFormat = "%H:%M" if len(self.tecMaps) * self.frameStep <= 24 * 60 else "%m-%d %H:%M"
+        self.time.configure(text=f"Time: {frameTime.strftime(timeFormat)}")
+        self.showStats()
+
+    @instrumentation.timed("render.updateMap")
+    def drawVisibleMap(self):
+        index = self.frameIndex
+        visibleTab = self.tabView.get()
+        if visibleTab == "TEC" and self.tecMaps is not None:
+            if self.anomalies is not None:
+                self.tecMap.setMarkers(*self.anomalyMarkers(index))
+            self.tecMap.setData(self.tecMaps[index])
+        elif visibleTab == "Klobuchar" and self.klobucharMaps is not None:
+            self.klobucharMap.setData(self.klobucharMaps[index])
+        elif visibleTab == "Delta TEC-klobuchar" and self.deltaMaps is not None:
+            self.deltaMap.setData(self.deltaMaps[index])
+        elif visibleTab == "Compare" and self.compareMaps is not None:
+            self.compareView.setData([cube[index] for cube in self.compareMaps])
+
+    @instrumentation.timed("render.kp")
+    def showKpindex(self, kpData):
+        startDate, endDate, matrixValues = kpData
+        if self.kpChart is None:
+            from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+            from matplotlib.figure import Figure
+            from kpChart import KpChart
+
+            fig = Figure(
+                figsize=(self.kpIndexFrame.winfo_width() / 100, self.kpIndexFrame.winfo_height() / 100), dpi=100
+            )
+            self.kpIndexCanvas = FigureCanvasTkAgg(fig, master=self.kpIndexFrame)
+            self.kpIndexCanvas.get_tk_widget().pack(expand=True, fill="both")
+            self.kpChart = KpChart(fig)
+        self.kpChart.update(startDate, matrixValues)
         self.kpIndexCanvas.draw()
-        self.kpIndexCanvas.get_tk_widget().pack(expand=True, fill="both")
-        plt.close(figKPindex)
 
-    def downloadKpData(self, startDate, endDate):
-        weekValues = []
-        dayValues = []
-        url = f"https://kp.gfz.de/kpdata?startdate={startDate}&enddate={endDate}&format=kp2#kpdatadownload-143"
-        try:
-            with urllib.request.urlopen(url) as response:
-                for line in response:
-                    line = line.decode("utf-8").strip()
-                    lineParts = line.split()
-                    dayValues.append(float(lineParts[7]))
-
-                    if len(dayValues) == 8:
-                        weekValues.append(dayValues)
-                        dayValues = []
-
-            if endDate >= date.today():
-                missingDays = (endDate - date.today()).days + 1
-                forecast = self.calcforecastDates()
-                for i in range(missingDays):
-                    weekValues.append(forecast[i])
-        except urllib.error.URLError:
-            self.errorLabel.configure(text="error to get the data - no connection")
-        return weekValues
-
-    def calcforecastDates(self):
-        day1, day2, day3 = [], [], []
-        url = "https://services.swpc.noaa.gov/text/3-day-forecast.txt"
-
-        with urllib.request.urlopen(url) as response:
-            for line in response:
-                line = line.decode("utf-8").strip()
-                if line.startswith(
-                    ("00-03UT", "03-06UT", "06-09UT", "09-12UT", "12-15UT", "15-18UT", "18-21UT", "21-00UT")
-                ):
-                    lineParts = line.split()
-                    parts = [part for part in lineParts if part.replace(".", "").isdigit()]
-                    [day.append(float(parts[i])) for i, day in enumerate([day1, day2, day3])]
-                if "Rationale" in line:
-                    break
-        return [day1, day2, day3]
-
-    def showKlobuchar(self):
-        files = self.calcKlobucharFileNames()
-
-        strYear = str(self.year)
-        baseurl = f"https://cddis.nasa.gov/archive/gnss/data/daily/{self.year}/{self.day}/{strYear[2:]}n"
-        for file in files:
-            url = f"{baseurl}/{file}"
-            saveFileName = file[:-3]
-
-            path = self.downloadAndExtract(url=url, saveFileName=saveFileName)
-            if path:
-                break
-        alpha, beta = self.readKlobucharData(path)
-        times = self.gpsSeconesByDate(self.selectedDate)
-
-        self.klobucharMaps = []
-        for seconds in times:
-            klobucharMap = self.calcKlobuchar(seconds, alpha, beta)
-            self.klobucharMaps.append(klobucharMap / 0.16)
+    def loadKpData(self, selectedDate):
+        selectedDate = datetime.strptime(selectedDate, "%Y-%m-%d").date()
+        startDate = selectedDate - timedelta(days=3)
+        endDate = selectedDate + timedelta(days=3)
+        self.services()
+        return startDate, endDate, self.kpService.kpValues(startDate, endDate)
 
+    def showKlobuchar(self, klobucharMaps):
+        self.klobucharMaps = klobucharMaps
         self.showKlobucharMap(self.klobucharMaps[0])
 
-    def calcKlobucharFileNames(self):
-        fileStartNames = []
-        with open("stationsName.txt", "r", encoding="utf-8") as r:
-            fileStartNames = [line.strip() for line in r]
-
-        files = []
-        for filestart in fileStartNames:
-            filename = f"{filestart}_R_{self.year}{self.day}0000_01D_GN.rnx.gz"
-            files.append(filename)
-        return files
-
-    def readKlobucharData(self, fileNamePath):
-        alpha, beta = [], []
-        with open(fileNamePath, "r") as file:
-            for line in file:
-                values = line.split()
-                if "GPSA" in line:
-                    alpha = [float(v) for v in values[1:5]]
-                elif "GPSB" in line:
-                    beta = [float(v) for v in values[1:5]]
-                if alpha and beta:
-                    break
-        return alpha, beta
-
-    def gpsSeconesByDate(self, selectedDate):
-        date = datetime.strptime(selectedDate, "%Y-%m-%d")
-        gpsStart = datetime(1980, 1, 6)
-
-        deltaDays = (date - gpsStart).days
-        dayOfWeek = deltaDays % 7
-        startSecondsOfDay = dayOfWeek * 86400
-        return [startSecondsOfDay + i * 900 for i in range(96)]
-
-    def createWorldPoints(self):
-        lat = np.linspace(87.5, -87.5, 71) / 180
-        lon = np.linspace(-180, 180, 73) / 180
-        return np.meshgrid(lon, lat)
-
-    def calcKlobuchar(self, seconds, alpha, beta):
-        lonPoints, latPoints = self.createWorldPoints()
-        elevation = np.radians(90)
-        azimuth = np.radians(0)
-        earthCentredAngle = (0.0137 / (elevation / np.pi + 0.11)) - 0.022
-        latIPP = latPoints + earthCentredAngle * np.cos(azimuth)
-        latIPP = np.clip(latIPP, -0.416, 0.416)
-        lonIPP = lonPoints + (earthCentredAngle * np.sin(azimuth) / np.cos(np.radians(latIPP)))
-        geomagneticLatIPP = latIPP + (0.064 * np.cos(lonIPP * np.pi - 1.617))
-        localTimes = (43200 * lonIPP + seconds) % 86400
-        A = sum(alpha[i] * geomagneticLatIPP**i for i in range(4))
-        A = np.maximum(A, 0)
-        P = sum(beta[i] * geomagneticLatIPP**i for i in range(4))
-        P = np.maximum(P, 72000)
-        Xi = (2 * np.pi * (localTimes - 50400)) / P
-        F = 1.0 + 16.0 * (0.53 - (np.radians(elevation))) ** 3
-        ionoDelay = np.where(np.abs(Xi) <= 1.57, (5e-9 + A * (1 - (Xi**2 / 2) + (Xi**4 / 24))) * F, 5e-9 * F)
-        return ionoDelay * 299792458
-
     def showKlobucharMap(self, map):
-        if self.klobucharCanvas is not None:
-            self.klobucharCanvas.get_tk_widget().destroy()
-            self.klobucharCanvas
-
         title = f"Klobuchar model - {self.selectedDate}"
-        self.klobucharCanvas, self.meshKlobuchar = self.createCanvas(
-            self.klobucharFrame, title, [-180, 180, -90, 90], map
-        )
+        self.klobucharMap = self.createCanvas(self.klobucharFrame, self.klobucharMap, title, [-180, 180, -90, 90], map)
 
-    def createCanvas(self, frame, title, extent, data, cmap="jet", label="tecu"):
-        fig, ax = plt.subplots(
-            figsize=(frame.winfo_width() / 100, frame.winfo_height() / 100),
-            dpi=100,
-            subplot_kw={"projection": ccrs.PlateCarree()},
-        )
-        ax.set_title(title)
-        ax.set_extent(extent, crs=ccrs.PlateCarree())
-        ax.add_feature(cfeature.BORDERS, edgecolor="black", linewidth=0.8)
-        ax.add_feature(cfeature.COASTLINE, edgecolor="black", linewidth=0.6)
-        mesh = ax.pcolormesh(
-            np.linspace(-180, 180, 73), np.linspace(87.5, -87.5, 71), data, cmap=cmap, shading="gouraud", alpha=0.9
-        )
-        fig.colorbar(mesh, ax=ax, orientation="vertical", label=label, pad=0.080)
-        ax.gridlines(draw_labels=True, color="black", linewidth=0.5, linestyle="--")
+    @instrumentation.timed("render.createCanvas")
+    def createCanvas(self, frame, mapView, title, extent, data, cmap="jet", label="tecu"):
+        if mapView is not None:
+            mapView.update(title, extent, data)
+            return mapView
+
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from mapView import MapView
+
+        fig = Figure(figsize=(frame.winfo_width() / 100, frame.winfo_height() / 100), dpi=100)
         canvas = FigureCanvasTkAgg(fig, master=frame)
+        mapView = MapView(canvas, title, extent, data, cmap=cmap, label=label)
         canvas.draw()
         canvas.get_tk_widget().pack(fill="both", expand=True)
-        plt.close(fig)
-        return canvas, mesh
+        return mapView
 
     def showArea(self, coords):
         lat, lon = coords
         self.mapWidget.delete_all_marker()
         self.mapWidget.set_marker(lat, lon, text="my choice")
         extent = [lon - 10, lon + 10, lat - 5, lat + 5]
+        self.showTimeSeries(lat, lon)
+        if self.deltaMaps is None:
+            return
 
-        self.tecCanvas.get_tk_widget().destroy()
-        title = f"{self.mapChoice.get()} - {self.selectedDate}"
-        self.tecCanvas, self.meshTec = self.createCanvas(
-            self.tecFrame, title=title, extent=extent, data=self.tecMaps[0] / 10
-        )
-        self.klobucharCanvas.get_tk_widget().destroy()
+        title = f"{self.productName} - {self.selectedDate}"
+        self.tecMap = self.createCanvas(self.tecFrame, self.tecMap, title, extent, self.tecMaps[self.frameIndex])
         title = f"klobuchar map - {self.selectedDate}"
-        self.klobucharCanvas, self.meshKlobuchar = self.createCanvas(
-            self.klobucharFrame, title=title, extent=extent, data=self.klobucharMaps[0]
+        self.klobucharMap = self.createCanvas(
+            self.klobucharFrame, self.klobucharMap, title, extent, self.klobucharMaps[self.frameIndex]
         )
-        self.deltaCanvas.get_tk_widget().destroy()
-        title = f"delta between tec and klobuchar {self.mapChoice.get()} - {self.selectedDate}"
-        self.deltaCanvas, self.meshDelta = self.createCanvas(
-            self.deltaFrame, title=title, extent=extent, data=self.deltaMaps[0] / 10
+        title = f"delta between tec and klobuchar {self.productName} - {self.selectedDate}"
+        self.deltaMap = self.createCanvas(
+            self.deltaFrame, self.deltaMap, title, extent, self.deltaMaps[self.frameIndex]
         )
 
-    def showDelta(self):
-        self.deltaMaps = np.array(self.tecMaps) - np.array(self.klobucharMaps)
-        if self.deltaCanvas is not None:
-            self.deltaCanvas.get_tk_widget().destroy()
-            self.deltaCanvas = None
+    def showTimeSeries(self, lat, lon):
+        if self.tecMaps is None:
+            return
+        import numpy as np
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from sampling import GridSampler, sampleFrames
+
+        weights = GridSampler().points(lat, lon)
+        hours = np.arange(len(self.tecMaps)) * self.frameStep / 60
+        series = [("TEC", self.tecMaps), ("Klobuchar", self.klobucharMaps), ("Delta", self.deltaMaps)]
+
+        if self.seriesCanvas is None:
+            fig = Figure(figsize=(self.seriesFrame.winfo_width() / 100, self.seriesFrame.winfo_height() / 100), dpi=100)
+            self.seriesCanvas = FigureCanvasTkAgg(fig, master=self.seriesFrame)
+            self.seriesCanvas.get_tk_widget().pack(fill="both", expand=True)
+            fig.add_subplot()
+        ax = self.seriesCanvas.figure.axes[0]
+        ax.clear()
+        for name, frames in series:
+            if frames is not None and len(frames) == len(hours):
+                ax.plot(hours, sampleFrames(weights, frames)[:, 0], label=name)
+        ax.set_title(f"{self.productName} at {lat:.2f}, {lon:.2f} - {self.selectedDate}")
+        ax.set_xlabel("hours since start of day")
+        ax.set_ylabel("tecu")
+        ax.grid(True, linestyle="--", linewidth=0.5)
+        ax.legend(loc="upper right")
+        self.seriesCanvas.draw()
+
+    def showDelta(self, delta):
+        self.deltaMaps, self.deltaStats = delta
+
+        title = f"delta between tec and klobuchar {self.productName} - {self.selectedDate}"
+        self.deltaMap = self.createCanvas(
+            self.deltaFrame, self.deltaMap, title, [-180, 180, -90, 90], self.deltaMaps[self.frameIndex]
+        )
+        self.showStats()
 
-        title = f"delta between tec and klobuchar {self.mapChoice.get()} - {self.selectedDate}"
-        self.deltaCanvas, self.meshDelta = self.createCanvas(
-            self.deltaFrame, title, [-180, 180, -90, 90], self.tecMaps[0] / 10
+    def showComparison(self, comparison):
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+        from matplotlib.figure import Figure
+        from mapView import CompareView
+
+        cubes = comparison["cubes"]
+        for product, error in comparison["errors"].items():
+            self.showError(f"compare: No {product} file for date {self.selectedDate} ({error})")
+        if not cubes:
+            return
+        differences = comparison["differences"]
+        titles = [f"{product} - {self.selectedDate}" for product in cubes] + list(differences)
+        self.compareMaps = list(cubes.values()) + list(differences.values())
+        cmaps = ["jet"] * len(cubes) + ["RdBu_r"] * len(differences)
+
+        if self.compareCanvas is None:
+            fig = Figure(
+                figsize=(self.compareFrame.winfo_width() / 100, self.compareFrame.winfo_height() / 100), dpi=100
+            )
+            self.compareCanvas = FigureCanvasTkAgg(fig, master=self.compareFrame)
+            self.compareCanvas.get_tk_widget().pack(fill="both", expand=True)
+        if self.compareView is not None:
+            self.compareView.close()
+        index = min(self.frameIndex, len(self.compareMaps[0]) - 1)
+        maps = [cube[index] for cube in self.compareMaps]
+        self.compareView = CompareView(
+            self.compareCanvas, titles, maps, comparison["limits"], cmaps, columns=len(cubes)
         )
+        self.compareCanvas.draw()
+
+    def addAnomalyStage(self, load, product, selectedDate, days, needs=()):
+        load.stage(
+            "anomalies",
+            lambda *ready: self.loadAnomalies(product, selectedDate, days),
+            needs=needs,
+            onReady=self.showAnomalies,
+            onError=self.stageError("anomalies", "failed to detect TEC anomalies"),
+        )
+
+    def toggleAnomalies(self):
+        if not self.anomalyChoice.get():
+            self.clearAnomalies()
+            self.drawVisibleMap()
+        elif self.pipeline.active():
+            self.showMaps()
+        elif self.tecMaps is not None:
+            product, days = self.productName.split()[0], len(self.tecMaps) * self.frameStep // (24 * 60)
+            self.addAnomalyStage(self.pipeline.newLoad(), product, self.selectedDate, days)
+
+    def loadAnomalies(self, product, selectedDate, days):
+        # flagged cells of the span against their 27 day baseline, joined with the Kp of each three hour slot
+        import numpy as np
+        from anomaly import SLOT_MINUTES, dayStartOf, eventSummary
+        from network import NetworkError
+
+        events, lats, lons = self.services().anomalies(product, selectedDate, days)
+        firstDate = datetime.strptime(selectedDate, "%Y-%m-%d").date()
+        try:
+            kpValues = self.kpService.kpValues(firstDate, firstDate + timedelta(days=days - 1))
+        except NetworkError:
+            kpValues = np.full((days, 8), np.nan)
+        markers = {}
+        for epoch in np.unique(events["epoch"]):
+            cells = events[events["epoch"] == epoch]
+            colors = np.where(cells["deviation"] > 0, "magenta", "cyan")
+            markers[int(epoch)] = (lats[cells["lat"]], lons[cells["lon"]], list(colors))
+        summary = eventSummary(events, firstDate, kpValues)
+        return {"summary": summary, "markers": markers, "start": dayStartOf(firstDate), "slot": SLOT_MINUTES * 60}
+
+    def showAnomalies(self, anomalies):
+        self.anomalies = anomalies
+        summary = anomalies["summary"]
+        if not len(summary["epochs"]):
+            self.anomalyLabel.configure(text="no TEC anomalies, or too few archived days for a baseline")
+        else:
+            correlation = summary["kpCorrelation"]
+            text = f"{summary['cells'].sum()} anomalous cells in {len(summary['epochs'])} epochs"
+            text += f", {summary['stormEpochs']} at Kp >= 5"
+            if correlation == correlation:
+                text += f", r(Kp) {correlation:.2f}"
+            self.anomalyLabel.configure(text=text)
+        self.drawVisibleMap()
+
+    def clearAnomalies(self):
+        self.anomalies = None
+        self.anomalyLabel.configure(text="")
+        if self.tecMap is not None:
+            self.tecMap.setMarkers([], [], [])
+
+    def anomalyMarkers(self, index):
+        # cells flagged in the baseline slot nearest to the frame, enhancements magenta, depletions cyan
+        start, slot = self.anomalies["start"], self.anomalies["slot"]
+        slotEpoch = start + round(index * self.frameStep * 60 / slot) * slot
+        return self.anomalies["markers"].get(slotEpoch, ([], [], []))
+
+    def exportVisible(self):
+        tab = self.tabView.get()
+        cubes = {"TEC": self.tecMaps, "Klobuchar": self.klobucharMaps, "Delta TEC-klobuchar": self.deltaMaps}
+        cube = cubes.get(tab)
+        if cube is None:
+            self.showError("load maps and open the TEC, Klobuchar or delta tab to export")
+            return
+
+        fmt = self.exportChoice.get().lower()
+        name = f"{self.productName.split()[0]}_{self.selectedDate}_{tab.split()[0]}"
+        exportDir = os.path.join(os.getcwd(), "exports")
+        os.makedirs(exportDir, exist_ok=True)
+        outPath = os.path.join(exportDir, name if fmt == "png" else f"{name}.{fmt}")
+        title = f"{tab} {self.productName.split()[0]}"
+        startTime, stepMinutes = datetime.strptime(self.selectedDate, "%Y-%m-%d"), self.frameStep
+        symmetric = tab == "Delta TEC-klobuchar"
+
+        self.exportButton.configure(state="disabled", text="exporting...")
+        load = self.exportPipeline.newLoad()
+        load.stage(
+            "export",
+            lambda: self.runExport(cube, outPath, fmt, title, startTime, stepMinutes, symmetric),
+            onReady=self.exportDone,
+            onError=lambda e: self.exportDone(None, e),
+        )
+
+    def runExport(self, cube, outPath, fmt, title, startTime, stepMinutes, symmetric):
+        from export import exportFrames
+
+        return exportFrames(
+            cube, outPath, fmt, title=title, startTime=startTime, stepMinutes=stepMinutes, symmetric=symmetric
+        )
+
+    def exportDone(self, path, error=None):
+        self.exportButton.configure(state="normal", text="export animation")
+        if error is not None:
+            self.showError(f"export: failed ({error})")
+            return
+        self.fpsLabel.configure(text=f"saved {os.path.basename(path)}")
+
+    def toggleOverlay(self):
+        instrumentation.enable(self.overlayChoice.get())
+        if not self.overlayChoice.get():
+            if self.overlayId is not None:
+                self.root.after_cancel(self.overlayId)
+                self.overlayId = None
+            if self.overlayLabel is not None:
+                self.overlayLabel.place_forget()
+            return
+        if self.overlayLabel is None:
+            self.overlayLabel = ctk.CTkLabel(
+                self.tabView, text="", font=ctk.CTkFont(family="Courier", size=12), justify="left", fg_color="black"
+            )
+        self.overlayLabel.place(relx=1.0, rely=0.0, x=-20, y=50, anchor="ne")
+        self.refreshOverlay()
+
+    def refreshOverlay(self):
+        # stage, last ms, mean ms and calls, then the product cache hits, refreshed twice a second while it is on
+        fps = f"FPS: {self.frameRate.fps():.1f}" if self.frameRate is not None else "FPS: -"
+        text = f"{instrumentation.summary() or 'no stages timed yet'}\n{fps}"
+        if self.productSource is not None and self.productSource.productCache is not None:
+            cache = self.productSource.productCache.stats()
+            text += f"\ncache: {cache['hits']} hits, {cache['misses']} misses ({cache['hitRate']:.0%})"
+            text += f", {cache['evictions']} evicted, {cache['bytes'] / 2**20:.1f} MiB"
+        self.overlayLabel.configure(text=text)
+        self.overlayId = self.root.after(500, self.refreshOverlay)
+
+    def saveTrace(self):
+        traceDir = os.path.join(os.getcwd(), "exports")
+        os.makedirs(traceDir, exist_ok=True)
+        path = os.path.join(traceDir, f"trace_{datetime.now():%Y%m%d_%H%M%S}.json")
+        try:
+            instrumentation.exportTrace(path)
+        except OSError as e:
+            self.showError(f"trace: could not save ({e})")
+            return
+        self.fpsLabel.configure(text=f"saved {os.path.basename(path)}")
+
+    def showStats(self):
+        if self.deltaStats is None:
+            return
+        index = self.frameIndex
+        bias, rms, maxAbs = (self.deltaStats[name][index] for name in ["bias", "rms", "maxAbs"])
+        self.statsLabel.configure(text=f"delta bias {bias:.1f}, rms {rms:.1f}, max {maxAbs:.1f} tecu")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,139 @@
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+
+from atomicFile import writeJson
+
+NO_TIMER = nullcontext()
+
+enabled = os.environ.get("IONO_TRACE") == "1"
+
+
+class StageTimes:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.last = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.last = seconds
+        self.max = max(self.max, seconds)
+
+
+class Recorder:
+    def __init__(self, maxEvents=100000):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.events = deque(maxlen=maxEvents)
+        self.stages = {}
+        self.counters = {}
+
+    def record(self, name, start, end):
+        with self.lock:
+            self.events.append((name, start, end, threading.get_ident()))
+            self.stages.setdefault(name, StageTimes()).add(end - start)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        with self.lock:
+            self.events.clear()
+            self.stages.clear()
+            self.counters.clear()
+
+
+recorder = Recorder()
+
+
+class Timer:
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        recorder.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+def enable(on=True):
+    global enabled
+    enabled = on
+
+
+def timer(name):
+    # with timer("parse.ionex"): ..., a shared no-op context when tracing is off
+    return Timer(name) if enabled else NO_TIMER
+
+
+def timed(name):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                recorder.record(name, start, time.perf_counter())
+
+        return wrapper
+
+    return decorator
+
+
+def count(name, amount=1):
+    if enabled:
+        recorder.count(name, amount)
+
+
+def stats():
+    with recorder.lock:
+        result = {
+            name: {
+                "count": stage.count,
+                "lastMs": stage.last * 1000,
+                "meanMs": stage.total / stage.count * 1000,
+                "maxMs": stage.max * 1000,
+            }
+            for name, stage in recorder.stages.items()
+        }
+        return result, dict(recorder.counters)
+
+
+def summary():
+    stages, counters = stats()
+    lines = [f"{name:<22}{s['lastMs']:>8.1f}{s['meanMs']:>8.1f} ms x{s['count']}" for name, s in sorted(stages.items())]
+    lines += [f"{name:<22}{value:>8}" for name, value in sorted(counters.items())]
+    return "\n".join(lines)
+
+
+def exportTrace(path):
+    # Chrome trace event format, opens in chrome://tracing or Perfetto
+    with recorder.lock:
+        events = [
+            {
+                "name": name,
+                "cat": name.split(".")[0],
+                "ph": "X",
+                "ts": (start - recorder.origin) * 1e6,
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": thread,
+            }
+            for name, start, end, thread in recorder.events
+        ]
+        counters = dict(recorder.counters)
+    writeJson(path, {"traceEvents": events, "counters": counters})
+    return path
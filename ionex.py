@@ -0,0 +1,180 @@
+import re
+from datetime import datetime, timezone
+
+import numpy as np
+
+from instrumentation import timed
+
+FIELD_WIDTH = 5
+FIELDS_PER_LINE = 16
+LINE_WIDTH = FIELD_WIDTH * FIELDS_PER_LINE
+MISSING_VALUE = 9999
+
+ROW_LABEL = b"LAT/LON1/LON2/DLON/H"
+POWERS = (10.0 ** np.arange(FIELD_WIDTH - 1, -1, -1)).astype(np.float32)
+
+
+class IonexData:
+    def __init__(self, lats, lons, epochs, interval, exponent, tec, tecExponents, rms=None, rmsExponents=None):
+        self.lats = lats
+        self.lons = lons
+        self.epochs = epochs
+        self.interval = interval
+        self.exponent = exponent
+        self.tec = tec
+        self.tecExponents = tecExponents
+        self.rms = rms
+        self.rmsExponents = rmsExponents
+
+    @property
+    def shape(self):
+        return self.tec.shape
+
+    def tecu(self):
+        return scaleMaps(self.tec, self.tecExponents)
+
+    def rmsTecu(self):
+        if self.rms is None:
+            return None
+        return scaleMaps(self.rms, self.rmsExponents)
+
+    def toArrays(self):
+        arrays = {
+            "lats": self.lats,
+            "lons": self.lons,
+            "epochs": np.array(
+                [e.replace(tzinfo=timezone.utc).timestamp() if e else np.nan for e in self.epochs], dtype=np.float64
+            ),
+            "interval": np.array(self.interval),
+            "exponent": np.array(self.exponent),
+            "tec": self.tec,
+            "tecExponents": self.tecExponents,
+        }
+        if self.rms is not None:
+            arrays["rms"] = self.rms
+            arrays["rmsExponents"] = self.rmsExponents
+        return arrays
+
+    @classmethod
+    def fromArrays(cls, arrays):
+        epochs = [
+            None if np.isnan(e) else datetime.fromtimestamp(e, timezone.utc).replace(tzinfo=None)
+            for e in arrays["epochs"]
+        ]
+        return cls(
+            arrays["lats"],
+            arrays["lons"],
+            epochs,
+            int(arrays["interval"]),
+            int(arrays["exponent"]),
+            arrays["tec"],
+            arrays["tecExponents"],
+            arrays.get("rms"),
+            arrays.get("rmsExponents"),
+        )
+
+
+def scaleMaps(values, exponents):
+    scale = (10.0**exponents).astype(np.float32)[:, None, None]
+    maps = values.astype(np.float32) * scale
+    maps[values == MISSING_VALUE] = np.nan
+    return maps
+
+
+@timed("parse.ionex")
+def readIonex(fileNamePath, readRms=True):
+    with open(fileNamePath, "rb") as file:
+        data = file.read()
+
+    headerEnd = data.find(b"END OF HEADER")
+    if headerEnd < 0:
+        raise ValueError(f"{fileNamePath} is not an IONEX file (no END OF HEADER)")
+    header = parseHeader(data[:headerEnd])
+
+    lats = gridAxis(*header["LAT1 / LAT2 / DLAT"])
+    lons = gridAxis(*header["LON1 / LON2 / DLON"])
+    exponent = int(header.get("EXPONENT", [-1])[0])
+    interval = int(header.get("INTERVAL", [0])[0])
+
+    tec, tecExponents, epochs = readMaps(data, headerEnd, b"TEC", len(lats), len(lons), exponent)
+    rms, rmsExponents = None, None
+    if readRms and data.find(b"START OF RMS MAP", headerEnd) >= 0:
+        rms, rmsExponents, _ = readMaps(data, headerEnd, b"RMS", len(lats), len(lons), exponent)
+
+    if not interval and len(epochs) > 1:
+        interval = int((epochs[1] - epochs[0]).total_seconds())
+
+    return IonexData(lats, lons, epochs, interval, exponent, tec, tecExponents, rms, rmsExponents)
+
+
+def parseHeader(headerBytes):
+    header = {}
+    for line in headerBytes.decode("ascii", errors="replace").splitlines():
+        label = line[60:].strip()
+        if label in ("LAT1 / LAT2 / DLAT", "LON1 / LON2 / DLON", "HGT1 / HGT2 / DHGT", "EXPONENT", "INTERVAL"):
+            header[label] = [float(v) for v in line[:60].split()]
+        elif label == "# OF MAPS IN FILE":
+            header[label] = [int(line[:60].split()[0])]
+    return header
+
+
+def gridAxis(start, stop, step):
+    count = int(round((stop - start) / step)) + 1
+    return np.linspace(start, stop, count)
+
+
+def readMaps(data, headerEnd, kind, nLat, nLon, exponent):
+    linesPerRow = -(-nLon // FIELDS_PER_LINE)
+    starts = [m.end() for m in re.finditer(b"START OF " + kind + b" MAP", data[headerEnd:])]
+    ends = [m.start() for m in re.finditer(b"END OF " + kind + b" MAP", data[headerEnd:])]
+    if len(starts) != len(ends):
+        raise ValueError(f"unbalanced {kind.decode()} map blocks")
+
+    dataLines, exponents, epochs = [], [], []
+    for start, end in zip(starts, ends):
+        start, end = start + headerEnd, end + headerEnd
+        firstRow = data.find(ROW_LABEL, start, end)
+        firstRow = data.rfind(b"\n", start, firstRow) + 1
+        lastLine = data.rfind(b"\n", start, end) + 1
+
+        blockHeader = data[start:firstRow].decode("ascii", errors="replace")
+        exponents.append(blockExponent(blockHeader, exponent))
+        epochs.append(blockEpoch(blockHeader))
+
+        lines = data[firstRow:lastLine].splitlines()
+        if len(lines) == nLat * (linesPerRow + 1):
+            lines = [line for i, line in enumerate(lines) if i % (linesPerRow + 1)]
+        else:
+            lines = [line for line in lines if ROW_LABEL not in line]
+        if len(lines) != nLat * linesPerRow:
+            raise ValueError(f"{kind.decode()} map at offset {start} has {len(lines)} data lines")
+        dataLines.extend(lines)
+
+    values = decodeFields(dataLines)
+    values = values.reshape(len(starts), nLat, linesPerRow * FIELDS_PER_LINE)[:, :, :nLon]
+    return np.ascontiguousarray(values), np.array(exponents, dtype=np.int32), epochs
+
+
+def decodeFields(lines):
+    buffer = b"".join(line[:LINE_WIDTH].ljust(LINE_WIDTH) for line in lines)
+    chars = np.frombuffer(buffer, dtype=np.uint8).reshape(-1, FIELD_WIDTH)
+    digits = chars - np.uint8(ord("0"))
+    digits[digits > 9] = 0
+    values = digits.astype(np.float32) @ POWERS
+    negative = (chars == ord("-")).astype(np.float32) @ np.ones(FIELD_WIDTH, dtype=np.float32)
+    values[negative > 0] *= -1
+    return values.astype(np.int16)
+
+
+def blockExponent(blockHeader, default):
+    for line in blockHeader.splitlines():
+        if line[60:].strip() == "EXPONENT":
+            return int(line[:60].split()[0])
+    return default
+
+
+def blockEpoch(blockHeader):
+    for line in blockHeader.splitlines():
+        if line[60:].strip() == "EPOCH OF CURRENT MAP":
+            return datetime(*[int(v) for v in line[:60].split()[:6]])
+    return None
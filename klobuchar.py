@@ -0,0 +1,81 @@
+from functools import lru_cache
+
+import numpy as np
+
+from instrumentation import timed
+
+SPEED_OF_LIGHT = 299792458
+
+
+@lru_cache(maxsize=8)
+def worldPoints(nLat=71, nLon=73):
+    lat = np.linspace(87.5, -87.5, nLat) / 180
+    lon = np.linspace(-180, 180, nLon) / 180
+    lonPoints, latPoints = np.meshgrid(lon, lat)
+    lonPoints.setflags(write=False)
+    latPoints.setflags(write=False)
+    return lonPoints, latPoints
+
+
+def piercePoints(latPoints, lonPoints, elevation, azimuth):
+    # lat/lon in semicircles, elevation/azimuth in radians, any broadcastable shapes
+    earthCentredAngle = (0.0137 / (elevation / np.pi + 0.11)) - 0.022
+    latIPP = latPoints + earthCentredAngle * np.cos(azimuth)
+    latIPP = np.clip(latIPP, -0.416, 0.416)
+    lonIPP = lonPoints + (earthCentredAngle * np.sin(azimuth) / np.cos(latIPP * np.pi))
+    return latIPP, lonIPP
+
+
+def klobucharTerms(latPoints, lonPoints, elevation, azimuth, alpha, beta):
+    latIPP, lonIPP = piercePoints(latPoints, lonPoints, elevation, azimuth)
+    # ICD-GPS-200 terms are in semicircles, including the 1.617 pole offset and the elevation in F
+    geomagneticLatIPP = latIPP + (0.064 * np.cos((lonIPP - 1.617) * np.pi))
+
+    A = np.polynomial.polynomial.polyval(geomagneticLatIPP, alpha)
+    A = np.maximum(A, 0)
+    P = np.polynomial.polynomial.polyval(geomagneticLatIPP, beta)
+    P = np.maximum(P, 72000)
+    F = 1.0 + 16.0 * (0.53 - elevation / np.pi) ** 3
+    lonTime = 43200 * lonIPP
+    phaseScale = 2 * np.pi / P
+    amplitude = A * F * SPEED_OF_LIGHT
+    nightDelay = 5e-9 * F * SPEED_OF_LIGHT
+    terms = np.broadcast_arrays(lonTime, phaseScale, amplitude, nightDelay)
+    return [np.ascontiguousarray(term, dtype=np.float32) for term in terms]
+
+
+def klobucharDelay(terms, seconds):
+    lonTime, phaseScale, amplitude, nightDelay = terms
+    Xi = lonTime + np.mod(seconds, 86400)
+    Xi -= 86400 * (Xi >= 86400)
+    Xi += 86400 * (Xi < 0)
+    Xi -= 50400
+    Xi *= phaseScale
+    day = np.abs(Xi) <= 1.57
+    Xi *= Xi
+    cosine = Xi * (Xi / 24 - 0.5) + 1
+    cosine *= amplitude
+    cosine *= day
+    cosine += nightDelay
+    return cosine
+
+
+class KlobucharModel:
+    def __init__(self, alpha, beta, elevation=90.0, azimuth=0.0, nLat=71, nLon=73):
+        lonPoints, latPoints = worldPoints(nLat, nLon)
+        self.shape = lonPoints.shape
+        self.terms = klobucharTerms(
+            latPoints, lonPoints, np.radians(elevation), np.radians(azimuth), np.asarray(alpha), np.asarray(beta)
+        )
+
+    @timed("compute.klobuchar")
+    def cube(self, seconds, chunk=96):
+        seconds = np.asarray(seconds, dtype=np.float64) % 86400
+        cube = np.empty((len(seconds),) + self.shape, dtype=np.float32)
+        for start in range(0, len(seconds), chunk):
+            epochs = seconds[start : start + chunk, None, None].astype(np.float32)
+            cube[start : start + chunk] = klobucharDelay(self.terms, epochs)
+        return cube
+
+    def map(self, seconds):
+        return self.cube([seconds])[0]
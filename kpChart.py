@@ -0,0 +1,49 @@
+from datetime import timedelta
+
+import matplotlib
+import numpy as np
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import Normalize
+
+BAR_WIDTH = 0.1
+SLOTS_PER_DAY = 8
+MAX_TICKS = 15
+
+
+def barVertices(values, barWidth=BAR_WIDTH):
+    # (days, 8) -> one rectangle per three-hour slot, slot i of day d centred on d + i * barWidth
+    days, slots = np.indices(values.shape)
+    centres = (days + slots * barWidth).ravel()
+    heights = np.nan_to_num(values.ravel(), nan=0.0)
+    left, right = centres - barWidth / 2, centres + barWidth / 2
+    vertices = np.empty((len(centres), 4, 2))
+    vertices[:, :, 0] = np.stack([left, left, right, right], axis=1)
+    vertices[:, :, 1] = np.stack([np.zeros_like(heights), heights, heights, np.zeros_like(heights)], axis=1)
+    return vertices
+
+
+class KpChart:
+    def __init__(self, fig, cmap="RdYlGn_r"):
+        self.ax = fig.add_subplot()
+        self.bars = PolyCollection(
+            [], cmap=matplotlib.colormaps[cmap], norm=Normalize(vmin=0, vmax=9), edgecolor="grey", linewidth=0.5
+        )
+        self.ax.add_collection(self.bars)
+        fig.colorbar(self.bars, ax=self.ax, label="Kp Index")
+        self.ax.set_ylabel("Kp Index")
+        self.ax.set_xlabel("bars from 00 to 21 UT in 3 hour steps")
+        self.ax.set_ylim(0, 9)
+
+    def update(self, startDate, values):
+        values = np.asarray(values, dtype=np.float64).reshape(-1, SLOTS_PER_DAY)
+        nDays = len(values)
+        self.bars.set_verts(barVertices(values))
+        self.bars.set_array(values.ravel())
+
+        tickStep = max(1, -(-nDays // MAX_TICKS))
+        ticks = np.arange(0, nDays, tickStep)
+        self.ax.set_xticks(ticks + BAR_WIDTH * 3.5)
+        self.ax.set_xticklabels([(startDate + timedelta(days=int(day))).strftime("%b %d") for day in ticks])
+        self.ax.set_xlim(-BAR_WIDTH, nDays - 1 + BAR_WIDTH * SLOTS_PER_DAY)
+        endDate = startDate + timedelta(days=nDays - 1)
+        self.ax.set_title(f"kp index - dates {startDate} to {endDate}")
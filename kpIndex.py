@@ -0,0 +1,185 @@
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from atomicFile import writeJson
+from instrumentation import timed
+from network import sharedClient
+
+KP_URL = "https://kp.gfz.de/kpdata"
+FORECAST_URL = "https://services.swpc.noaa.gov/text/3-day-forecast.txt"
+FORECAST_SLOTS = ("00-03UT", "03-06UT", "06-09UT", "09-12UT", "12-15UT", "15-18UT", "18-21UT", "21-00UT")
+MISSING_KP = float("nan")
+
+
+@timed("download.kp")
+def fetchKpDays(startDate, endDate, baseUrl=KP_URL, timeout=10, client=None):
+    # {date: ([8 three-hourly values], definitive)}, partial days are left out
+    slots, definitive = {}, {}
+    url = f"{baseUrl}?startdate={startDate}&enddate={endDate}&format=kp2#kpdatadownload-143"
+    lines, _ = (client or sharedClient()).lines(url, timeout=timeout)
+    for line in lines:
+        lineParts = line.split()
+        if len(lineParts) < 8 or lineParts[0].startswith("#"):
+            continue
+        day = date(int(lineParts[0]), int(lineParts[1]), int(lineParts[2]))
+        slots.setdefault(day, {})[int(float(lineParts[3])) // 3] = float(lineParts[7])
+        definitive[day] = definitive.get(day, True) and (len(lineParts) < 10 or lineParts[9] != "0")
+
+    return {
+        day: ([values[slot] for slot in range(8)], definitive[day]) for day, values in slots.items() if len(values) == 8
+    }
+
+
+@timed("download.kpForecast")
+def fetchForecast(url=FORECAST_URL, timeout=10, client=None, validators=None):
+    # (three days of eight values, validators), days is None when NOAA answered 304 Not Modified
+    lines, validators = (client or sharedClient()).lines(url, validators, timeout=timeout)
+    if lines is None:
+        return None, validators
+    return parseForecast(lines), validators
+
+
+def parseForecast(lines):
+    day1, day2, day3 = [], [], []
+    for line in lines:
+        line = line.strip()
+        if line.startswith(FORECAST_SLOTS):
+            lineParts = line.split()
+            parts = [part for part in lineParts if part.replace(".", "").isdigit()]
+            [day.append(float(parts[i])) for i, day in enumerate([day1, day2, day3])]
+        if "Rationale" in line:
+            break
+    return [day1, day2, day3]
+
+
+def dayRange(startDate, endDate):
+    return [startDate + timedelta(days=i) for i in range((endDate - startDate).days + 1)]
+
+
+class KpService:
+    def __init__(
+        self,
+        storePath,
+        baseUrl=KP_URL,
+        forecastUrl=FORECAST_URL,
+        forecastTtl=3600,
+        nowcastTtl=3 * 3600,
+        timeout=10,
+        client=None,
+    ):
+        self.storePath = storePath
+        self.baseUrl = baseUrl
+        self.forecastUrl = forecastUrl
+        self.forecastTtl = forecastTtl
+        self.nowcastTtl = nowcastTtl
+        self.timeout = timeout
+        self.client = client
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.store = self.loadStore()
+
+    def loadStore(self):
+        try:
+            with open(self.storePath, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"days": {}, "forecast": None}
+
+    def saveStore(self):
+        writeJson(self.storePath, self.store)
+
+    def today(self):
+        return datetime.now(timezone.utc).date()
+
+    def stale(self, day):
+        # definitive values never change, nowcast values are revised until GFZ publishes the final ones
+        entry = self.store["days"].get(day.isoformat())
+        if entry is None:
+            return True
+        return not entry["definitive"] and time.time() - entry["fetched"] > self.nowcastTtl
+
+    def missingRuns(self, days):
+        runs = []
+        for day in days:
+            if not self.stale(day):
+                continue
+            if runs and runs[-1][1] == day - timedelta(days=1):
+                runs[-1][1] = day
+            else:
+                runs.append([day, day])
+        return runs
+
+    def updateObserved(self, days):
+        changed = False
+        for startDate, endDate in self.missingRuns(days):
+            self.requests += 1
+            fetched = time.time()
+            observed = fetchKpDays(startDate, endDate, self.baseUrl, self.timeout, self.client)
+            for day in dayRange(startDate, endDate):
+                # days GFZ has not published yet are remembered too, so they are retried on the nowcast TTL
+                values, definitive = observed.get(day, (None, False))
+                self.store["days"][day.isoformat()] = {"kp": values, "definitive": definitive, "fetched": fetched}
+                changed = True
+        return changed
+
+    def updateForecast(self):
+        forecast = self.store["forecast"]
+        if forecast is not None and time.time() - forecast["fetched"] <= self.forecastTtl:
+            return False
+        self.requests += 1
+        validators = forecast.get("validators") if forecast is not None else None
+        days, validators = fetchForecast(self.forecastUrl, self.timeout, self.client, validators)
+        if days is None:
+            # unchanged on the server, the stored days keep their start date
+            forecast["fetched"] = time.time()
+        else:
+            start = self.today().isoformat()
+            self.store["forecast"] = {"fetched": time.time(), "start": start, "days": days, "validators": validators}
+        return True
+
+    def forecastValues(self, day):
+        forecast = self.store["forecast"]
+        index = (day - date.fromisoformat(forecast["start"])).days
+        if 0 <= index < len(forecast["days"]) and len(forecast["days"][index]) == 8:
+            return forecast["days"][index]
+        return [MISSING_KP] * 8
+
+    def availability(self, days):
+        # "local" once stored, "upstream" while GFZ or the three day forecast can still provide it
+        with self.lock:
+            today = self.today()
+            result = {}
+            for day in days:
+                entry = self.store["days"].get(day.isoformat())
+                if day < today and entry is not None and entry["kp"] is not None:
+                    result[day] = "local"
+                elif day <= today + timedelta(days=2):
+                    result[day] = "upstream"
+                else:
+                    result[day] = "missing"
+            return result
+
+    def kpValues(self, startDate, endDate):
+        # one row of eight three-hourly values per day, days from today on come from the forecast
+        with self.lock:
+            today = self.today()
+            days = dayRange(startDate, endDate)
+            changed = self.updateObserved([day for day in days if day < today])
+            if endDate >= today:
+                changed = self.updateForecast() or changed
+            if changed:
+                self.saveStore()
+
+            values = []
+            for day in days:
+                entry = self.store["days"].get(day.isoformat())
+                if day >= today:
+                    values.append(self.forecastValues(day))
+                elif entry is not None and entry["kp"] is not None:
+                    values.append(entry["kp"])
+                else:
+                    values.append([MISSING_KP] * 8)
+            return values
@@ -0,0 +1,158 @@
+import time
+from collections import deque
+
+import cartopy.crs as ccrs
+import cartopy.feature as cfeature
+import numpy as np
+
+
+def drawMap(fig, title, extent, data, cmap="jet", label="tecu", position=(1, 1, 1), vmin=None, vmax=None):
+    ax = fig.add_subplot(*position, projection=ccrs.PlateCarree())
+    ax.set_title(title)
+    ax.set_extent(extent, crs=ccrs.PlateCarree())
+    borders = ax.add_feature(cfeature.BORDERS, edgecolor="black", linewidth=0.8)
+    coastline = ax.add_feature(cfeature.COASTLINE, edgecolor="black", linewidth=0.6)
+    mesh = ax.pcolormesh(
+        np.linspace(-180, 180, 73),
+        np.linspace(87.5, -87.5, 71),
+        data,
+        cmap=cmap,
+        shading="gouraud",
+        alpha=0.9,
+        vmin=vmin,
+        vmax=vmax,
+    )
+    fig.colorbar(mesh, ax=ax, orientation="vertical", label=label, pad=0.080)
+    ax.gridlines(draw_labels=True, color="black", linewidth=0.5, linestyle="--")
+    return ax, mesh, [borders, coastline]
+
+
+class BlitMesh:
+    def __init__(self, canvas, ax, mesh, overlays=(), features=()):
+        self.canvas = canvas
+        self.ax = ax
+        self.mesh = mesh
+        self.overlays = list(overlays)
+        self.features = list(features)
+        self.featureLayer = None
+        self.background = None
+
+        for artist in [self.mesh, *self.overlays, *self.features]:
+            artist.set_animated(True)
+        self.drawId = self.canvas.mpl_connect("draw_event", self.onDraw)
+
+    def disconnect(self):
+        self.canvas.mpl_disconnect(self.drawId)
+
+    def onDraw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.captureFeatures()
+        self.drawAnimated()
+
+    def captureFeatures(self):
+        # borders and coastline are rasterized once per full draw onto a transparent layer above the mesh,
+        # a frame only composites that layer instead of drawing every feature path again
+        if not self.features:
+            return
+        from matplotlib.backends.backend_agg import RendererAgg
+
+        width, height = self.canvas.get_width_height(physical=True)
+        renderer = RendererAgg(width, height, self.canvas.figure.dpi)
+        for artist in self.features:
+            artist.draw(renderer)
+        x0, y0, x1, y1 = (int(round(value)) for value in self.ax.bbox.extents)
+        layer = np.asarray(renderer.buffer_rgba())[height - y1 : height - y0, x0:x1].copy()
+        if self.featureLayer is None:
+            self.featureLayer = self.canvas.figure.figimage(layer, xo=x0, yo=y0, origin="upper", animated=True)
+        else:
+            self.featureLayer.set_data(layer)
+            self.featureLayer.ox, self.featureLayer.oy = x0, y0
+
+    def drawAnimated(self):
+        self.ax.draw_artist(self.mesh)
+        if self.featureLayer is not None:
+            self.canvas.figure.draw_artist(self.featureLayer)
+        for artist in self.overlays:
+            self.ax.draw_artist(artist)
+
+    def setData(self, data):
+        self.mesh.set_array(np.ravel(data))
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self.drawAnimated()
+        self.canvas.blit(self.ax.bbox)
+
+
+class MapView:
+    def __init__(self, canvas, title, extent, data, cmap="jet", label="tecu"):
+        self.canvas = canvas
+        self.extent = list(extent)
+        self.ax, self.mesh, overlays = drawMap(canvas.figure, title, extent, data, cmap=cmap, label=label)
+        # anomaly cells drawn over the map, empty until setMarkers is called
+        self.markers = self.ax.scatter(
+            [], [], s=30, marker="o", facecolors="none", linewidths=1.2, transform=ccrs.PlateCarree(), zorder=5
+        )
+        self.blitMesh = BlitMesh(canvas, self.ax, self.mesh, [self.markers], features=overlays)
+
+    def update(self, title, extent, data):
+        self.ax.set_title(title)
+        if list(extent) != self.extent:
+            self.ax.set_extent(extent, crs=ccrs.PlateCarree())
+            self.extent = list(extent)
+        self.mesh.set_array(np.ravel(data))
+        self.mesh.set_clim(np.nanmin(data), np.nanmax(data))
+        self.canvas.draw()
+
+    def setData(self, data):
+        self.blitMesh.setData(data)
+
+    def setMarkers(self, lats, lons, colors):
+        # takes effect with the next setData or draw
+        self.markers.set_offsets(np.column_stack([lons, lats]) if len(lats) else np.empty((0, 2)))
+        self.markers.set_edgecolors(colors)
+
+
+class CompareView:
+    def __init__(self, canvas, titles, maps, limits, cmaps, columns=3):
+        self.canvas = canvas
+        rows = -(-len(maps) // columns)
+        self.blitMeshes = []
+        for i, (title, data, (vmin, vmax), cmap) in enumerate(zip(titles, maps, limits, cmaps)):
+            ax, mesh, overlays = drawMap(
+                canvas.figure,
+                title,
+                [-180, 180, -90, 90],
+                data,
+                cmap=cmap,
+                position=(rows, columns, i + 1),
+                vmin=vmin,
+                vmax=vmax,
+            )
+            self.blitMeshes.append(BlitMesh(canvas, ax, mesh, features=overlays))
+
+    def setData(self, maps):
+        for blitMesh, data in zip(self.blitMeshes, maps):
+            blitMesh.setData(data)
+
+    def close(self):
+        for blitMesh in self.blitMeshes:
+            blitMesh.disconnect()
+        self.canvas.figure.clear()
+
+
+class FrameRate:
+    def __init__(self, window=20):
+        self.times = deque(maxlen=window)
+
+    def tick(self):
+        self.times.append(time.perf_counter())
+
+    def reset(self):
+        self.times.clear()
+
+    def fps(self):
+        if len(self.times) < 2:
+            return 0.0
+        return (len(self.times) - 1) / (self.times[-1] - self.times[0])
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+
+from atomicFile import writeJson
+from instrumentation import timed
+from network import NetworkError, sharedClient
+
+CDDIS_DAILY_URL = "https://cddis.nasa.gov/archive/gnss/data/daily"
+
+
+class FetchCancelled(Exception):
+    pass
+
+
+def readStationNames(path="stationsName.txt"):
+    with open(path, "r", encoding="utf-8") as r:
+        return [line.strip() for line in r if line.strip()]
+
+
+@timed("parse.navHeader")
+def readNavHeader(chunks, cancelled=None):
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    header, bytesRead = b"", 0
+    for chunk in chunks:
+        if cancelled is not None and cancelled.is_set():
+            raise FetchCancelled()
+        bytesRead += len(chunk)
+        header += decompressor.decompress(chunk)
+        end = header.find(b"END OF HEADER")
+        if end >= 0:
+            header = header[: end + len(b"END OF HEADER")]
+            break
+        if decompressor.eof:
+            break
+    lines = header.decode("ascii", errors="replace").splitlines()
+    return parseKlobucharLines(lines), bytesRead
+
+
+def parseKlobucharLines(lines):
+    alpha, beta = [], []
+    for line in lines:
+        values = line.replace("D", "E").split()
+        if "GPSA" in line:
+            alpha = [float(v) for v in values[1:5]]
+        elif "GPSB" in line:
+            beta = [float(v) for v in values[1:5]]
+        if (alpha and beta) or "END OF HEADER" in line:
+            break
+    if len(alpha) != 4 or len(beta) != 4:
+        return None
+    return alpha, beta
+
+
+class NavFetcher:
+    def __init__(self, stations, statsPath=None, baseUrl=CDDIS_DAILY_URL, maxWorkers=8, timeout=5, client=None):
+        self.stations = list(stations)
+        self.statsPath = statsPath
+        self.baseUrl = baseUrl.rstrip("/")
+        self.maxWorkers = maxWorkers
+        self.timeout = timeout
+        self.client = client or sharedClient()
+        self.lock = threading.Lock()
+        self.bytesRead = 0
+        self.stationStats = self.loadStats()
+
+    def loadStats(self):
+        if self.statsPath is None:
+            return {}
+        try:
+            with open(self.statsPath, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def saveStats(self):
+        if self.statsPath is None:
+            return
+        writeJson(self.statsPath, self.stationStats)
+
+    def successRate(self, station):
+        stats = self.stationStats.get(station, {})
+        return (stats.get("successes", 0) + 1) / (stats.get("tries", 0) + 2)
+
+    def orderedStations(self):
+        return sorted(self.stations, key=lambda station: -self.successRate(station))
+
+    def record(self, station, success):
+        with self.lock:
+            stats = self.stationStats.setdefault(station, {"tries": 0, "successes": 0})
+            stats["tries"] += 1
+            stats["successes"] += int(success)
+
+    def navUrl(self, station, year, doy):
+        fileName = f"{station}_R_{year}{doy}0000_01D_GN.rnx.gz"
+        return f"{self.baseUrl}/{year}/{doy}/{str(year)[2:]}n/{fileName}"
+
+    @timed("download.nav")
+    def fetch(self, year, doy):
+        doy = f"{int(doy):03d}"
+        cancelled = threading.Event()
+        candidates = iter(self.orderedStations())
+        result = None
+
+        executor = ThreadPoolExecutor(max_workers=self.maxWorkers)
+        try:
+            pending = {}
+            for station in candidates:
+                pending[executor.submit(self.fetchStation, station, year, doy, cancelled)] = station
+                if len(pending) >= self.maxWorkers:
+                    break
+
+            while pending and result is None:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    station = pending.pop(future)
+                    coefficients = future.exception() is None and future.result()
+                    if coefficients and result is None:
+                        result = (station, *coefficients)
+                    elif not isinstance(future.exception(), FetchCancelled):
+                        self.record(station, False)
+
+                    nextStation = next(candidates, None)
+                    if nextStation is not None and result is None:
+                        pending[executor.submit(self.fetchStation, nextStation, year, doy, cancelled)] = nextStation
+        finally:
+            cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if result is not None:
+            self.record(result[0], True)
+        self.saveStats()
+        return result
+
+    def fetchStation(self, station, year, doy, cancelled):
+        if cancelled.is_set():
+            raise FetchCancelled(station)
+        try:
+            response = self.client.get(self.navUrl(station, year, doy), stream=True, timeout=self.timeout)
+        except NetworkError:
+            return None
+        with response:
+            if response.status_code != 200:
+                return None
+            try:
+                chunks = response.raw.stream(1024, decode_content=False)
+                coefficients, bytesRead = readNavHeader(chunks, cancelled)
+            except (zlib.error, requests.RequestException):
+                return None
+            except FetchCancelled:
+                raise FetchCancelled(station)
+        with self.lock:
+            self.bytesRead += bytesRead
+        return coefficients
@@ -0,0 +1,137 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import count
+
+EARTHDATA_HOST = "urs.earthdata.nasa.gov"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+
+
+class NetworkError(Exception):
+    pass
+
+
+class EarthdataSession(requests.Session):
+    def rebuild_auth(self, prepared, response):
+        # requests drops credentials on every cross-host redirect, keep them on the hops to and from the login host
+        hosts = {urlparse(prepared.url).hostname, urlparse(response.request.url).hostname}
+        if EARTHDATA_HOST in hosts and "Authorization" in prepared.headers:
+            return
+        super().rebuild_auth(prepared, response)
+
+
+def conditionalHeaders(validators):
+    headers = {}
+    if validators and validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators and validators.get("lastModified"):
+        headers["If-Modified-Since"] = validators["lastModified"]
+    return headers
+
+
+def responseValidators(response):
+    return {"etag": response.headers.get("ETag"), "lastModified": response.headers.get("Last-Modified")}
+
+
+class NetworkClient:
+    def __init__(self, retries=3, backoff=0.5, poolSize=16, timeout=10):
+        self.timeout = timeout
+        self.session = EarthdataSession()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=("GET", "HEAD"),
+            raise_on_status=False,
+        )
+        # keep-alive connections are shared by every caller, one TLS handshake and login per host
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, headers=None, stream=False, timeout=None):
+        count("network.requests")
+        try:
+            response = self.session.get(url, headers=headers, stream=stream, timeout=timeout or self.timeout)
+        except requests.RequestException as e:
+            raise NetworkError(f"{url}: {e}") from e
+        if urlparse(response.url).hostname == EARTHDATA_HOST:
+            response.close()
+            raise NetworkError(f"{url}: earthdata login failed, check the credentials in ~/.netrc")
+        return response
+
+    def exists(self, url, timeout=None):
+        # True or False from a HEAD request, None when the server could not be asked
+        count("network.requests")
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=timeout or self.timeout)
+        except requests.RequestException:
+            return None
+        with response:
+            if urlparse(response.url).hostname == EARTHDATA_HOST or response.status_code >= 500:
+                return None
+            return response.status_code == 200
+
+    def lines(self, url, validators=None, timeout=None):
+        # (decoded lines, validators), lines is None when the server answered 304 Not Modified
+        with self.get(url, headers=conditionalHeaders(validators), timeout=timeout) as response:
+            if response.status_code == 304:
+                return None, validators
+            if response.status_code != 200:
+                raise NetworkError(f"{url}: HTTP {response.status_code}")
+            return response.content.decode("utf-8").splitlines(), responseValidators(response)
+
+    def download(self, url, path, timeout=None):
+        # resumes a .part file left by an interrupted transfer, If-Range restarts it when the remote file changed
+        partPath, validatorPath = path + ".part", path + ".part.validator"
+        headers = {}
+        if os.path.exists(partPath) and os.path.exists(validatorPath):
+            with open(validatorPath, "r") as f:
+                headers = {"Range": f"bytes={os.path.getsize(partPath)}-", "If-Range": f.read()}
+        with self.get(url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 416 and headers:
+                os.remove(partPath)
+                return self.download(url, path, timeout)
+            if response.status_code not in (200, 206):
+                raise NetworkError(f"{url}: HTTP {response.status_code}")
+            resumed = response.status_code == 206
+            if resumed:
+                count("network.resumed")
+            else:
+                validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                if validator:
+                    with open(validatorPath, "w") as f:
+                        f.write(validator)
+                elif os.path.exists(validatorPath):
+                    os.remove(validatorPath)
+            try:
+                with open(partPath, "ab" if resumed else "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        f.write(chunk)
+            except requests.RequestException as e:
+                raise NetworkError(f"{url}: {e}") from e
+        os.replace(partPath, path)
+        if os.path.exists(validatorPath):
+            os.remove(validatorPath)
+        return path
+
+    def close(self):
+        self.session.close()
+
+
+sharedLock = threading.Lock()
+shared = None
+
+
+def sharedClient():
+    global shared
+    with sharedLock:
+        if shared is None:
+            shared = NetworkClient()
+        return shared
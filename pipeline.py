@@ -0,0 +1,147 @@
+import queue
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentation import timer
+
+
+class Stage:
+    def __init__(self, name, work, needs, onReady, onError):
+        self.name = name
+        self.work = work
+        self.needs = list(needs)
+        self.onReady = onReady
+        self.onError = onError
+        self.future = None
+
+
+class Load:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.stages = {}
+        self.results = {}
+        self.failed = set()
+        self.cancelled = threading.Event()
+
+    def stage(self, name, work, needs=(), onReady=None, onError=None):
+        stage = Stage(name, work, needs, onReady, onError)
+        self.stages[name] = stage
+        if all(need in self.results for need in stage.needs):
+            self.pipeline.run(self, stage)
+        return self
+
+    def cancel(self):
+        self.cancelled.set()
+        for stage in self.stages.values():
+            if stage.future is not None:
+                stage.future.cancel()
+
+    def done(self):
+        finished = set(self.results) | self.failed
+        return self.cancelled.is_set() or all(name in finished for name in self.stages)
+
+    def skipDependents(self, name):
+        for other in self.stages.values():
+            if name in other.needs and other.name not in self.failed:
+                self.failed.add(other.name)
+                self.skipDependents(other.name)
+
+    def notify(self, stage, callback, value):
+        # a callback that raises goes to the stage's onError, then to the pipeline, never out of the poll loop
+        try:
+            callback(value)
+        except Exception as e:
+            if callback is not stage.onError and stage.onError is not None:
+                self.notify(stage, stage.onError, e)
+            else:
+                self.pipeline.callbackError(stage.name, e)
+
+    def finish(self, name, result, error):
+        stage = self.stages[name]
+        if error is not None:
+            self.failed.add(name)
+            self.skipDependents(name)
+            if stage.onError is not None:
+                self.notify(stage, stage.onError, error)
+            return
+
+        self.results[name] = result
+        if stage.onReady is not None:
+            self.notify(stage, stage.onReady, result)
+        for other in self.stages.values():
+            if other.future is None and name in other.needs and all(n in self.results for n in other.needs):
+                self.pipeline.run(self, other)
+
+
+class TaskPipeline:
+    def __init__(self, schedule=None, maxWorkers=4, pollInterval=50, onCallbackError=None):
+        self.schedule = schedule
+        self.onCallbackError = onCallbackError
+        self.pollInterval = pollInterval
+        self.executor = ThreadPoolExecutor(max_workers=maxWorkers)
+        self.completed = queue.Queue()
+        self.current = None
+        self.polling = False
+
+    def newLoad(self):
+        if self.current is not None:
+            self.current.cancel()
+        self.current = Load(self)
+        self.startPolling()
+        return self.current
+
+    def active(self):
+        return self.current is not None and not self.current.done()
+
+    def run(self, load, stage):
+        arguments = [load.results[need] for need in stage.needs]
+        stage.future = self.executor.submit(self.work, load, stage, arguments)
+
+    def work(self, load, stage, arguments):
+        if load.cancelled.is_set():
+            return
+        try:
+            with timer(f"stage.{stage.name}"):
+                result, error = stage.work(*arguments), None
+        except Exception as e:
+            result, error = None, e
+        self.completed.put((load, stage.name, result, error))
+
+    def drain(self):
+        while True:
+            try:
+                load, name, result, error = self.completed.get_nowait()
+            except queue.Empty:
+                return
+            if load is self.current and not load.cancelled.is_set():
+                load.finish(name, result, error)
+
+    def startPolling(self):
+        if self.schedule is None or self.polling:
+            return
+        self.polling = True
+        self.schedule(self.pollInterval, self.poll)
+
+    def callbackError(self, name, error):
+        if self.onCallbackError is not None:
+            try:
+                self.onCallbackError(name, error)
+                return
+            except Exception:
+                pass
+        print(f"stage {name}: {type(error).__name__}: {error}", file=sys.stderr)
+
+    def poll(self):
+        try:
+            self.drain()
+        finally:
+            if self.active():
+                self.schedule(self.pollInterval, self.poll)
+            else:
+                self.polling = False
+
+    def shutdown(self):
+        if self.current is not None:
+            self.current.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
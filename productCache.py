@@ -0,0 +1,130 @@
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from atomicFile import writeAtomic, writeJson
+
+INDEX_FILE = "index.json"
+
+
+class ProductCache:
+    def __init__(self, cacheDir, maxBytes=512 * 2**20):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.hits, self.misses, self.evictions, self.corrupt = 0, 0, 0, 0
+        # hits only move lastUsed in memory, the index is written on put, drop and close
+        self.dirty = False
+        self.lock = threading.Lock()
+
+        os.makedirs(self.cacheDir, exist_ok=True)
+        self.index = self.loadIndex()
+
+    @staticmethod
+    def keyName(product, year, doy):
+        return f"{product}-{int(year):04d}-{int(doy):03d}"
+
+    def loadIndex(self):
+        indexPath = os.path.join(self.cacheDir, INDEX_FILE)
+        try:
+            with open(indexPath, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def saveIndex(self):
+        writeJson(os.path.join(self.cacheDir, INDEX_FILE), self.index)
+        self.dirty = False
+
+    def close(self):
+        with self.lock:
+            if self.dirty:
+                self.saveIndex()
+
+    def get(self, product, year, doy):
+        key = self.keyName(product, year, doy)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            path = os.path.join(self.cacheDir, entry["file"])
+            try:
+                with open(path, "rb") as f:
+                    content = f.read()
+            except OSError:
+                content = None
+            if content is None or hashlib.sha256(content).hexdigest() != entry["sha256"]:
+                self.corrupt += 1
+                self.misses += 1
+                self.dropEntry(key)
+                self.saveIndex()
+                return None
+
+            entry["lastUsed"] = time.time()
+            self.dirty = True
+            self.hits += 1
+
+        with np.load(io.BytesIO(content), allow_pickle=False) as arrays:
+            return {name: arrays[name] for name in arrays.files}
+
+    def contains(self, product, year, doy):
+        # index lookup only, the file is checked when it is read
+        with self.lock:
+            return self.keyName(product, year, doy) in self.index
+
+    def put(self, product, year, doy, arrays):
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        content = buffer.getvalue()
+        digest = hashlib.sha256(content).hexdigest()
+        fileName = f"{digest}.npz"
+        key = self.keyName(product, year, doy)
+
+        with self.lock:
+            path = os.path.join(self.cacheDir, fileName)
+            if not os.path.exists(path):
+                writeAtomic(path, content, "wb")
+
+            if key in self.index and self.index[key]["file"] != fileName:
+                self.dropEntry(key)
+            self.index[key] = {"file": fileName, "sha256": digest, "size": len(content), "lastUsed": time.time()}
+            self.evict()
+            self.saveIndex()
+
+    def dropEntry(self, key):
+        entry = self.index.pop(key)
+        if any(other["file"] == entry["file"] for other in self.index.values()):
+            return
+        try:
+            os.remove(os.path.join(self.cacheDir, entry["file"]))
+        except OSError:
+            pass
+
+    def evict(self):
+        byLastUse = sorted(self.index, key=lambda key: self.index[key]["lastUsed"])
+        while byLastUse and self.totalBytes() > self.maxBytes:
+            self.dropEntry(byLastUse.pop(0))
+            self.evictions += 1
+
+    def totalBytes(self):
+        files = {entry["file"]: entry["size"] for entry in self.index.values()}
+        return sum(files.values())
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "corrupt": self.corrupt,
+                "entries": len(self.index),
+                "bytes": self.totalBytes(),
+            }
@@ -0,0 +1,418 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from anomaly import AnomalyDetector, dayStartOf
+from downloads import DownloadError, downloadAndExtract, pathLock
+from frames import InterpolatedFrames, fillCube
+from instrumentation import timed, timer
+from ionex import IonexData, readIonex
+from klobuchar import KlobucharModel
+from network import sharedClient
+from sampling import GridSampler
+from tecArchive import TecArchive
+
+IONEX_URL = "https://cddis.nasa.gov/archive/gnss/products/ionex"
+# L1 group delay of one TECU, 40.3e16 / f1**2
+L1_METRES_PER_TECU = 40.3e16 / 1575.42e6**2
+# day availability from best to worst, a day is as available as its least available product
+AVAILABILITY = ["local", "upstream", "unknown", "missing"]
+# cubes are never finer than this, finer frames are interpolated from the cube on demand
+CUBE_MINUTES = 15
+
+
+def ionexFileName(product, year, day):
+    return f"{product}0OPSRAP_{year}{day}0000_01D_02H_GIM.INX"
+
+
+def gpsSecondsByDate(selectedDate, count=96, stepSeconds=900):
+    date = datetime.strptime(selectedDate, "%Y-%m-%d")
+    gpsStart = datetime(1980, 1, 6)
+
+    deltaDays = (date - gpsStart).days
+    dayOfWeek = deltaDays % 7
+    startSecondsOfDay = dayOfWeek * 86400
+    return [startSecondsOfDay + i * stepSeconds for i in range(count)]
+
+
+def spanDates(selectedDate, days=1):
+    firstDay = datetime.strptime(selectedDate, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return [firstDay + timedelta(days=i) for i in range(days)]
+
+
+def dayOfYear(date):
+    return f"{date.timetuple().tm_yday:03d}"
+
+
+def epochStats(delta):
+    # one value per epoch, so the views can show them without touching the cube again
+    flat = delta.reshape(len(delta), -1)
+    return {
+        "bias": np.nanmean(flat, axis=1).astype(np.float32),
+        "rms": np.sqrt(np.nanmean(np.square(flat), axis=1)).astype(np.float32),
+        "maxAbs": np.nanmax(np.abs(flat), axis=1).astype(np.float32),
+    }
+
+
+def pairDifferences(cubes):
+    products = list(cubes)
+    return {
+        f"{first} - {second}": np.subtract(cubes[first], cubes[second], dtype=np.float32)
+        for i, first in enumerate(products)
+        for second in products[i + 1 :]
+    }
+
+
+def cubeMinutes(stepMinutes):
+    # 1, 3 and 5 min frames come from the 15 min cube, a 10 min cadence does not divide it and gets its own
+    return CUBE_MINUTES if CUBE_MINUTES % stepMinutes == 0 else stepMinutes
+
+
+def cubeFrames(cube, stepMinutes):
+    # cubes hold one epoch past the span, the end of its last day, so interpolated frames reach the end too
+    cubeStep = cubeMinutes(stepMinutes)
+    if cubeStep == stepMinutes:
+        return cube[:-1]
+    return InterpolatedFrames(cube, cubeStep, stepMinutes)
+
+
+def frameStats(stats, stepMinutes):
+    # the stats of the nearest cube epoch for every frame, a few bytes per frame instead of a cube per frame
+    cubeStep = cubeMinutes(stepMinutes)
+    count = (len(stats["rms"]) * cubeStep) // stepMinutes
+    index = np.minimum(np.rint(np.arange(count) * stepMinutes / cubeStep).astype(np.int64), len(stats["rms"]) - 1)
+    return {name: values[index] for name, values in stats.items()}
+
+
+def cubeBytes(value):
+    # cache entries are cubes or tuples and dicts of them, like the delta cube with its stats
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sum(cubeBytes(item) for item in value.values())
+    if isinstance(value, (tuple, list)):
+        return sum(cubeBytes(item) for item in value)
+    return 0
+
+
+def alignCube(cube, lats, lons, targetLats, targetLons):
+    # resample onto the reference grid only when the centre uses a different one
+    if len(lats) == len(targetLats) and len(lons) == len(targetLons):
+        if np.allclose(lats, targetLats) and np.allclose(lons, targetLons):
+            return cube
+    lonGrid, latGrid = np.meshgrid(targetLons, targetLats)
+    weights = GridSampler(lats, lons).points(latGrid.ravel(), lonGrid.ravel())
+    return weights.apply(cube).reshape(len(cube), len(targetLats), len(targetLons)).astype(np.float32)
+
+
+class ProductSource:
+    def __init__(
+        self,
+        downloadDir,
+        productCache=None,
+        navFetcher=None,
+        ionexUrl=IONEX_URL,
+        archiveDir=None,
+        maxBytes=512 * 2**20,
+        client=None,
+    ):
+        self.downloadDir = downloadDir
+        self.productCache = productCache
+        self.navFetcher = navFetcher
+        self.ionexUrl = ionexUrl.rstrip("/")
+        self.client = client
+        self.archiveDir = archiveDir
+        self.archives = {}
+        self.detectors = {}
+        self.grids = {}
+        self.upstream = set()
+        self.maxBytes = maxBytes
+        self.sizes = {}
+        self.cubes = OrderedDict()
+        self.building = {}
+        self.lock = threading.Lock()
+
+    def loadIonex(self, product, year, day):
+        fileName = ionexFileName(product, year, day)
+        # the extracted file is read and removed under its lock, a second caller finds it in the product cache
+        with pathLock(os.path.join(self.downloadDir, fileName)):
+            if self.productCache is not None:
+                arrays = self.productCache.get(product, year, day)
+                if arrays is not None:
+                    return IonexData.fromArrays(arrays)
+
+            url = f"{self.ionexUrl}/{year}/{day}/{fileName}.gz"
+            path = downloadAndExtract(url, self.downloadDir, fileName, client=self.client)
+            ionexData = readIonex(path)
+            if self.productCache is not None:
+                self.productCache.put(product, year, day, ionexData.toArrays())
+            os.remove(path)
+            return ionexData
+
+    def klobucharCoefficients(self, year, day):
+        if self.productCache is not None:
+            arrays = self.productCache.get("NAV", year, day)
+            if arrays is not None:
+                return list(arrays["alpha"]), list(arrays["beta"])
+
+        result = self.navFetcher.fetch(year, day)
+        if result is None:
+            raise DownloadError(f"no station has a navigation file for {year}/{day}")
+        station, alpha, beta = result
+        if self.productCache is not None:
+            self.productCache.put("NAV", year, day, {"alpha": np.array(alpha), "beta": np.array(beta)})
+        return alpha, beta
+
+    def klobucharMaps(self, year, day, selectedDate, stepMinutes=15, closing=False):
+        alpha, beta = self.klobucharCoefficients(year, day)
+        times = gpsSecondsByDate(selectedDate, 24 * 60 // stepMinutes + int(closing), stepMinutes * 60)
+        return KlobucharModel(alpha, beta).cube(times) / np.float32(L1_METRES_PER_TECU)
+
+    def tecAvailability(self, product, days, today, workers=8):
+        dayStarts = [datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() for day in days]
+        archived = self.archive(product).coveredDays(dayStarts) if self.archiveDir is not None else [False] * len(days)
+        result, unknown = {}, []
+        for day, inArchive in zip(days, archived):
+            year, doy = day.year, dayOfYear(day)
+            cached = self.productCache is not None and self.productCache.contains(product, year, doy)
+            if inArchive or cached:
+                result[day] = "local"
+            elif (product, day) in self.upstream:
+                result[day] = "upstream"
+            elif day >= today:
+                result[day] = "missing"
+            else:
+                unknown.append(day)
+
+        # one HEAD per day over the pooled connection, published files stay published
+        client = self.client or sharedClient()
+        urls = [
+            f"{self.ionexUrl}/{day.year}/{dayOfYear(day)}/{ionexFileName(product, day.year, dayOfYear(day))}.gz"
+            for day in unknown
+        ]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for day, exists in zip(unknown, executor.map(client.exists, urls)):
+                result[day] = {True: "upstream", False: "missing", None: "unknown"}[exists]
+                if exists:
+                    self.upstream.add((product, day))
+        return result
+
+    def navAvailability(self, days, today, workers=8):
+        # the best ranked station is asked, another station may still have the day so a miss stays unknown
+        result, unchecked = {}, []
+        for day in days:
+            if self.productCache is not None and self.productCache.contains("NAV", day.year, dayOfYear(day)):
+                result[day] = "local"
+            elif ("NAV", day) in self.upstream:
+                result[day] = "upstream"
+            elif day >= today:
+                result[day] = "missing"
+            elif self.navFetcher is None:
+                result[day] = "unknown"
+            else:
+                unchecked.append(day)
+        if not unchecked:
+            return result
+
+        station = self.navFetcher.orderedStations()[0]
+        urls = [self.navFetcher.navUrl(station, day.year, dayOfYear(day)) for day in unchecked]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for day, exists in zip(unchecked, executor.map(self.navFetcher.client.exists, urls)):
+                result[day] = "upstream" if exists else "unknown"
+                if exists:
+                    self.upstream.add(("NAV", day))
+        return result
+
+    def availability(self, product, firstDate, lastDate, kpService=None):
+        # {date: status} for TEC, navigation and Kp together, one batched lookup for a calendar month
+        today = datetime.now(timezone.utc).date()
+        days = [firstDate + timedelta(days=i) for i in range((lastDate - firstDate).days + 1)]
+        statuses = [self.tecAvailability(product, days, today), self.navAvailability(days, today)]
+        if kpService is not None:
+            statuses.append(kpService.availability(days))
+        return {day: max((status[day] for status in statuses), key=AVAILABILITY.index) for day in days}
+
+    def archive(self, product):
+        with self.lock:
+            if product not in self.archives:
+                self.archives[product] = TecArchive(self.archiveDir, product)
+            return self.archives[product]
+
+    def anomalyDetector(self, product):
+        with self.lock:
+            if product not in self.detectors:
+                self.detectors[product] = AnomalyDetector(os.path.join(self.archiveDir, "anomaly"), product)
+            return self.detectors[product]
+
+    def fillArchive(self, product, days, workers=4):
+        # archives the days not there yet, days the centre never published are left as gaps
+        archive = self.archive(product)
+        missing = [
+            day for day, covered in zip(days, archive.coveredDays([dayStartOf(day) for day in days])) if not covered
+        ]
+
+        def load(day):
+            try:
+                return self.loadIonex(product, day.year, dayOfYear(day))
+            except (DownloadError, ValueError, OSError):
+                return None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for ionexData in executor.map(load, missing):
+                if ionexData is not None:
+                    archive.append(ionexData)
+        return archive
+
+    def anomalies(self, product, selectedDate, days=1):
+        # (events, lats, lons) for the span, the baseline window before it is archived and scored first
+        if self.archiveDir is None:
+            raise ValueError("anomaly detection needs the TEC archive")
+        detector = self.anomalyDetector(product)
+        dates = [date.date() for date in spanDates(selectedDate, days)]
+        history = [dates[0] - timedelta(days=i) for i in range(detector.window, 0, -1)]
+        archive = self.fillArchive(product, history + dates)
+        detector.catchUp(archive, dates[0], dates[-1])
+        start = dayStartOf(dates[0])
+        return detector.events(start, start + days * 86400 - 1), detector.lats, detector.lons
+
+    def cached(self, key, build):
+        # every cube is float32 TECU and built once, the TEC, Klobuchar and delta views share the same arrays
+        with self.lock:
+            if key in self.cubes:
+                self.cubes.move_to_end(key)
+                return self.cubes[key]
+            # a stage asking for a cube another stage is still building waits for that build
+            pending = self.building.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.building[key] = Future()
+        if not owner:
+            return pending.result()
+
+        try:
+            value = build()
+        except BaseException as e:
+            with self.lock:
+                del self.building[key]
+            pending.set_exception(e)
+            raise
+        with self.lock:
+            del self.building[key]
+            self.cubes[key] = value
+            self.sizes[key] = cubeBytes(value)
+            # bounded by bytes, a 1 min cadence cube is 15 times a 15 min one, the newest entry always stays
+            while len(self.cubes) > 1 and sum(self.sizes.values()) > self.maxBytes:
+                oldest, _ = self.cubes.popitem(last=False)
+                del self.sizes[oldest]
+        pending.set_result(value)
+        return value
+
+    def tecCube(self, product, selectedDate, days=1, stepMinutes=15):
+        return cubeFrames(self.tecSpan(product, selectedDate, days, cubeMinutes(stepMinutes)), stepMinutes)
+
+    def tecSpan(self, product, selectedDate, days, cubeStep):
+        return self.cached(
+            ("tec", product, selectedDate, days, cubeStep),
+            lambda: self.buildTec(product, selectedDate, days, cubeStep),
+        )
+
+    @timed("compute.tec")
+    def buildTec(self, product, selectedDate, days, cubeStep):
+        dates = spanDates(selectedDate, days)
+        if self.archiveDir is None:
+            frames = []
+            for date in dates:
+                ionexData = self.loadIonex(product, date.year, dayOfYear(date))
+                self.grids[product] = (ionexData.lats, ionexData.lons)
+                frames.append(InterpolatedFrames(ionexData.tecu(), ionexData.interval // 60, cubeStep))
+            return fillCube(*frames, ionexData.tecu()[-1:])
+
+        archive = self.archive(product)
+        for date in dates:
+            dayStart = date.timestamp()
+            if not archive.covers(dayStart, dayStart + 86400):
+                archive.append(self.loadIonex(product, date.year, dayOfYear(date)))
+        self.grids[product] = (archive.lats, archive.lons)
+        frames = archive.frames(dates[0].timestamp(), days, cubeStep)
+        # one frame past the last one is the end of the span
+        return fillCube(frames, [frames.computeFrame(len(frames))])
+
+    def klobucharCube(self, selectedDate, days=1, stepMinutes=15):
+        return cubeFrames(self.klobucharSpan(selectedDate, days, cubeMinutes(stepMinutes)), stepMinutes)
+
+    def klobucharSpan(self, selectedDate, days, cubeStep):
+        def build():
+            maps = []
+            dates = spanDates(selectedDate, days)
+            for date in dates:
+                day, closing = date.strftime("%Y-%m-%d"), date is dates[-1]
+                maps.append(self.klobucharMaps(date.year, dayOfYear(date), day, cubeStep, closing=closing))
+            return np.concatenate(maps)
+
+        return self.cached(("klobuchar", selectedDate, days, cubeStep), build)
+
+    def comparisonCubes(self, products, selectedDate, days=1, stepMinutes=15):
+        cubes, errors = self.comparisonSpans(products, selectedDate, days, cubeMinutes(stepMinutes))
+        return {product: cubeFrames(cube, stepMinutes) for product, cube in cubes.items()}, errors
+
+    def comparisonSpans(self, products, selectedDate, days, cubeStep):
+        # all centres are fetched and parsed at once, then put on the first centre's grid and epochs
+        cubes, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=len(products)) as executor:
+            futures = {
+                product: executor.submit(self.tecSpan, product, selectedDate, days, cubeStep) for product in products
+            }
+            for product, future in futures.items():
+                try:
+                    cubes[product] = future.result()
+                except (DownloadError, ValueError, OSError) as e:
+                    errors[product] = e
+        if not cubes:
+            return cubes, errors
+
+        reference = next(iter(cubes))
+        targetLats, targetLons = self.grids[reference]
+        epochs = min(len(cube) for cube in cubes.values())
+        for product, cube in cubes.items():
+            lats, lons = self.grids[product]
+            cubes[product] = alignCube(cube[:epochs], lats, lons, targetLats, targetLons)
+        return cubes, errors
+
+    def comparison(self, products, selectedDate, days=1, stepMinutes=15):
+        # the cubes with their differences and colour limits, so the view only has to draw them
+        cubes, errors = self.comparisonSpans(products, selectedDate, days, cubeMinutes(stepMinutes))
+        if not cubes:
+            return {"cubes": cubes, "errors": errors}
+        with timer("compute.compare"):
+            differences = pairDifferences(cubes)
+            tecLimits = (
+                min(float(np.nanmin(cube)) for cube in cubes.values()),
+                max(float(np.nanmax(cube)) for cube in cubes.values()),
+            )
+            spread = max([float(np.nanpercentile(np.abs(cube), 99)) for cube in differences.values()], default=1.0)
+        return {
+            "cubes": {product: cubeFrames(cube, stepMinutes) for product, cube in cubes.items()},
+            "errors": errors,
+            "differences": {name: cubeFrames(cube, stepMinutes) for name, cube in differences.items()},
+            "limits": [tecLimits] * len(cubes) + [(-spread, spread)] * len(differences),
+        }
+
+    def deltaCube(self, product, selectedDate, days=1, stepMinutes=15):
+        # (delta, stats per frame), delta is TEC minus Klobuchar, the stats are taken at the cube epochs
+        cubeStep = cubeMinutes(stepMinutes)
+
+        def build():
+            tec = self.tecSpan(product, selectedDate, days, cubeStep)
+            klobuchar = self.klobucharSpan(selectedDate, days, cubeStep)
+            if tec.shape != klobuchar.shape:
+                raise ValueError(f"{product} TEC cube {tec.shape} does not match Klobuchar cube {klobuchar.shape}")
+            with timer("compute.delta"):
+                delta = np.subtract(tec, klobuchar, dtype=np.float32)
+                return delta, epochStats(delta[:-1])
+
+        delta, stats = self.cached(("delta", product, selectedDate, days, cubeStep), build)
+        return cubeFrames(delta, stepMinutes), frameStats(stats, stepMinutes)
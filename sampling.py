@@ -0,0 +1,99 @@
+import numpy as np
+
+from frames import InterpolatedFrames, fillCube
+
+IONEX_LATS = np.linspace(87.5, -87.5, 71)
+IONEX_LONS = np.linspace(-180, 180, 73)
+EARTH_RADIUS = 6371e3
+# IONEX single layer height
+SHELL_HEIGHT = 450e3
+
+
+def shellPiercePoints(lat, lon, elevation, azimuth, shellHeight=SHELL_HEIGHT):
+    # where the line of sight crosses the thin shell, everything in radians
+    psi = np.pi / 2 - elevation - np.arcsin(EARTH_RADIUS / (EARTH_RADIUS + shellHeight) * np.cos(elevation))
+    latIPP = np.arcsin(np.sin(lat) * np.cos(psi) + np.cos(lat) * np.sin(psi) * np.cos(azimuth))
+    lonIPP = lon + np.arcsin(np.sin(psi) * np.sin(azimuth) / np.cos(latIPP))
+    return latIPP, lonIPP
+
+
+class SampleWeights:
+    def __init__(self, indices, weights):
+        self.indices = indices
+        self.weights = weights
+
+    def __len__(self):
+        return len(self.indices)
+
+    def apply(self, cube):
+        # one gather for every epoch and every point, (epochs, lat, lon) -> (epochs, points)
+        cube = np.asarray(cube)
+        flat = cube.reshape(cube.shape[0], -1)
+        return np.einsum("tpk,pk->tp", flat[:, self.indices], self.weights)
+
+
+class GridSampler:
+    def __init__(self, lats=IONEX_LATS, lons=IONEX_LONS):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+
+    def axisWeights(self, axis, values):
+        ascending = axis if axis[0] < axis[-1] else axis[::-1]
+        values = np.clip(values, ascending[0], ascending[-1])
+        upper = np.clip(np.searchsorted(ascending, values, side="right"), 1, len(ascending) - 1)
+        lower = upper - 1
+        fraction = (values - ascending[lower]) / (ascending[upper] - ascending[lower])
+        if ascending is not axis:
+            lower, upper = len(axis) - 1 - lower, len(axis) - 1 - upper
+        return lower, upper, fraction
+
+    def points(self, lats, lons):
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        lons = (lons + 180) % 360 - 180
+        lat0, lat1, latFraction = self.axisWeights(self.lats, lats)
+        lon0, lon1, lonFraction = self.axisWeights(self.lons, lons)
+        nLon = len(self.lons)
+        indices = np.stack([lat0 * nLon + lon0, lat0 * nLon + lon1, lat1 * nLon + lon0, lat1 * nLon + lon1], axis=1)
+        weights = np.stack(
+            [
+                (1 - latFraction) * (1 - lonFraction),
+                (1 - latFraction) * lonFraction,
+                latFraction * (1 - lonFraction),
+                latFraction * lonFraction,
+            ],
+            axis=1,
+        )
+        return SampleWeights(indices, weights.astype(np.float32))
+
+    def piercePoints(self, lats, lons, elevation, azimuth):
+        # sample where the line of sight crosses the IONEX shell instead of above the receiver, degrees in
+        latIPP, lonIPP = shellPiercePoints(
+            np.radians(lats), np.radians(lons), np.radians(elevation), np.radians(azimuth)
+        )
+        return self.points(np.degrees(latIPP), np.degrees(lonIPP))
+
+    def box(self, south, north, west, east):
+        # area weighted mean of the grid cells inside the box, as a single sample point
+        latIndex = np.flatnonzero((self.lats >= south) & (self.lats <= north))
+        lonIndex = np.flatnonzero((self.lons >= west) & (self.lons <= east))
+        if not len(latIndex) or not len(lonIndex):
+            raise ValueError(f"no grid cell inside {south}..{north} N, {west}..{east} E")
+        indices = (latIndex[:, None] * len(self.lons) + lonIndex[None, :]).ravel()
+        weights = np.repeat(np.cos(np.radians(self.lats[latIndex])), len(lonIndex))
+        return SampleWeights(indices[None, :], (weights / weights.sum()).astype(np.float32)[None, :])
+
+
+def stackFrames(frames):
+    if isinstance(frames, np.ndarray):
+        return frames
+    return fillCube(frames)
+
+
+def sampleFrames(weights, frames):
+    # (frames, points), interpolated frames are sampled at their maps and interpolated in time, never stacked
+    if not isinstance(frames, InterpolatedFrames):
+        return weights.apply(stackFrames(frames))
+    samples = weights.apply(frames.maps)
+    positions = np.arange(len(frames)) / frames.stepsPerInterval
+    return np.stack([np.interp(positions, np.arange(len(samples)), column) for column in samples.T], axis=1)
@@ -0,0 +1,149 @@
+import argparse
+import sys
+
+import numpy as np
+
+from instrumentation import timed
+from ionex import readIonex
+from klobuchar import klobucharDelay, klobucharTerms
+from products import L1_METRES_PER_TECU
+from sampling import EARTH_RADIUS, IONEX_LATS, IONEX_LONS, SHELL_HEIGHT, GridSampler, shellPiercePoints
+
+L1_FREQUENCY = 1575.42e6
+# lines of sight per pass, small enough for the temporaries to stay in cache
+CHUNK_SIZE = 1 << 15
+
+
+def mappingFunction(elevation, shellHeight=SHELL_HEIGHT):
+    # single layer slant factor, elevation in radians
+    ratio = EARTH_RADIUS * np.cos(elevation) / (EARTH_RADIUS + shellHeight)
+    return 1 / np.sqrt(1 - ratio * ratio)
+
+
+class SlantDelay:
+    def __init__(
+        self,
+        alpha=None,
+        beta=None,
+        epochs=None,
+        maps=None,
+        lats=IONEX_LATS,
+        lons=IONEX_LONS,
+        shellHeight=SHELL_HEIGHT,
+        rotate=True,
+        chunkSize=CHUNK_SIZE,
+    ):
+        self.alpha = None if alpha is None else np.asarray(alpha, dtype=np.float64)
+        self.beta = None if beta is None else np.asarray(beta, dtype=np.float64)
+        self.epochs, self.maps = None, None
+        if maps is not None:
+            order = np.argsort(epochs)
+            self.epochs = np.asarray(epochs, dtype=np.float64)[order]
+            maps = np.asarray(maps, dtype=np.float32)[order]
+            self.maps = maps.reshape(len(maps), -1)
+        self.sampler = GridSampler(lats, lons)
+        self.shellHeight = shellHeight
+        self.rotate = rotate
+        self.chunkSize = chunkSize
+
+    @classmethod
+    def fromIonex(cls, ionexData, alpha=None, beta=None, **kwargs):
+        epochs = ionexData.toArrays()["epochs"]
+        keep = ~np.isnan(epochs)
+        return cls(alpha, beta, epochs[keep], ionexData.tecu()[keep], ionexData.lats, ionexData.lons, **kwargs)
+
+    @classmethod
+    def fromArchive(cls, archive, start, end, alpha=None, beta=None, **kwargs):
+        epochs, maps = archive.slice(start, end)
+        return cls(alpha, beta, epochs, maps, archive.lats, archive.lons, **kwargs)
+
+    @timed("compute.slantDelay")
+    def compute(self, lat, lon, azimuth, elevation, epochs, frequency=L1_FREQUENCY):
+        # lines of sight from degrees and unix seconds in any broadcastable shapes, delays in metres at frequency
+        lat, lon, azimuth, elevation, epochs = (
+            np.ravel(value) for value in np.broadcast_arrays(lat, lon, azimuth, elevation, epochs)
+        )
+        count = len(lat)
+        result = {"mapping": np.empty(count, dtype=np.float32)}
+        if self.alpha is not None:
+            result["klobuchar"] = np.empty(count, dtype=np.float32)
+        if self.maps is not None:
+            result["gim"] = np.empty(count, dtype=np.float32)
+
+        scale = (L1_FREQUENCY / frequency) ** 2
+        for start in range(0, count, self.chunkSize):
+            part = slice(start, start + self.chunkSize)
+            latRad, lonRad = np.radians(lat[part]), np.radians(lon[part])
+            azRad, elRad = np.radians(azimuth[part]), np.radians(elevation[part])
+            mapping = mappingFunction(elRad, self.shellHeight)
+            result["mapping"][part] = mapping
+            if self.alpha is not None:
+                terms = klobucharTerms(latRad / np.pi, lonRad / np.pi, elRad, azRad, self.alpha, self.beta)
+                delay = klobucharDelay(terms, np.mod(epochs[part], 86400).astype(np.float32))
+                result["klobuchar"][part] = delay * np.float32(scale)
+            if self.maps is not None:
+                latIPP, lonIPP = shellPiercePoints(latRad, lonRad, elRad, azRad, self.shellHeight)
+                vertical = self.verticalTec(np.degrees(latIPP), np.degrees(lonIPP), epochs[part])
+                result["gim"][part] = vertical * mapping * (L1_METRES_PER_TECU * scale)
+        return result
+
+    def verticalTec(self, latIPP, lonIPP, epochs):
+        # bilinear in space, linear in time between the two maps around each epoch, NaN outside the maps
+        if len(self.epochs) == 1:
+            return self.sampleMap(np.zeros(len(epochs), dtype=np.int64), latIPP, lonIPP)
+        position = np.interp(epochs, self.epochs, np.arange(len(self.epochs)))
+        first = np.minimum(position.astype(np.int64), len(self.epochs) - 2)
+        fraction = (position - first).astype(np.float32)
+        if self.rotate:
+            # the ionosphere roughly follows the sun, so each map is read at the longitude it had then
+            before = self.sampleMap(first, latIPP, lonIPP + (epochs - self.epochs[first]) / 240)
+            after = self.sampleMap(first + 1, latIPP, lonIPP + (epochs - self.epochs[first + 1]) / 240)
+        else:
+            weights = self.sampler.points(latIPP, lonIPP)
+            before = self.gather(first, weights)
+            after = self.gather(first + 1, weights)
+        vertical = (1 - fraction) * before + fraction * after
+        vertical[(epochs < self.epochs[0]) | (epochs > self.epochs[-1])] = np.nan
+        return vertical
+
+    def sampleMap(self, mapIndex, lats, lons):
+        return self.gather(mapIndex, self.sampler.points(lats, lons))
+
+    def gather(self, mapIndex, weights):
+        return np.einsum("pk,pk->p", self.maps[mapIndex[:, None], weights.indices], weights.weights)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Slant ionospheric delays for lines of sight stored in a .npz file")
+    parser.add_argument("npz", help="arrays lat, lon, azimuth, elevation (degrees) and epochs (unix seconds)")
+    parser.add_argument("--ionex", help="IONEX file for the GIM delays")
+    parser.add_argument("--alpha", type=float, nargs=4, help="Klobuchar alpha coefficients")
+    parser.add_argument("--beta", type=float, nargs=4, help="Klobuchar beta coefficients")
+    parser.add_argument("--frequency", type=float, default=L1_FREQUENCY, help="carrier frequency in Hz")
+    parser.add_argument("--out", help="output .npz, defaults to <npz>_delays.npz")
+    args = parser.parse_args(argv)
+    if args.ionex is None and args.alpha is None:
+        parser.error("give --ionex, --alpha/--beta or both")
+    if (args.alpha is None) != (args.beta is None):
+        parser.error("--alpha and --beta go together")
+
+    if args.ionex is not None:
+        engine = SlantDelay.fromIonex(readIonex(args.ionex), args.alpha, args.beta)
+    else:
+        engine = SlantDelay(args.alpha, args.beta)
+    with np.load(args.npz) as arrays:
+        missing = [name for name in ("lat", "lon", "azimuth", "elevation", "epochs") if name not in arrays]
+        if missing:
+            print(f"{args.npz} has no {', '.join(missing)}", file=sys.stderr)
+            return 1
+        delays = engine.compute(
+            arrays["lat"], arrays["lon"], arrays["azimuth"], arrays["elevation"], arrays["epochs"], args.frequency
+        )
+    outPath = args.out or args.npz[: -len(".npz")] + "_delays.npz"
+    np.savez(outPath, **delays)
+    print(outPath)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
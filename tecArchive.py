@@ -0,0 +1,221 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from atomicFile import writeJson
+from frames import LazyFrames
+
+DAY_SECONDS = 86400
+
+
+class TecArchive:
+    def __init__(self, archiveDir, product):
+        self.archiveDir = archiveDir
+        self.product = product
+        self.lock = threading.Lock()
+        self.mapsPath = os.path.join(archiveDir, f"{product}.tec")
+        self.epochsPath = os.path.join(archiveDir, f"{product}.epochs")
+        self.metaPath = os.path.join(archiveDir, f"{product}.json")
+
+        os.makedirs(self.archiveDir, exist_ok=True)
+        self.meta = self.loadMeta()
+        self.truncateToCount()
+        self.mapsView, self.epochsView, self.order = None, None, None
+
+    def loadMeta(self):
+        try:
+            with open(self.metaPath, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"count": 0, "lats": None, "lons": None}
+
+    def saveMeta(self):
+        writeJson(self.metaPath, self.meta)
+
+    def truncateToCount(self):
+        # the count in the metadata is the commit point, anything past it is a half-written append
+        count = self.meta["count"]
+        for path, rowBytes in [(self.mapsPath, self.mapBytes()), (self.epochsPath, 8)]:
+            if os.path.exists(path) and os.path.getsize(path) > count * rowBytes:
+                with open(path, "r+b") as f:
+                    f.truncate(count * rowBytes)
+
+    def mapBytes(self):
+        if self.meta["lats"] is None:
+            return 0
+        return len(self.meta["lats"]) * len(self.meta["lons"]) * 4
+
+    @property
+    def lats(self):
+        return np.array(self.meta["lats"], dtype=np.float32)
+
+    @property
+    def lons(self):
+        return np.array(self.meta["lons"], dtype=np.float32)
+
+    def __len__(self):
+        return self.meta["count"]
+
+    def append(self, ionexData):
+        epochs = ionexData.toArrays()["epochs"]
+        return self.appendMaps(epochs, ionexData.tecu(), ionexData.lats, ionexData.lons)
+
+    def appendMaps(self, epochs, maps, lats, lons):
+        epochs = np.asarray(epochs, dtype=np.float64)
+        maps = np.asarray(maps, dtype=np.float32)
+        with self.lock:
+            if self.meta["lats"] is None:
+                self.meta["lats"] = [float(v) for v in lats]
+                self.meta["lons"] = [float(v) for v in lons]
+            elif len(lats) != len(self.meta["lats"]) or len(lons) != len(self.meta["lons"]):
+                raise ValueError(f"{self.product} archive grid is {self.shape()[1:]}, got {(len(lats), len(lons))}")
+
+            known = self.loadEpochs()
+            keep = ~np.isnan(epochs)
+            keep[keep] = ~np.isin(epochs[keep].astype(np.int64), known)
+            if not keep.any():
+                return 0
+            newEpochs, newMaps = epochs[keep].astype(np.int64), maps[keep]
+            _, first = np.unique(newEpochs, return_index=True)
+            newEpochs, newMaps = newEpochs[first], newMaps[first]
+
+            with open(self.mapsPath, "ab") as f:
+                f.write(np.ascontiguousarray(newMaps).tobytes())
+            with open(self.epochsPath, "ab") as f:
+                f.write(newEpochs.tobytes())
+            self.meta["count"] += len(newEpochs)
+            self.saveMeta()
+            self.mapsView, self.epochsView, self.order = None, None, None
+            return len(newEpochs)
+
+    def shape(self):
+        return (len(self), len(self.meta["lats"] or ()), len(self.meta["lons"] or ()))
+
+    def loadEpochs(self):
+        if self.epochsView is None:
+            count = len(self)
+            if count:
+                self.epochsView = np.memmap(self.epochsPath, dtype=np.int64, mode="r", shape=(count,))
+            else:
+                self.epochsView = np.empty(0, dtype=np.int64)
+        return self.epochsView
+
+    def maps(self):
+        if self.mapsView is None and len(self):
+            self.mapsView = np.memmap(self.mapsPath, dtype=np.float32, mode="r", shape=self.shape())
+        return self.mapsView
+
+    def sortedRows(self):
+        # rows are in append order, days may arrive in any order
+        if self.order is None:
+            self.order = np.argsort(self.loadEpochs(), kind="stable")
+        return self.order
+
+    def epochs(self):
+        with self.lock:
+            return np.asarray(self.loadEpochs())[self.sortedRows()]
+
+    def rowsBetween(self, start, end):
+        order = self.sortedRows()
+        sortedEpochs = np.asarray(self.loadEpochs())[order]
+        first = np.searchsorted(sortedEpochs, start, side="left")
+        last = np.searchsorted(sortedEpochs, end, side="right")
+        return order[first:last], sortedEpochs[first:last]
+
+    def covers(self, start, end):
+        # a day file brings both midnights and everything between, the midday map tells it from its neighbours
+        return bool(np.isin([start, (start + end) // 2, end], self.epochs()).all())
+
+    def coveredDays(self, dayStarts):
+        # covers() for many days against a single read of the epochs
+        dayStarts = np.asarray(dayStarts, dtype=np.int64)
+        probes = dayStarts[:, None] + np.array([0, 43200, 86400])
+        return np.isin(probes, self.epochs()).all(axis=1)
+
+    def slice(self, start, end):
+        with self.lock:
+            rows, epochs = self.rowsBetween(start, end)
+            if not len(rows):
+                return epochs, np.empty((0,) + self.shape()[1:], dtype=np.float32)
+            return epochs, np.asarray(self.maps()[rows])
+
+    def gridIndex(self, lat, lon):
+        return int(np.abs(self.lats - lat).argmin()), int(np.abs(self.lons - lon).argmin())
+
+    def pointSeries(self, lat, lon, start=-np.inf, end=np.inf):
+        i, j = self.gridIndex(lat, lon)
+        with self.lock:
+            rows, epochs = self.rowsBetween(start, end)
+            if not len(rows):
+                return epochs, np.empty(0, dtype=np.float32)
+            return epochs, np.asarray(self.maps()[rows, i, j])
+
+    def statistics(self, start, end, percentiles=(10, 50, 90), rowChunk=8):
+        with self.lock:
+            rows = np.sort(self.rowsBetween(start, end)[0])
+            nLat, nLon = self.shape()[1:]
+            stats = {"count": len(rows), "mean": np.full((nLat, nLon), np.nan, dtype=np.float32)}
+            for p in percentiles:
+                stats[f"p{p}"] = np.full((nLat, nLon), np.nan, dtype=np.float32)
+            if not len(rows):
+                return stats
+
+            maps = self.maps()
+            # a band of latitude rows at a time keeps memory bounded however long the window is
+            for band in range(0, nLat, rowChunk):
+                block = np.asarray(maps[rows, band : band + rowChunk, :])
+                # nanpercentile is far slower than percentile, only pay for it when a map has gaps
+                if np.isnan(block).any():
+                    mean, values = np.nanmean(block, axis=0), np.nanpercentile(block, percentiles, axis=0)
+                else:
+                    mean, values = block.mean(axis=0), np.percentile(block, percentiles, axis=0)
+                stats["mean"][band : band + rowChunk] = mean
+                for p, value in zip(percentiles, values):
+                    stats[f"p{p}"][band : band + rowChunk] = value
+        stats["median"] = stats.get("p50")
+        return stats
+
+    def rollingStatistics(self, lat, lon, windowSeconds, start=-np.inf, end=np.inf, percentiles=(10, 50, 90)):
+        epochs, values = self.pointSeries(lat, lon, start, end)
+        stats = {"epochs": epochs, "mean": np.full(len(values), np.nan, dtype=np.float32)}
+        for p in percentiles:
+            stats[f"p{p}"] = np.full(len(values), np.nan, dtype=np.float32)
+        first = np.searchsorted(epochs, epochs - windowSeconds, side="right")
+        for index, begin in enumerate(first):
+            window = values[begin : index + 1]
+            if np.isnan(window).all():
+                continue
+            stats["mean"][index] = np.nanmean(window)
+            for p, value in zip(percentiles, np.nanpercentile(window, percentiles)):
+                stats[f"p{p}"][index] = value
+        stats["median"] = stats.get("p50")
+        return stats
+
+    def frames(self, start, days=1, stepMinutes=15, cacheSize=16):
+        return ArchiveFrames(self, start, days, stepMinutes, cacheSize)
+
+
+class ArchiveFrames(LazyFrames):
+    def __init__(self, archive, start, days=1, stepMinutes=15, cacheSize=16):
+        self.archive = archive
+        self.start = int(start)
+        self.stepMinutes = stepMinutes
+        self.epochs, self.maps = archive.slice(self.start - DAY_SECONDS, self.start + (days + 1) * DAY_SECONDS)
+        if not len(self.epochs):
+            raise ValueError(f"no {archive.product} maps archived for the requested days")
+        super().__init__(days * 24 * 60 // stepMinutes, cacheSize)
+
+    def computeFrame(self, index):
+        seconds = self.start + index * self.stepMinutes * 60
+        j = int(np.searchsorted(self.epochs, seconds, side="right"))
+        if j == 0:
+            return self.maps[0]
+        if j == len(self.epochs) or self.epochs[j - 1] == seconds:
+            return self.maps[j - 1]
+        alpha = np.float32((seconds - self.epochs[j - 1]) / (self.epochs[j] - self.epochs[j - 1]))
+        return (1 - alpha) * self.maps[j - 1] + alpha * self.maps[j]
+
+    def frameMinutes(self, index):
+        return int(index) * self.stepMinutes
@@ -0,0 +1,203 @@
+import argparse
+import io
+import os
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageTk, UnidentifiedImageError
+from tkintermapview import TkinterMapView
+
+from network import NetworkError, sharedClient
+
+GOOGLE_TILES = "https://mt0.google.com/vt/lyrs=m&hl=en&x={x}&y={y}&z={z}&s=Ga"
+TILE_HEADERS = {"User-Agent": "TkinterMapView"}
+PREFETCH_ZOOM = 6
+INSERT_BATCH = 256
+
+# same tables as tkintermapview's OfflineLoader, so a prefetched file also works as its database_path
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS server (
+        url VARCHAR(300) PRIMARY KEY NOT NULL,
+        max_zoom INTEGER NOT NULL);""",
+    """CREATE TABLE IF NOT EXISTS tiles (
+        zoom INTEGER NOT NULL,
+        x INTEGER NOT NULL,
+        y INTEGER NOT NULL,
+        server VARCHAR(300) NOT NULL,
+        tile_image BLOB NOT NULL,
+        CONSTRAINT fk_server FOREIGN KEY (server) REFERENCES server (url),
+        CONSTRAINT pk_tiles PRIMARY KEY (zoom, x, y, server));""",
+    """CREATE TABLE IF NOT EXISTS sections (
+        position_a VARCHAR(100) NOT NULL,
+        position_b VARCHAR(100) NOT NULL,
+        zoom_a INTEGER NOT NULL,
+        zoom_b INTEGER NOT NULL,
+        server VARCHAR(300) NOT NULL,
+        CONSTRAINT fk_server FOREIGN KEY (server) REFERENCES server (url),
+        CONSTRAINT pk_tiles PRIMARY KEY (position_a, position_b, zoom_a, zoom_b, server));""",
+]
+
+
+class TileStore:
+    def __init__(self, dbPath, tileServer=GOOGLE_TILES, maxTiles=1024, maxZoom=19, client=None, timeout=5):
+        self.dbPath = dbPath
+        self.tileServer = tileServer
+        self.maxTiles = maxTiles
+        self.client = client
+        self.timeout = timeout
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.hits = {"memory": 0, "disk": 0, "network": 0}
+        db = self.connection()
+        for statement in SCHEMA:
+            db.execute(statement)
+        db.execute("INSERT OR IGNORE INTO server (url, max_zoom) VALUES (?, ?)", (tileServer, maxZoom))
+        db.commit()
+
+    def connection(self):
+        # tkintermapview loads tiles on several threads, each gets its own connection
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.dbPath, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            self.local.db = db
+        return db
+
+    def tileUrl(self, zoom, x, y):
+        return self.tileServer.replace("{x}", str(x)).replace("{y}", str(y)).replace("{z}", str(zoom))
+
+    def remember(self, key, data, source):
+        with self.lock:
+            self.hits[source] += 1
+            self.memory[key] = data
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.maxTiles:
+                self.memory.popitem(last=False)
+
+    def stored(self, zoom, x, y):
+        row = (
+            self.connection()
+            .execute(
+                "SELECT tile_image FROM tiles WHERE zoom=? AND x=? AND y=? AND server=?", (zoom, x, y, self.tileServer)
+            )
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def download(self, zoom, x, y):
+        try:
+            with (self.client or sharedClient()).get(
+                self.tileUrl(zoom, x, y), headers=TILE_HEADERS, timeout=self.timeout
+            ) as response:
+                return response.content if response.status_code == 200 else None
+        except NetworkError:
+            return None
+
+    def save(self, tiles):
+        db = self.connection()
+        db.executemany(
+            "INSERT OR REPLACE INTO tiles (zoom, x, y, server, tile_image) VALUES (?, ?, ?, ?, ?)",
+            [(zoom, x, y, self.tileServer, data) for (zoom, x, y), data in tiles],
+        )
+        db.commit()
+
+    def get(self, zoom, x, y):
+        # memory, then disk, then the tile server, None when offline and never stored
+        key = (zoom, x, y)
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return data
+        data, source = self.stored(zoom, x, y), "disk"
+        if data is None:
+            data, source = self.download(zoom, x, y), "network"
+            if data is None:
+                return None
+            self.save([(key, data)])
+        self.remember(key, data, source)
+        return data
+
+    def missing(self, minZoom, maxZoom):
+        stored = set(
+            self.connection().execute(
+                "SELECT zoom, x, y FROM tiles WHERE server=? AND zoom BETWEEN ? AND ?",
+                (self.tileServer, minZoom, maxZoom),
+            )
+        )
+        return [
+            (zoom, x, y)
+            for zoom in range(minZoom, maxZoom + 1)
+            for x in range(2**zoom)
+            for y in range(2**zoom)
+            if (zoom, x, y) not in stored
+        ]
+
+    def prefetch(self, minZoom=0, maxZoom=PREFETCH_ZOOM, workers=8, progress=None):
+        # downloads every tile not stored yet, (saved, failed)
+        keys = self.missing(minZoom, maxZoom)
+        saved, failed, batch = 0, 0, []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for done, (key, data) in enumerate(zip(keys, executor.map(lambda key: self.download(*key), keys)), 1):
+                if data is None:
+                    failed += 1
+                else:
+                    batch.append((key, data))
+                if len(batch) >= INSERT_BATCH:
+                    self.save(batch)
+                    saved, batch = saved + len(batch), []
+                if progress is not None:
+                    progress(done, len(keys))
+        if batch:
+            self.save(batch)
+            saved += len(batch)
+        return saved, failed
+
+
+class CachedMapView(TkinterMapView):
+    def __init__(self, *args, tileStore, **kwargs):
+        self.tileStore = tileStore
+        super().__init__(*args, **kwargs)
+        self.set_tile_server(tileStore.tileServer)
+
+    def request_image(self, zoom, x, y, db_cursor=None):
+        data = self.tileStore.get(zoom, x, y)
+        if data is None or not self.running:
+            return self.empty_tile_image
+        try:
+            image = Image.open(io.BytesIO(data))
+        except UnidentifiedImageError:
+            image = None
+        imageTk = self.empty_tile_image if image is None else ImageTk.PhotoImage(image)
+        self.tile_image_cache[f"{zoom}{x}{y}"] = imageTk
+        return imageTk
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Download map tiles for the location picker into the tile cache")
+    parser.add_argument("--db", default=os.path.join("downloads", "tiles.db"))
+    parser.add_argument("--server", default=GOOGLE_TILES, help="tile URL with {x}, {y} and {z}")
+    parser.add_argument("--min-zoom", type=int, default=0)
+    parser.add_argument("--max-zoom", type=int, default=PREFETCH_ZOOM)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.db)), exist_ok=True)
+    store = TileStore(args.db, args.server)
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            print(f"\r{done}/{total} tiles", end="", flush=True)
+
+    saved, failed = store.prefetch(args.min_zoom, args.max_zoom, args.workers, progress)
+    print(f"\n{saved} tiles saved to {args.db}, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())